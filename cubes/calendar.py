@@ -99,7 +99,9 @@ def add_time_units(time, unit, amount):
     """Subtract `amount` number of `unit`s from datetime object `time`."""
 
     args = {}
-    if unit == 'hour':
+    if unit == 'minute':
+        args['minutes'] = amount
+    elif unit == 'hour':
         args['hours'] = amount
     elif unit == 'day':
         args['days'] = amount
@@ -7,6 +7,7 @@ from __future__ import absolute_import
 
 import re
 import os.path
+import hashlib
 import json
 
 from collections import OrderedDict
@@ -26,6 +27,8 @@ __all__ = [
     "assert_all_instances",
     "read_json_file",
     "sorted_dependencies",
+    "canonical_json",
+    "fingerprint",
 ]
 
 class IgnoringDictionary(OrderedDict):
@@ -316,3 +319,37 @@ def sorted_dependencies(graph):
                             % ", ".join(nonempty))
     return L
 
+
+def _canonical_default(obj):
+    """Converts objects which are not JSON serializable for
+    `canonical_json()`: objects with `canonical()` or `to_dict()` method to
+    their results, sets to sorted lists and other objects to strings."""
+
+    if hasattr(obj, "canonical"):
+        return obj.canonical()
+    elif hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    elif isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=canonical_json)
+    elif isinstance(obj, compat.binary_type):
+        return compat.to_unicode(obj)
+    else:
+        return compat.text_type(obj)
+
+
+def canonical_json(obj):
+    """Returns canonical JSON string of `obj` – dictionary keys are sorted
+    and there are no optional spaces, so equal objects give equal strings.
+    Objects such as cells are converted by their `canonical()` method."""
+
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"),
+                      default=_canonical_default)
+
+
+def fingerprint(obj):
+    """Returns stable fingerprint of `obj` – SHA1 hexadecimal digest of its
+    canonical JSON representation. The fingerprint does not change between
+    processes."""
+
+    string = canonical_json(obj)
+    return hashlib.sha1(string.encode("utf-8")).hexdigest()
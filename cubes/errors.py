@@ -112,6 +112,24 @@ class HierarchyError(UserError):
     hierarchy"""
     error_type = "hierarchy"
 
+class QueryLimitError(UserError):
+    """Superclass for errors raised when a query exceeds limits of the
+    browser, such as statement timeout or maximal number of rows."""
+    error_type = "query_limit"
+
+class QueryTimeoutError(QueryLimitError):
+    """Raised when a query takes longer than the statement timeout."""
+    error_type = "query_timeout"
+
+class QueryCancelledError(QueryLimitError):
+    """Raised when a query was cancelled, for example because the client
+    has disconnected."""
+    error_type = "query_cancelled"
+
+class TooManyRowsError(QueryLimitError):
+    """Raised when a query returns more rows than allowed."""
+    error_type = "too_many_rows"
+
 
 # Helper exceptions
 # =================
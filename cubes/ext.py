@@ -29,6 +29,7 @@ EXTENSION_TYPES = {
     "authorizer": "Authorizer",
     "authenticator": "Authenticator",
     "request_log_handler": "Request log handler",
+    "cache": "Result cache",
 }
 
 # Information about built-in extensions. Supposedly faster loading (?).
@@ -42,6 +43,11 @@ _BUILTIN_EXTENSIONS = {
     "authorizers": {
         "simple": "cubes.auth:SimpleAuthorizer",
     },
+    "caches": {
+        "memory": "cubes.server.caching:MemoryCache",
+        "sqlite": "cubes.server.caching:SQLiteCache",
+        "mongo": "cubes.server.caching:MongoCache",
+    },
     "browsers": {
         "sql":"cubes.sql.browser:SQLBrowser",
         "slicer":"cubes.server.browser:SlicerBrowser",
@@ -266,6 +272,7 @@ def _load_module(modulepath):
 authenticator = ExtensionFinder("authenticators")
 authorizer = ExtensionFinder("authorizers")
 browser = ExtensionFinder("browsers")
+cache = ExtensionFinder("caches")
 formatter = ExtensionFinder("formatters")
 model_provider = ExtensionFinder("providers")
 request_log_handler = ExtensionFinder("request_log_handlers")
@@ -8,7 +8,7 @@ import codecs
 import decimal
 import datetime
 
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 
 try:
     import jinja2
@@ -20,7 +20,7 @@ from .errors import ArgumentError
 from . import compat
 from . import ext
 
-from .query import SPLIT_DIMENSION_NAME
+from .query import SPLIT_DIMENSION_NAME, ResultRow
 
 
 __all__ = [
@@ -28,10 +28,15 @@ __all__ = [
     "CrossTableFormatter",
     "HTMLCrossTableFormatter",
     "SlicerJSONEncoder",
+    "JSONStreamEncoder",
     "csv_generator",
     "JSONLinesGenerator",
 ]
 
+# Number of records encoded into one chunk of streamed JSON
+DEFAULT_JSON_CHUNK_SIZE = 100
+
+
 def create_formatter(type_, *args, **kwargs):
     """Creates a formatter of type `type`. Passes rest of the arguments to the
     formatters initialization method."""
@@ -45,6 +50,17 @@ def _jinja_env():
     return env
 
 
+def _record_values(record, fields):
+    """Returns values of `fields` from `record` – a dictionary or a
+    :class:`ResultRow`, which extracts the values without looking up the
+    labels one by one."""
+
+    if isinstance(record, ResultRow):
+        return record.pick(fields)
+    else:
+        return [record.get(field) for field in fields]
+
+
 def csv_generator_p2(records, fields, include_header=True, header=None,
                      dialect=csv.excel):
 
@@ -69,8 +85,7 @@ def csv_generator_p2(records, fields, include_header=True, header=None,
 
     for record in records:
         row = []
-        for field in fields:
-            value = record.get(field)
+        for value in _record_values(record, fields):
             if isinstance(value, compat.string_type):
                 row.append(value.encode("utf-8"))
             elif value is not None:
@@ -98,9 +113,7 @@ def csv_generator_p3(records, fields, include_header=True, header=None,
         yield _row_string(header or fields)
 
     for record in records:
-        row = [record.get(field) for field in fields]
-
-        yield _row_string(row)
+        yield _row_string(_record_values(record, fields))
 
 
 if compat.py3k:
@@ -116,7 +129,7 @@ class JSONLinesGenerator(object):
         self.iterable = iterable
         self.separator = separator
 
-        self.encoder = SlicerJSONEncoder(indent=None)
+        self.encoder = _RecordEncoder(SlicerJSONEncoder(indent=None))
 
     def __iter__(self):
         for obj in self.iterable:
@@ -166,6 +179,202 @@ class SlicerJSONEncoder(json.JSONEncoder):
                 return json.JSONEncoder.default(self, o)
 
 
+def _decimal_to_float(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+
+def _date_to_isoformat(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def _value_converter(value):
+    """Returns function converting values of the type of `value` to JSON
+    values, or ``None`` if no conversion is needed."""
+
+    if isinstance(value, decimal.Decimal):
+        return _decimal_to_float
+    elif isinstance(value, (datetime.date, datetime.time)):
+        return _date_to_isoformat
+    else:
+        return None
+
+
+class _RecordConverters(object):
+    """Converters of values of records with the same labels. Converter of a
+    column is chosen by the type of its first value which is not ``None``.
+    """
+
+    def __init__(self, labels):
+        self.converters = []
+        self.unknown = set(range(len(labels)))
+
+    def update(self, values):
+        for i in list(self.unknown):
+            value = values[i]
+            if value is not None:
+                self.unknown.discard(i)
+                converter = _value_converter(value)
+                if converter is not None:
+                    self.converters.append((i, converter))
+
+
+class _RecordEncoder(object):
+    """Encodes records – :class:`ResultRow` objects or dictionaries – to
+    JSON. Decimal and date values are converted by converters prepared for
+    each set of record labels, therefore the records are encoded by the
+    fast path of the JSON encoder. Other objects are encoded by the
+    `encoder`."""
+
+    # Maximal number of distinct sets of labels with prepared converters
+    max_layouts = 64
+
+    def __init__(self, encoder):
+        self.encoder = encoder
+        self._converters = {}
+
+    def encode(self, record):
+        if isinstance(record, ResultRow):
+            (labels, values) = record.labels_values()
+        elif isinstance(record, dict):
+            labels = tuple(record.keys())
+            values = tuple(record.values())
+        else:
+            return self.encoder.encode(record)
+
+        try:
+            converters = self._converters[labels]
+        except KeyError:
+            if len(self._converters) >= self.max_layouts:
+                self._converters.clear()
+            converters = _RecordConverters(labels)
+            self._converters[labels] = converters
+
+        if converters.unknown:
+            converters.update(values)
+
+        if converters.converters:
+            values = list(values)
+            for (i, converter) in converters.converters:
+                values[i] = converter(values[i])
+
+        return self.encoder.encode(dict(zip(labels, values)))
+
+
+def _is_stream(value):
+    """Returns ``True`` if `value` is encoded as a streamed array of
+    records: an iterator or a list of records."""
+
+    if isinstance(value, (list, tuple)):
+        return bool(value) and isinstance(value[0], (ResultRow, dict))
+
+    return hasattr(value, "__iter__") \
+            and not isinstance(value, (compat.string_type, bytes, dict)) \
+            and not hasattr(value, "to_dict")
+
+
+class JSONStreamEncoder(object):
+    """Encodes objects to JSON text in chunks. Lists and iterators of
+    records, such as cells of an aggregation result or facts, are not
+    materialized: records are encoded one by one and yielded in chunks of
+    `chunk_size` records. Top-level objects with lists or iterators, such
+    as an aggregation result, are yielded first without them and the
+    records follow.
+
+    At most `record_limit` records are encoded from an iterator, lists are
+    not limited. With `indent` the objects are encoded by
+    :class:`SlicerJSONEncoder`, which reads the iterators first."""
+
+    def __init__(self, indent=None, chunk_size=None, record_limit=None):
+        self.indent = indent
+        self.chunk_size = chunk_size or DEFAULT_JSON_CHUNK_SIZE
+        self.record_limit = record_limit
+
+        self.encoder = SlicerJSONEncoder(indent=indent)
+        if record_limit is not None:
+            self.encoder.iterator_limit = record_limit
+
+        self.records = _RecordEncoder(self.encoder)
+
+    def iterencode(self, obj):
+        """Returns generator of JSON text chunks of `obj`."""
+
+        if self.indent is not None:
+            return self.encoder.iterencode(obj)
+
+        if hasattr(obj, "to_dict") and callable(obj.to_dict):
+            obj = obj.to_dict()
+
+        if isinstance(obj, dict):
+            return self._iterencode_object(obj)
+        elif _is_stream(obj):
+            return self._iterencode_array(obj)
+        else:
+            return self.encoder.iterencode(obj)
+
+    def _iterencode_object(self, obj):
+        envelope = OrderedDict()
+        streams = []
+
+        for key, value in obj.items():
+            if _is_stream(value):
+                streams.append((key, value))
+            else:
+                envelope[key] = value
+
+        head = self.encoder.encode(envelope)
+
+        if not streams:
+            yield head
+            return
+
+        # Remove closing brace of the envelope
+        head = head[:-1]
+        separator = ", " if envelope else ""
+
+        for key, value in streams:
+            key = self.encoder.encode(compat.text_type(key))
+            yield u"{}{}{}: ".format(head, separator, key)
+
+            for chunk in self._iterencode_array(value):
+                yield chunk
+
+            head = ""
+            separator = ", "
+
+        yield "}"
+
+    def _iterencode_array(self, iterable):
+        if isinstance(iterable, (list, tuple)):
+            limit = None
+        else:
+            limit = self.record_limit
+
+        chunk = []
+        separator = "["
+
+        for i, record in enumerate(iterable):
+            if limit is not None and i >= limit:
+                break
+
+            chunk.append(self.records.encode(record))
+
+            if len(chunk) >= self.chunk_size:
+                yield separator + ", ".join(chunk)
+                separator = ", "
+                chunk = []
+
+        if chunk:
+            yield separator + ", ".join(chunk) + "]"
+        elif separator == "[":
+            yield "[]"
+        else:
+            yield "]"
+
+
 class Formatter(object):
     """Empty class for the time being. Currently used only for finding all
     built-in subclasses"""
@@ -1,4 +1,7 @@
 from .browser import *
+from .cardinality import *
 from .cells import *
 from .computation import *
+from .limits import *
+from .sketches import *
 from .statutils import *
@@ -2,16 +2,18 @@
 
 from __future__ import absolute_import
 
-from collections import namedtuple
+from collections import namedtuple, MutableMapping
+from operator import itemgetter
 
 from ..calendar import CalendarMemberConverter
 from ..logging import get_logger
-from ..common import IgnoringDictionary
+from ..common import IgnoringDictionary, fingerprint
 from ..errors import ArgumentError, NoSuchAttributeError, HierarchyError
 from ..metadata import string_to_dimension_level
 
 from .statutils import calculators_for_aggregates, available_calculators
 from .cells import Cell, PointCut, RangeCut, SetCut, cuts_from_string
+from .limits import QueryLimits
 
 from .. import compat
 
@@ -21,6 +23,8 @@ __all__ = [
     "AggregationResult",
     "CalculatedResultIterator",
     "Facts",
+    "ResultRow",
+    "RowLayout",
 
     "Drilldown",
     "DrilldownItem",
@@ -60,6 +64,14 @@ class AggregationBrowser(object):
         self.store = store
         self.calendar = None
 
+        # Maximal estimated number of drill-down cells, see
+        # `assert_low_cardinality()`
+        self.row_budget = None
+
+        # Statement timeout, maximal number of rows and cancellation of the
+        # queries, enforced by the backends that support them
+        self.limits = QueryLimits()
+
     def features(self):
         """Returns a dictionary of available features for the browsed cube.
         Default implementation returns an empty dictionary.
@@ -126,21 +138,7 @@ class AggregationBrowser(object):
         aggregates = self.prepare_aggregates(aggregates)
         order = self.prepare_order(order, is_aggregate=True)
 
-        converters = {
-            "time": CalendarMemberConverter(self.calendar)
-        }
-
-        if cell is None:
-            cell = Cell(self.cube)
-        elif isinstance(cell, compat.string_type):
-            cuts = cuts_from_string(self.cube, cell,
-                                    role_member_converters=converters)
-            cell = Cell(self.cube, cuts)
-
-        if isinstance(split, compat.string_type):
-            cuts = cuts_from_string(self.cube, split,
-                                    role_member_converters=converters)
-            split = Cell(self.cube, cuts)
+        (cell, split) = self._prepare_cells(cell, split)
 
         drilldon = Drilldown(drilldown, cell)
 
@@ -162,16 +160,80 @@ class AggregationBrowser(object):
 
         result.calculators = calculators_for_aggregates(self.cube,
                                                         calculated_aggs,
-                                                        drilldown,
+                                                        drilldon,
                                                         split)
 
-        # Do calculated measures on summary if no drilldown or split
+        # Cells were set before the calculators were known
+        if result.calculators and result.cells is not None:
+            result.cells = result._source_cells
+
+        # Do calculated measures on summary if no drilldown or split. The
+        # summary has its own calculators, so its values do not get into the
+        # windows of the cells.
         if result.summary:
-            for calc in result.calculators:
+            calculators = calculators_for_aggregates(self.cube,
+                                                     calculated_aggs,
+                                                     drilldon,
+                                                     split)
+            for calc in calculators:
                 calc(result.summary)
 
         return result
 
+    def _prepare_cells(self, cell, split=None):
+        """Returns a tuple (`cell`, `split`) of cells from cells or strings
+        with cuts. Returns an empty cell if `cell` is ``None``."""
+
+        converters = {
+            "time": CalendarMemberConverter(self.calendar)
+        }
+
+        if cell is None:
+            cell = Cell(self.cube)
+        elif isinstance(cell, compat.string_type):
+            cuts = cuts_from_string(self.cube, cell,
+                                    role_member_converters=converters)
+            cell = Cell(self.cube, cuts)
+
+        if isinstance(split, compat.string_type):
+            cuts = cuts_from_string(self.cube, split,
+                                    role_member_converters=converters)
+            split = Cell(self.cube, cuts)
+
+        return (cell, split)
+
+    def aggregate_fingerprint(self, cell=None, aggregates=None,
+                              drilldown=None, split=None, order=None,
+                              page=None, page_size=None, **options):
+        """Returns stable fingerprint of the aggregation request with the
+        same arguments as :meth:`aggregate`. The arguments are prepared the
+        same way as for the aggregation, therefore equivalent requests have
+        equal fingerprints – regardless of the order of the cuts, the order
+        of set cut members or implicit drill-down levels. The fingerprint
+        is suitable for cache keys and for identifying the requests."""
+
+        aggregates = self.prepare_aggregates(aggregates)
+        order = self.prepare_order(order, is_aggregate=True)
+
+        (cell, split) = self._prepare_cells(cell, split)
+
+        drilldown = Drilldown(drilldown, cell)
+
+        request = {
+            "cube": str(self.cube.name),
+            "cell": cell,
+            "split": split,
+            "aggregates": [agg.ref for agg in aggregates],
+            "drilldown": drilldown,
+            "order": [(attr.ref, direction.lower() if direction else None)
+                      for attr, direction in order],
+            "page": page,
+            "page_size": page_size,
+            "options": options
+        }
+
+        return fingerprint(request)
+
     def provide_aggregate(self, cell=None, measures=None, aggregates=None,
                           drilldown=None, split=None, order=None, page=None,
                           page_size=None, **options):
@@ -293,10 +355,73 @@ class AggregationBrowser(object):
 
         return new_order
 
-    def assert_low_cardinality(self, cell, drilldown):
-        """Raises `ArgumentError` when there is drilldown through high
-        cardinality dimension or level and there is no condition in the cell
-        for the level."""
+    def restrict_limits(self, timeout=None, max_rows=None,
+                        cancellation=None):
+        """Restricts limits of the following queries, for example for one
+        request. `timeout` and `max_rows` can only lower the limits the
+        browser was configured with. `cancellation` is an object with
+        `is_set()` method, such as :class:`threading.Event`, that cancels the
+        running queries when set. See :class:`QueryLimits` for more
+        information."""
+
+        self.limits = self.limits.restricted(timeout=timeout,
+                                             max_rows=max_rows,
+                                             cancellation=cancellation)
+
+    def cardinality_estimator(self):
+        """Returns a :class:`CardinalityEstimator` with statistics of the
+        browsed cube or ``None`` if the statistics are not available.
+        Default implementation returns ``None``, subclasses are advised to
+        override this method."""
+        return None
+
+    def estimate_cell_count(self, cell, drilldown, split=None):
+        """Returns estimated number of cells of aggregation of `cell` by
+        `drilldown` (a `Drilldown` object) and `split`. Returns ``None`` if
+        the number can not be estimated. Can be used for query planning and
+        cost reporting."""
+
+        estimator = self.cardinality_estimator()
+        if estimator is None:
+            return None
+
+        return estimator.estimate_cells(cell, drilldown, split)
+
+    def exceeds_row_budget(self, cell, drilldown, split=None):
+        """Returns ``True`` if the estimated number of drill-down cells is
+        greater than the `row_budget`, ``False`` if it is not. Returns
+        ``None`` if there is no budget or the number of cells can not be
+        estimated."""
+
+        if self.row_budget is None:
+            return None
+
+        estimate = self.estimate_cell_count(cell, drilldown, split)
+        if estimate is None:
+            return None
+
+        return estimate > self.row_budget
+
+    def assert_low_cardinality(self, cell, drilldown, split=None):
+        """Raises `ArgumentError` when the drilldown of the `cell` is
+        estimated to have more cells than the `row_budget`.
+
+        If there is no budget or the number of cells can not be estimated,
+        then the error is raised when there is drilldown through high
+        cardinality dimension or level (as annotated in the model) and there
+        is no condition in the cell for the level."""
+
+        exceeds = self.exceeds_row_budget(cell, drilldown, split)
+
+        if exceeds:
+            estimate = self.estimate_cell_count(cell, drilldown, split)
+            raise ArgumentError("Drilldown by %s is estimated to have %d "
+                                "cells, which is more than the limit of %d. "
+                                "Include both page_size and page arguments "
+                                "or cut the cell further"
+                                % (drilldown, estimate, self.row_budget))
+        elif exceeds is not None:
+            return
 
         hc_levels = drilldown.high_cardinality_levels(cell)
         if hc_levels:
@@ -447,10 +572,12 @@ class AggregationBrowser(object):
             * a dictionary where keys are dimension names and values are
               levels to be rolled up-to
 
-        *Future*
+        *Optimisations*
 
-        In the future there might be optimisations added to this method,
-        therefore it will become faster than subsequent separate requests.
+        Default implementation executes the queries one by one. Backends
+        might override this method to execute the queries more efficiently,
+        for example the SQL backend computes multiple drill-downs of the same
+        cell with one statement and executes the other queries concurrently.
         Also when used with Slicer OLAP service server number of HTTP call
         overhead is reduced.
         """
@@ -465,61 +592,69 @@ class AggregationBrowser(object):
         report_result = {}
 
         for result_name, query in queries.items():
-            query_type = query.get("query")
-            if not query_type:
-                raise ArgumentError("No report query for '%s'" % result_name)
+            report_result[result_name] = self._report_query(cell,
+                                                            result_name,
+                                                            query)
 
-            # FIXME: add: cell = query.get("cell")
+        return report_result
 
-            args = dict(query)
-            del args["query"]
+    def _report_query(self, cell, result_name, query):
+        """Executes a single report `query` named `result_name` and returns
+        its result. See :meth:`report` for more information."""
 
-            # Note: we do not just convert name into function from symbol for possible future
-            # more fine-tuning of queries as strings
+        query_type = query.get("query")
+        if not query_type:
+            raise ArgumentError("No report query for '%s'" % result_name)
 
-            # Handle rollup
-            rollup = query.get("rollup")
-            if rollup:
-                query_cell = cell.rollup(rollup)
-            else:
-                query_cell = cell
+        # FIXME: add: cell = query.get("cell")
 
-            if query_type == "aggregate":
-                result = self.aggregate(query_cell, **args)
+        args = dict(query)
+        del args["query"]
 
-            elif query_type == "facts":
-                result = self.facts(query_cell, **args)
+        # Note: we do not just convert name into function from symbol for possible future
+        # more fine-tuning of queries as strings
 
-            elif query_type == "fact":
-                # Be more tolerant: by default we want "key", but "id" might be common
-                key = args.get("key")
-                if not key:
-                    key = args.get("id")
-                result = self.fact(key)
+        # Handle rollup
+        rollup = query.get("rollup")
+        if rollup:
+            query_cell = cell.rollup(rollup)
+        else:
+            query_cell = cell
 
-            elif query_type in ("values", "members"):
-                # TODO: `values` are deprecated
-                result = self.members(query_cell, **args)
+        if query_type == "aggregate":
+            result = self.aggregate(query_cell, **args)
 
-            elif query_type == "details":
-                # FIXME: depreciate this raw form
-                result = self.cell_details(query_cell, **args)
+        elif query_type == "facts":
+            result = self.facts(query_cell, **args)
 
-            elif query_type == "cell":
-                details = self.cell_details(query_cell, **args)
-                cell_dict = query_cell.to_dict()
+        elif query_type == "fact":
+            # Be more tolerant: by default we want "key", but "id" might be common
+            key = args.get("key")
+            if not key:
+                key = args.get("id")
+            result = self.fact(key)
 
-                for cut, detail in zip(cell_dict["cuts"], details):
-                    cut["details"] = detail
+        elif query_type in ("values", "members"):
+            # TODO: `values` are deprecated
+            result = self.members(query_cell, **args)
 
-                result = cell_dict
-            else:
-                raise ArgumentError("Unknown report query '%s' for '%s'" %
-                                    (query_type, result_name))
+        elif query_type == "details":
+            # FIXME: depreciate this raw form
+            result = self.cell_details(query_cell, **args)
 
-            report_result[result_name] = result
+        elif query_type == "cell":
+            details = self.cell_details(query_cell, **args)
+            cell_dict = query_cell.to_dict()
 
-        return report_result
+            for cut, detail in zip(cell_dict["cuts"], details):
+                cut["details"] = detail
+
+            result = cell_dict
+        else:
+            raise ArgumentError("Unknown report query '%s' for '%s'" %
+                                (query_type, result_name))
+
+        return result
 
     def cell_details(self, cell=None, dimension=None):
         """Returns details for the `cell`. Returned object is a list with one
@@ -563,19 +698,26 @@ class AggregationBrowser(object):
 
         """
 
+        return self._cut_details(cut, self._path_details)
+
+    def _cut_details(self, cut, path_details):
+        """Returns details for a `cut` using `path_details` – a function with
+        arguments `dimension`, `path` and `hierarchy` that returns details of
+        one path, such as :meth:`_path_details`."""
+
         dimension = self.cube.dimension(cut.dimension)
 
         if isinstance(cut, PointCut):
-            details = self._path_details(dimension, cut.path, cut.hierarchy)
+            details = path_details(dimension, cut.path, cut.hierarchy)
 
         elif isinstance(cut, SetCut):
-            details = [self._path_details(dimension, path, cut.hierarchy) for path in cut.paths]
+            details = [path_details(dimension, path, cut.hierarchy) for path in cut.paths]
 
         elif isinstance(cut, RangeCut):
             details = {
-                "from": self._path_details(dimension, cut.from_path,
-                                           cut.hierarchy),
-                "to": self._path_details(dimension, cut.to_path, cut.hierarchy)
+                "from": path_details(dimension, cut.from_path,
+                                     cut.hierarchy),
+                "to": path_details(dimension, cut.to_path, cut.hierarchy)
             }
 
         else:
@@ -601,6 +743,13 @@ class AggregationBrowser(object):
         hierarchy = dimension.hierarchy(hierarchy)
         details = self.path_details(dimension, path, hierarchy)
 
+        return self._format_path_details(dimension, hierarchy, path, details)
+
+    def _format_path_details(self, dimension, hierarchy, path, details):
+        """Returns list of level details for `path` from the `details`
+        record, as described in :meth:`_path_details`. Returns ``None`` if
+        there are no details."""
+
         if not details:
             return None
 
@@ -652,9 +801,182 @@ class Facts(object):
 TableRow = namedtuple("TableRow", ["key", "label", "path", "is_base", "record"])
 
 
+class RowLayout(object):
+    """Labels of result rows and their positions. One layout is shared by
+    all rows of a result, therefore the rows do not have to carry their own
+    dictionary of labels."""
+
+    def __init__(self, labels):
+        self.labels = tuple(labels)
+        self.index = dict((label, i) for i, label in enumerate(self.labels))
+        self._getters = {}
+
+    def getter(self, fields):
+        """Returns a function that extracts values of `fields` from a row
+        value tuple as a tuple. Returns ``None`` if any of the fields is not
+        in the layout."""
+
+        fields = tuple(fields)
+
+        try:
+            return self._getters[fields]
+        except KeyError:
+            pass
+
+        if all(field in self.index for field in fields):
+            positions = [self.index[field] for field in fields]
+            if len(positions) == 1:
+                getter = _single_getter(positions[0])
+            elif positions:
+                getter = itemgetter(*positions)
+            else:
+                getter = _empty_getter
+        else:
+            getter = None
+
+        self._getters[fields] = getter
+        return getter
+
+    def __getstate__(self):
+        return self.labels
+
+    def __setstate__(self, labels):
+        self.__init__(labels)
+
+
+def _single_getter(position):
+    return lambda values: (values[position], )
+
+
+def _empty_getter(values):
+    return ()
+
+
+_DELETED = object()
+
+
+class ResultRow(MutableMapping):
+    """Record of a result. Behaves as a dictionary of labels and values, but
+    keeps only the tuple of values and a :class:`RowLayout` shared with the
+    other rows of the result. Values set after the row was created, for
+    example by calculated aggregates, are kept in a separate dictionary."""
+
+    __slots__ = ("_layout", "_values", "_extra")
+
+    def __init__(self, layout, values):
+        self._layout = layout
+        self._values = values
+        self._extra = None
+
+    @property
+    def layout(self):
+        return self._layout
+
+    def pick(self, fields):
+        """Returns tuple of values of `fields`. Fields that are not in the
+        record have value ``None``."""
+
+        if self._extra is None:
+            getter = self._layout.getter(fields)
+            if getter is not None:
+                return getter(self._values)
+
+        return tuple(self.get(field) for field in fields)
+
+    def __getitem__(self, key):
+        if self._extra is not None and key in self._extra:
+            value = self._extra[key]
+            if value is _DELETED:
+                raise KeyError(key)
+            return value
+
+        return self._values[self._layout.index[key]]
+
+    def get(self, key, default=None):
+        if self._extra is None:
+            try:
+                return self._values[self._layout.index[key]]
+            except KeyError:
+                return default
+
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        if self._extra is not None and key in self._extra:
+            return self._extra[key] is not _DELETED
+        return key in self._layout.index
+
+    def __setitem__(self, key, value):
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+
+        if self._extra is None:
+            self._extra = {}
+
+        if key in self._layout.index:
+            self._extra[key] = _DELETED
+        else:
+            del self._extra[key]
+
+    def __iter__(self):
+        if self._extra is None:
+            return iter(self._layout.labels)
+        return (key for key in self._keys())
+
+    def _keys(self):
+        for label in self._layout.labels:
+            if self._extra.get(label) is not _DELETED:
+                yield label
+        for key, value in self._extra.items():
+            if key not in self._layout.index and value is not _DELETED:
+                yield key
+
+    def __len__(self):
+        if self._extra is None:
+            return len(self._layout.labels)
+        return sum(1 for key in self._keys())
+
+    def to_dict(self):
+        """Returns the row as a dictionary."""
+        if self._extra is None:
+            return dict(zip(self._layout.labels, self._values))
+        return dict((key, self[key]) for key in self)
+
+    copy = to_dict
+
+    def labels_values(self):
+        """Returns a tuple (`labels`, `values`) of the row. Rows of one
+        result share the same tuple of labels, unless values were set or
+        deleted."""
+        if self._extra is None:
+            return (self._layout.labels, self._values)
+
+        labels = tuple(self._keys())
+        return (labels, tuple(self[key] for key in labels))
+
+    def __reduce__(self):
+        return (self.__class__, (self._layout, tuple(self._values)),
+                self._extra)
+
+    def __setstate__(self, extra):
+        self._extra = extra
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
 class CalculatedResultIterator(object):
     """
-    Iterator that decorates data items
+    Iterator that decorates data items. Calculated values are set directly
+    to the records, which can be dictionaries or :class:`ResultRow` objects.
     """
     def __init__(self, calculators, iterator):
         self.calculators = calculators
@@ -682,11 +1004,16 @@ class AggregationResult(object):
     * `cells` - list of cells that were drilled-down
     * `total_cell_count` - number of total cells in drill-down (after limit,
       before pagination)
+    * `estimated_cell_count` – number of cells in drill-down estimated from
+      the dimension statistics, if available
     * `aggregates` – aggregates that were selected in aggregation. List of
     `MeasureAggregate` objects.
-    * `remainder` - summary of remaining cells (not yet implemented)
+    * `remainder` - summary of remaining cells when only top cells were
+      requested
     * `levels` – aggregation levels for dimensions that were used to drill-
       down
+    * `next_cursor` – cursor of the next page of cells when the result is
+      paginated with a cursor, ``None`` on the last page
 
     .. note::
 
@@ -729,9 +1056,12 @@ class AggregationResult(object):
         self.summary = {}
         self._cells = []
         self.total_cell_count = None
+        self.estimated_cell_count = None
         self.remainder = {}
         self.labels = []
         self.calculators = []
+        self.next_cursor = None
+        self._source_cells = None
 
     @property
     def cells(self):
@@ -739,11 +1069,20 @@ class AggregationResult(object):
 
     @cells.setter
     def cells(self, val):
+        self._source_cells = val
         # decorate iterable with calcs if needed
         if self.calculators:
             val = CalculatedResultIterator(self.calculators, iter(val))
         self._cells = val
 
+    def close(self):
+        """Releases resources of the cells iterator, such as a database
+        cursor, if the cells were not iterated completely."""
+
+        close = getattr(self._source_cells, "close", None)
+        if close is not None:
+            close()
+
     def to_dict(self):
         """Return dictionary representation of the aggregation result. Can be
         used for JSON serialisation."""
@@ -754,6 +1093,7 @@ class AggregationResult(object):
         d["remainder"] = self.remainder
         d["cells"] = self.cells
         d["total_cell_count"] = self.total_cell_count
+        d["estimated_cell_count"] = self.estimated_cell_count
 
         d["aggregates"] = [str(m) for m in self.aggregates]
 
@@ -765,7 +1105,7 @@ class AggregationResult(object):
         # TODO: New, undocumented for now
         d.set("attributes", self.attributes)
         d["has_split"] = self.has_split
-
+        d["next_cursor"] = self.next_cursor
 
         return d
 
@@ -848,15 +1188,20 @@ class AggregationResult(object):
             This might be expensive for large results.
         """
 
-        result = AggregationResult()
-        result.cell = self.cell
-        result.aggregates = self.aggregates
+        result = AggregationResult(cell=self.cell,
+                                   aggregates=self.aggregates,
+                                   drilldown=self.drilldown,
+                                   has_split=self.has_split)
         result.levels = self.levels
         result.summary = self.summary
         result.total_cell_count = self.total_cell_count
+        result.estimated_cell_count = self.estimated_cell_count
         result.remainder = self.remainder
+        result.labels = self.labels
+        result.next_cursor = self.next_cursor
 
-        # Cache cells from an iterator
+        # Cache cells from an iterator. The cells are already decorated by
+        # the calculators.
         result.cells = list(self.cells)
         return result
 
@@ -888,6 +1233,20 @@ class Drilldown(object):
     def __str__(self):
         return ",".join(self.items_as_strings())
 
+    def canonical(self):
+        """Returns canonical representation of the drilldown – list of
+        drill-down items as lists of dimension name, hierarchy name and
+        level names. Implicit levels and hierarchies are resolved."""
+
+        return [[item.dimension.name, item.hierarchy.name,
+                 [level.name for level in item.levels]]
+                for item in self.drilldown]
+
+    def fingerprint(self):
+        """Returns stable fingerprint of the drilldown, see
+        :meth:`canonical`."""
+        return fingerprint(self)
+
     def items_as_strings(self):
         """Returns drilldown items as strings: ``dimension@hierarchy:level``.
         If hierarchy is dimension's default hierarchy, then it is not included
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""Estimates of aggregation result sizes from dimension statistics."""
+
+from __future__ import absolute_import
+
+import math
+import time
+
+from .cells import PointCut, RangeCut, SetCut
+
+__all__ = [
+    "CardinalityEstimator",
+    "RANGE_SELECTIVITY",
+]
+
+
+# Estimated fraction of dimension members within a range cut. The range
+# bounds are not compared with the members, as the statistics contain only
+# member counts.
+RANGE_SELECTIVITY = 1.0 / 3
+
+
+class CardinalityEstimator(object):
+    """Estimates number of drill-down cells and number of facts of a cell
+    from statistics of the cube's dimensions – number of distinct members
+    of each level (paths of the hierarchy up to the level) and number of
+    facts. Members of a level are assumed to be spread evenly among the
+    members of the upper levels and facts evenly among the members.
+
+    Statistics are gathered by the store, for example
+    :meth:`cubes.sql.SQLStore.collect_statistics`."""
+
+    def __init__(self, cube, level_counts, fact_count=None, created=None):
+        """Creates an estimator for `cube`.
+
+        * `level_counts` – dictionary where keys are tuples (`dimension`,
+          `hierarchy`, `depth`) of names and level depth (starting with 1)
+          and values are numbers of distinct level members
+        * `fact_count` – number of facts of the cube
+        * `created` – time when the statistics were gathered, default is
+          now
+        """
+
+        self.cube = cube
+        self.level_counts = dict(level_counts)
+        self.fact_count = fact_count
+        self.created = created if created is not None else time.time()
+
+    @property
+    def age(self):
+        """Age of the statistics in seconds."""
+        return time.time() - self.created
+
+    def level_count(self, dimension, hierarchy, depth):
+        """Returns number of members of `dimension` `hierarchy` (objects or
+        names) at `depth`. Returns ``None`` if the number is not known."""
+
+        if not depth:
+            return 1
+
+        dimension = self.cube.dimension(dimension)
+        hierarchy = dimension.hierarchy(hierarchy)
+        key = (dimension.name, hierarchy.name, depth)
+
+        return self.level_counts.get(key)
+
+    def selectivity(self, cut):
+        """Returns estimated fraction of facts within the `cut`. Returns 1 if
+        the fraction can not be estimated."""
+
+        depth = cut.level_depth()
+        count = self.level_count(cut.dimension, cut.hierarchy, depth)
+
+        if isinstance(cut, RangeCut):
+            fraction = RANGE_SELECTIVITY
+        elif not count:
+            return 1.0
+        elif isinstance(cut, PointCut):
+            fraction = 1.0 / count
+        elif isinstance(cut, SetCut):
+            fraction = min(1.0, float(len(cut.paths)) / count)
+        else:
+            return 1.0
+
+        return 1.0 - fraction if cut.invert else fraction
+
+    def estimate_facts(self, cell):
+        """Returns estimated number of facts in the `cell`. Returns ``None``
+        if the number of facts is not known."""
+
+        if self.fact_count is None:
+            return None
+
+        estimate = float(self.fact_count)
+        for cut in cell.cuts:
+            estimate *= self.selectivity(cut)
+
+        return int(math.ceil(estimate))
+
+    def estimate_members(self, cell, item):
+        """Returns estimated number of members of drilldown `item` within
+        the `cell`. Returns ``None`` if the number is not known."""
+
+        (dimension, hierarchy, levels) = item[0:3]
+        depth = len(levels)
+        count = self.level_count(dimension, hierarchy, depth)
+
+        if count is None:
+            return None
+
+        estimate = float(count)
+
+        for cut in cell.dimension_cuts(dimension):
+            cut_depth = cut.level_depth()
+
+            if isinstance(cut, RangeCut):
+                fraction = RANGE_SELECTIVITY
+            elif cut_depth >= depth:
+                # Drilling to a level above the cut – the members are
+                # restricted to the cut paths
+                fraction = 1.0 / count
+                if isinstance(cut, SetCut):
+                    fraction *= len(cut.paths)
+            else:
+                parents = self.level_count(dimension, hierarchy, cut_depth)
+                if not parents:
+                    continue
+                paths = len(cut.paths) if isinstance(cut, SetCut) else 1
+                fraction = min(1.0, float(paths) / parents)
+
+            if cut.invert:
+                fraction = 1.0 - fraction
+
+            estimate *= fraction
+
+        return max(1, int(math.ceil(estimate)))
+
+    def estimate_cells(self, cell, drilldown, split=None):
+        """Returns estimated number of cells of aggregation of the `cell` by
+        the `drilldown` (a :class:`Drilldown` object) and `split`. Returns
+        ``None`` if the number can not be estimated."""
+
+        estimate = 1
+
+        for item in drilldown:
+            members = self.estimate_members(cell, item)
+            if members is None:
+                return None
+            estimate *= members
+
+        if split:
+            estimate *= 2
+
+        # There is no more cells than facts
+        facts = self.estimate_facts(cell)
+        if facts is not None:
+            estimate = min(estimate, max(facts, 1))
+
+        return estimate
@@ -3,6 +3,7 @@
 from __future__ import absolute_import
 
 import copy
+import json
 import re
 
 from collections import OrderedDict
@@ -10,6 +11,7 @@ from collections import OrderedDict
 from ..errors import ArgumentError, CubesError
 from ..metadata import Dimension, Cube
 from ..logging import get_logger
+from ..common import canonical_json, fingerprint
 from .. import compat
 
 
@@ -446,6 +448,46 @@ class Cell(object):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __hash__(self):
+        return hash(frozenset(self.cuts))
+
+    def canonical(self):
+        """Returns canonical representation of the cell – a dictionary with
+        cube name and list of canonical representations of the cuts,
+        without duplicates and in a stable order. Equivalent cells have
+        equal representations regardless of the order of their cuts and
+        regardless of whether the default hierarchy of a dimension is
+        specified explicitly."""
+
+        cuts = set(canonical_json(self._canonical_cut(cut))
+                   for cut in self.cuts)
+
+        return {
+            "cube": str(self.cube.name),
+            "cuts": [json.loads(cut) for cut in sorted(cuts)]
+        }
+
+    def _canonical_cut(self, cut):
+        """Returns canonical representation of the `cut` with the name of
+        the dimension's default hierarchy if the cut has no hierarchy."""
+
+        canonical = cut.canonical()
+
+        if canonical[2] is None:
+            try:
+                dimension = self.cube.dimension(cut.dimension)
+            except CubesError:
+                # Cut of an unknown dimension is kept as it is
+                return canonical
+            canonical[2] = str(dimension.hierarchy())
+
+        return canonical
+
+    def fingerprint(self):
+        """Returns stable fingerprint of the cell, see :meth:`canonical`.
+        Suitable for cache keys."""
+        return fingerprint(self)
+
     def to_str(self):
         """Return string representation of the cell by using standard
         cuts-to-string conversion."""
@@ -733,6 +775,17 @@ def path_from_string(string):
     return path
 
 
+def _canonical_path(path):
+    """Returns path with values converted to strings or ``None`` for an
+    empty path."""
+
+    if path is None:
+        return None
+
+    return [compat.text_type(value) if value is not None else None
+            for value in path]
+
+
 class Cut(object):
     def __init__(self, dimension, hierarchy=None, invert=False,
                  hidden=False):
@@ -763,6 +816,29 @@ class Cut(object):
         method"""
         raise NotImplementedError
 
+    def canonical(self):
+        """Returns canonical representation of the cut – list of cut type,
+        dimension name, hierarchy name, inversion flag and the paths. Path
+        values are converted to strings, as the values from the URL and
+        from the API might differ in type. Subclasses should implement this
+        method."""
+        raise NotImplementedError
+
+    def _canonical(self, type_, *paths):
+        hierarchy = str(self.hierarchy) if self.hierarchy else None
+        return [type_, str(self.dimension), hierarchy, bool(self.invert)] \
+                + list(paths)
+
+    def fingerprint(self):
+        """Returns stable fingerprint of the cut, see :meth:`canonical`."""
+        return fingerprint(self)
+
+    def __hash__(self):
+        # Hierarchy is not compared by the subclasses' __eq__
+        canonical = self.canonical()
+        del canonical[2]
+        return hash(canonical_json(canonical))
+
     def __repr__(self):
         return str(self.to_dict())
 
@@ -788,6 +864,9 @@ class PointCut(Cut):
         """Returns index of deepest level."""
         return len(self.path)
 
+    def canonical(self):
+        return self._canonical("point", _canonical_path(self.path))
+
     def __str__(self):
         """Return string representation of point cut, you can use it in
         URLs"""
@@ -811,6 +890,8 @@ class PointCut(Cut):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    __hash__ = Cut.__hash__
+
 
 class RangeCut(Cut):
     """Object describing way of slicing a cube (cell) between two points of a
@@ -842,6 +923,11 @@ class RangeCut(Cut):
         else:
             return max(len(self.from_path), len(self.to_path))
 
+    def canonical(self):
+        return self._canonical("range",
+                               _canonical_path(self.from_path),
+                               _canonical_path(self.to_path))
+
     def __str__(self):
         """Return string representation of point cut, you can use it in
         URLs"""
@@ -878,6 +964,8 @@ class RangeCut(Cut):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    __hash__ = Cut.__hash__
+
 
 class SetCut(Cut):
     """Object describing way of slicing a cube (cell) between two points of a
@@ -902,6 +990,14 @@ class SetCut(Cut):
         path."""
         return max([len(path) for path in self.paths])
 
+    def canonical(self):
+        # Order of the paths does not matter
+        paths = set(canonical_json(_canonical_path(path))
+                    for path in self.paths)
+        paths = [json.loads(path) for path in sorted(paths)]
+
+        return self._canonical("set", paths)
+
     def __str__(self):
         """Return string representation of set cut, you can use it in URLs"""
         path_strings = []
@@ -929,3 +1025,4 @@ class SetCut(Cut):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    __hash__ = Cut.__hash__
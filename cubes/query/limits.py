@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Limits of query execution – statement timeout, maximal number of rows
+and cancellation."""
+
+from __future__ import absolute_import
+
+import time
+
+from ..errors import QueryCancelledError, QueryTimeoutError
+from ..errors import TooManyRowsError
+
+__all__ = [
+    "QueryLimits",
+]
+
+
+def _lower(value, other):
+    """Returns the lower of `value` and `other`, ignoring ``None``."""
+
+    if value is None:
+        return other
+    elif other is None:
+        return value
+    else:
+        return min(value, other)
+
+
+class QueryLimits(object):
+    """Limits of queries executed by a browser. Backends enforce the limits
+    they support:
+
+    * `timeout` – statement timeout in seconds, :class:`QueryTimeoutError`
+      is raised when a statement runs longer
+    * `max_rows` – maximal number of rows fetched by a query,
+      :class:`TooManyRowsError` is raised when there are more rows
+    * `cancellation` – an object with `is_set()` method, such as
+      :class:`threading.Event`. When set, the running queries are stopped
+      at the next opportunity and :class:`QueryCancelledError` is raised.
+    """
+
+    def __init__(self, timeout=None, max_rows=None, cancellation=None):
+        self.timeout = timeout
+        self.max_rows = max_rows
+        self.cancellation = cancellation
+
+    def __bool__(self):
+        return self.timeout is not None \
+                or self.max_rows is not None \
+                or self.cancellation is not None
+
+    __nonzero__ = __bool__
+
+    def restricted(self, timeout=None, max_rows=None, cancellation=None):
+        """Returns new limits with `timeout` and `max_rows` lowered to the
+        specified values. The limits can not be raised. `cancellation`
+        replaces the current one, if specified."""
+
+        return QueryLimits(_lower(self.timeout, timeout),
+                           _lower(self.max_rows, max_rows),
+                           cancellation or self.cancellation)
+
+    @property
+    def is_cancelled(self):
+        return self.cancellation is not None and self.cancellation.is_set()
+
+    def deadline(self):
+        """Returns time when a statement started now times out or ``None``
+        if there is no timeout."""
+
+        if self.timeout is None:
+            return None
+
+        return time.time() + self.timeout
+
+    def check(self, deadline=None):
+        """Raises :class:`QueryCancelledError` if the query was cancelled and
+        :class:`QueryTimeoutError` if the `deadline` has passed."""
+
+        if self.is_cancelled:
+            raise QueryCancelledError("Query was cancelled")
+
+        if deadline is not None and time.time() > deadline:
+            raise self.timeout_error()
+
+    def check_rows(self, count):
+        """Raises :class:`TooManyRowsError` if `count` of rows exceeds the
+        maximal number of rows."""
+
+        if self.max_rows is not None and count > self.max_rows:
+            raise TooManyRowsError("Query returns more than %d rows, "
+                                   "narrow the query or use pagination"
+                                   % self.max_rows)
+
+    def timeout_error(self):
+        """Returns error to be raised when a statement times out or was
+        cancelled."""
+
+        if self.is_cancelled:
+            return QueryCancelledError("Query was cancelled")
+        else:
+            return QueryTimeoutError("Query took longer than %s seconds"
+                                     % self.timeout)
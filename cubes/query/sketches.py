@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Mergeable sketches for approximate aggregations."""
+
+from __future__ import absolute_import
+
+import hashlib
+import math
+import struct
+import zlib
+
+from ..errors import ArgumentError
+from .. import compat
+
+__all__ = [
+    "HyperLogLog",
+    "DEFAULT_SKETCH_PRECISION",
+]
+
+
+# Number of index bits of the HyperLogLog sketch. The sketch has 2^precision
+# registers and the standard error of the count is 1.04 / sqrt(2^precision),
+# about 1.6% for the default precision.
+DEFAULT_SKETCH_PRECISION = 12
+
+# Version of the serialized sketch format
+SKETCH_FORMAT_VERSION = 1
+
+_HASH_MASK = (1 << 64) - 1
+
+
+def _hash(value):
+    """Returns 64-bit hash of the `value`. The hash is stable across
+    processes, therefore sketches can be stored and merged later."""
+
+    if not isinstance(value, compat.binary_type):
+        value = compat.to_unicode(value).encode("utf-8")
+
+    digest = hashlib.sha1(value).digest()
+    return struct.unpack(">Q", digest[:8])[0]
+
+
+class HyperLogLog(object):
+    """HyperLogLog sketch of a set of values for approximate distinct counts.
+    Sketches of different sets can be merged into a sketch of their union,
+    which makes the sketch suitable for pre-aggregated tables – the sketches
+    of the table rows are merged on roll-up. Sketches are serialized by
+    :meth:`to_bytes` and restored by :meth:`from_bytes`."""
+
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision=None, registers=None):
+        precision = precision or DEFAULT_SKETCH_PRECISION
+
+        if not 4 <= precision <= 16:
+            raise ArgumentError("Sketch precision should be between 4 and "
+                                "16, is {}".format(precision))
+
+        self.precision = precision
+
+        if registers is None:
+            self.registers = bytearray(1 << precision)
+        elif len(registers) != 1 << precision:
+            raise ArgumentError("Sketch with precision {} should have {} "
+                                "registers, has {}"
+                                .format(precision, 1 << precision,
+                                        len(registers)))
+        else:
+            self.registers = bytearray(registers)
+
+    def add(self, value):
+        """Adds `value` to the sketch."""
+
+        hashed = _hash(value)
+        index = hashed >> (64 - self.precision)
+        rest = (hashed << self.precision) & _HASH_MASK
+
+        # Position of the first 1 bit in the remaining bits of the hash
+        rank = min(64 - rest.bit_length(), 64 - self.precision) + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        """Adds all the `values` to the sketch."""
+        for value in values:
+            self.add(value)
+
+    def merge(self, other):
+        """Merges `other` sketch into this sketch. The sketch then counts
+        values of both sketches."""
+
+        if other.precision != self.precision:
+            raise ArgumentError("Can not merge sketches of different "
+                                "precision ({} and {})"
+                                .format(self.precision, other.precision))
+
+        self.registers = bytearray(map(max, self.registers,
+                                       other.registers))
+
+    def count(self):
+        """Returns estimated number of distinct values added to the
+        sketch."""
+
+        m = len(self.registers)
+
+        if m == 16:
+            alpha = 0.673
+        elif m == 32:
+            alpha = 0.697
+        elif m == 64:
+            alpha = 0.709
+        else:
+            alpha = 0.7213 / (1 + 1.079 / m)
+
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+
+        # Small range correction – linear counting of the empty registers
+        zeros = self.registers.count(0)
+        if zeros and estimate <= 2.5 * m:
+            estimate = m * math.log(float(m) / zeros)
+
+        return int(round(estimate))
+
+    def to_bytes(self):
+        """Returns the sketch serialized as bytes."""
+
+        header = struct.pack("BB", SKETCH_FORMAT_VERSION, self.precision)
+        return header + zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Returns a sketch deserialized from `data` created by
+        :meth:`to_bytes`."""
+
+        data = bytes(data)
+        (version, precision) = struct.unpack("BB", data[:2])
+
+        if version != SKETCH_FORMAT_VERSION:
+            raise ArgumentError("Unknown sketch format version {}"
+                                .format(version))
+
+        return cls(precision, zlib.decompress(data[2:]))
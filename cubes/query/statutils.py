@@ -5,13 +5,19 @@ from functools import partial
 from math import sqrt
 
 from ..errors import ArgumentError, InternalError, ModelError
-from .. import compat
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 __all__ = [
     "CALCULATED_AGGREGATIONS",
     "calculators_for_aggregates",
     "available_calculators",
-    "aggregate_calculator_labels"
+    "aggregate_calculator_labels",
+    "window_parameters",
+    "moving_window_values",
 ]
 
 
@@ -41,7 +47,7 @@ def calculators_for_aggregates(cube, aggregates, drilldown_levels=None,
                                                     aggregate.name))
 
         if aggregate.measure:
-            source = cube.measure_aggregate(aggregate.measure)
+            source = cube.aggregate(aggregate.measure)
         else:
             raise InternalError("No measure specified for aggregate '%s' in "
                                 "cube '%s'" % (aggregate.name, cube.name))
@@ -51,51 +57,11 @@ def calculators_for_aggregates(cube, aggregates, drilldown_levels=None,
 
     return functions
 
-def weighted_moving_average(values):
-    n = len(values)
-    denom = n * (n + 1) / 2
-    total = 0.0
-    idx = 1
-    for val in values:
-        total += float(idx) * float(val)
-        idx += 1
-    return round(total / denom, 4)
-
-
-def simple_moving_average(values):
-    # use all the values
-    return round(compat.reduce(lambda i, c: float(c) + i, values, 0.0) / len(values), 2)
-
-def simple_moving_sum(values):
-    return compat.reduce(lambda i, c: i + c, values, 0)
-
-
-def _variance(values):
-    n, mean, std = len(values), 0, 0
-    for a in values:
-        mean = mean + a
-    mean = mean / float(n)
-    if n < 2:
-        return mean, 0
-    for a in values:
-        std = std + (a - mean)**2
-    return mean, (std / float(n-1))
-
-def simple_relative_stdev(values):
-    mean, var = _variance(values)
-    return round(((sqrt(var)/mean) if mean > 0 else 0), 4)
-
-def simple_variance(values):
-    mean, var = _variance(values)
-    return round(var, 2)
-
-def simple_stdev(values):
-    mean, var = _variance(values)
-    return round(sqrt(var), 2)
-
-def _window_function_factory(aggregate, source, drilldown_paths, split_cell, window_function, label):
-    """Returns a moving average window function. `aggregate` is the target
-    aggergate. `window_function` is concrete window function."""
+def window_parameters(aggregate, drilldown_paths=None, split_cell=None):
+    """Returns a tuple (`window_key`, `window_size`) of moving window
+    `aggregate` drilled-down by `drilldown_paths`. `window_key` is a list of
+    attribute references that partition the values into separate windows,
+    `window_size` is number of values in the window."""
 
     # If the level we're drilling to doesn't have aggregation_units configured,
     # we're not doing any calculations
@@ -138,6 +104,16 @@ def _window_function_factory(aggregate, source, drilldown_paths, split_cell, win
     for dditem in key_drilldown_paths:
         window_key += [level.key.ref for level in dditem.levels]
 
+    return (window_key, window_size)
+
+
+def _window_function_factory(aggregate, source, drilldown_paths, split_cell, window_function, label):
+    """Returns a moving average window function. `aggregate` is the target
+    aggergate. `window_function` is concrete window function."""
+
+    (window_key, window_size) = window_parameters(aggregate, drilldown_paths,
+                                                  split_cell)
+
     # TODO: this is temporary solution: for post-aggregate calculations we
     # consider the measure reference to be aggregated measure reference.
     # TODO: this does not work for implicit post-aggregate calculations
@@ -156,7 +132,8 @@ def get_key(record, composite_key):
 class WindowFunction(object):
     def __init__(self, function, window_key, target_attribute,
                  source_attribute, window_size, label):
-        """Creates a window function."""
+        """Creates a window function. `function` is a :class:`MovingWindow`
+        subclass that computes the function over the window values."""
 
         if not function:
             raise ArgumentError("No window function provided")
@@ -172,7 +149,7 @@ class WindowFunction(object):
         self.source_attribute = source_attribute
         self.target_attribute = target_attribute
         self.window_size = window_size
-        self.window_values = {}
+        self.windows = {}
         self.label = label
 
     def __call__(self, record):
@@ -182,49 +159,331 @@ class WindowFunction(object):
 
         key = get_key(record, self.window_key)
 
-        # Get the window values by key. Create new if necessary.
+        # Get the window by key. Create new if necessary.
         try:
-            values = self.window_values[key]
+            window = self.windows[key]
         except KeyError:
-            values = deque()
-            self.window_values[key] = values
+            window = self.function(self.window_size)
+            self.windows[key] = window
 
         value = record.get(self.source_attribute)
 
         # TODO: What about those window functions that would want to have empty
         # values?
         if value is not None:
-            values.append(value)
-
-        # Keep the window within the window size:
-        while len(values) > self.window_size:
-            values.popleft()
+            window.append(value)
 
         # Compute, if we have the values
-        if len(values) > 0:
-            record[self.target_attribute] = self.function(values)
+        if len(window) > 0:
+            record[self.target_attribute] = window.value()
+
+
+class MovingWindow(object):
+    """Running state of a moving window of at most `size` values. Subclasses
+    update the state in constant time when a value enters or leaves the
+    window in `add()` and `remove()` and compute the window function from
+    the state in `value()`.
+
+    Rounding errors of float values accumulate in the state over long
+    series, therefore the state is computed again from the window values
+    after every `size` removed values."""
+
+    def __init__(self, size):
+        self.size = size
+        self.values = deque()
+        self.removed = 0
+        self.reset()
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, value):
+        """Appends `value` to the window. The oldest value leaves the window
+        if the window is full."""
+
+        self.values.append(value)
+        self.add(value)
+
+        if len(self.values) > self.size:
+            self.remove(self.values.popleft())
+            self.removed += 1
+
+            if self.removed >= self.size:
+                self.recompute()
+
+    def recompute(self):
+        """Computes the state from the values in the window."""
+
+        values = self.values
+        self.values = deque()
+        self.removed = 0
+        self.reset()
+
+        for value in values:
+            self.values.append(value)
+            self.add(value)
+
+    def reset(self):
+        """Sets the state of an empty window."""
+        raise NotImplementedError
+
+    def add(self, value):
+        raise NotImplementedError
+
+    def remove(self, value):
+        raise NotImplementedError
+
+    def value(self):
+        raise NotImplementedError
+
+    @classmethod
+    def column(cls, values, size):
+        """Returns list of window function results for each value of
+        `values` – the window function of the window ending at the value.
+        ``None`` values are skipped, results for them are the results of the
+        window before or ``None`` if the window is empty. The results are
+        computed at once on arrays if NumPy is available."""
+
+        values = list(values)
+
+        if numpy is not None and values and None not in values:
+            array = numpy.asarray(values)
+            if array.dtype.kind in "iuf":
+                return cls.vectorized(array, size).tolist()
+
+        window = cls(size)
+        result = []
+
+        for value in values:
+            if value is not None:
+                window.append(value)
+            result.append(window.value() if len(window) else None)
+
+        return result
+
+    @classmethod
+    def vectorized(cls, array, size):
+        """Returns NumPy array of window function results for `array` of
+        values."""
+        raise NotImplementedError
+
+
+def _window_sums(array, size):
+    """Returns array of sums of the windows of `size` ending at each item of
+    the `array`. Windows of float values are summed separately, as the
+    differences of cumulative sums accumulate rounding errors."""
+
+    if array.dtype.kind == "f":
+        return numpy.convolve(array, numpy.ones(size))[:len(array)]
+
+    sums = numpy.cumsum(array)
+    sums[size:] = sums[size:] - sums[:-size]
+    return sums
+
+
+def _window_counts(array, size):
+    """Returns array of number of items in windows of `size` ending at each
+    item of the `array`."""
+
+    return numpy.minimum(numpy.arange(1, len(array) + 1), size)
 
 
+def _compensated_add(total, compensation, value):
+    """Returns tuple (`total`, `compensation`) of the sum of `total` and
+    `value` using Neumaier's compensated summation. `compensation` keeps the
+    low-order bits lost by rounding of float values, the sum is `total` +
+    `compensation`."""
+
+    result = total + value
+    if abs(total) >= abs(value):
+        compensation += (total - result) + value
+    else:
+        compensation += (value - result) + total
+
+    return (result, compensation)
+
+
+class MovingSum(MovingWindow):
+    def reset(self):
+        self.total = 0
+        self.compensation = 0
+
+    def add(self, value):
+        (self.total, self.compensation) = \
+                _compensated_add(self.total, self.compensation, value)
+
+    def remove(self, value):
+        (self.total, self.compensation) = \
+                _compensated_add(self.total, self.compensation, -value)
+
+    def value(self):
+        return self.total + self.compensation
+
+    @classmethod
+    def vectorized(cls, array, size):
+        return _window_sums(array, size)
+
+
+class MovingAverage(MovingSum):
+    def reset(self):
+        self.total = 0.0
+        self.compensation = 0.0
+
+    def add(self, value):
+        super(MovingAverage, self).add(float(value))
+
+    def remove(self, value):
+        super(MovingAverage, self).remove(float(value))
+
+    def value(self):
+        return round((self.total + self.compensation) / len(self.values), 2)
+
+    @classmethod
+    def vectorized(cls, array, size):
+        array = array.astype(float)
+        return numpy.round(_window_sums(array, size)
+                           / _window_counts(array, size), 2)
+
+
+class MovingWeightedAverage(MovingWindow):
+    """Moving average where the n-th value of the window has weight n. When
+    the oldest value leaves the window, weights of all the other values
+    decrease by one, which decreases the weighted sum by the sum of the
+    values."""
+
+    def reset(self):
+        self.total = 0.0
+        self.weighted = 0.0
+
+    def add(self, value):
+        self.total += float(value)
+        self.weighted += len(self.values) * float(value)
+
+    def remove(self, value):
+        self.weighted -= self.total
+        self.total -= float(value)
+
+    def value(self):
+        n = len(self.values)
+        return round(self.weighted / (n * (n + 1) / 2), 4)
+
+    @classmethod
+    def vectorized(cls, array, size):
+        array = array.astype(float)
+        index = numpy.arange(1, len(array) + 1)
+        counts = _window_counts(array, size)
+
+        # Sum of values weighted by the index in the array shifted to the
+        # weights within the window
+        weighted = _window_sums(index * array, size) \
+                    - (index - counts) * _window_sums(array, size)
+
+        return numpy.round(weighted / (counts * (counts + 1) / 2.0), 4)
+
+
+class MovingVariance(MovingWindow):
+    """Sample variance of the window values using Welford's algorithm,
+    extended with removal of values."""
+
+    def reset(self):
+        self.mean = 0.0
+        self.squares = 0.0
+
+    def add(self, value):
+        value = float(value)
+        delta = value - self.mean
+        self.mean += delta / len(self.values)
+        self.squares += delta * (value - self.mean)
+
+    def remove(self, value):
+        value = float(value)
+        n = len(self.values)
+        delta = value - self.mean
+        self.mean -= delta / n
+        self.squares -= delta * (value - self.mean)
+
+    def variance(self):
+        n = len(self.values)
+        if n < 2:
+            return 0
+        return max(self.squares, 0.0) / (n - 1)
+
+    def value(self):
+        return round(self.variance(), 2)
+
+    @classmethod
+    def variances(cls, array, size):
+        """Returns tuple (`means`, `variances`) of arrays of window means and
+        sample variances."""
+
+        array = array.astype(float)
+        counts = _window_counts(array, size)
+
+        # Variance does not depend on the shift, which keeps the sums small
+        shift = array.mean()
+        shifted = array - shift
+
+        sums = _window_sums(shifted, size)
+        squares = _window_sums(shifted * shifted, size)
+
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            variances = (squares - sums * sums / counts) / (counts - 1)
+
+        variances = numpy.where(counts > 1, numpy.maximum(variances, 0), 0)
+        means = sums / counts + shift
+
+        return (means, variances)
+
+    @classmethod
+    def vectorized(cls, array, size):
+        (means, variances) = cls.variances(array, size)
+        return numpy.round(variances, 2)
+
+
+class MovingStdev(MovingVariance):
+    def value(self):
+        return round(sqrt(self.variance()), 2)
+
+    @classmethod
+    def vectorized(cls, array, size):
+        (means, variances) = cls.variances(array, size)
+        return numpy.round(numpy.sqrt(variances), 2)
+
+
+class MovingRelativeStdev(MovingVariance):
+    def value(self):
+        if self.mean > 0:
+            return round(sqrt(self.variance()) / self.mean, 4)
+        else:
+            return 0
+
+    @classmethod
+    def vectorized(cls, array, size):
+        (means, variances) = cls.variances(array, size)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            relative = numpy.sqrt(variances) / means
+        return numpy.round(numpy.where(means > 0, relative, 0), 4)
+
 
 # TODO: make CALCULATED_AGGREGATIONS a namespace (see extensions.py)
 CALCULATED_AGGREGATIONS = {
     "wma": partial(_window_function_factory,
-                   window_function=weighted_moving_average,
+                   window_function=MovingWeightedAverage,
                    label='Weighted Moving Avg. of {measure}'),
     "sma": partial(_window_function_factory,
-                   window_function=simple_moving_average,
+                   window_function=MovingAverage,
                    label='Simple Moving Avg. of {measure}'),
     "sms": partial(_window_function_factory,
-                   window_function=simple_moving_sum,
+                   window_function=MovingSum,
                    label='Simple Moving Sum of {measure}'),
     "smstd": partial(_window_function_factory,
-                     window_function=simple_stdev,
+                     window_function=MovingStdev,
                      label='Moving Std. Deviation of {measure}'),
     "smrsd": partial(_window_function_factory,
-                     window_function=simple_relative_stdev,
+                     window_function=MovingRelativeStdev,
                      label='Moving Relative St. Dev. of {measure}'),
     "smvar": partial(_window_function_factory,
-                     window_function=simple_variance,
+                     window_function=MovingVariance,
                      label='Moving Variance of {measure}')
 }
 
@@ -232,5 +491,22 @@ def available_calculators():
     """Returns a list of available calculators."""
     return CALCULATED_AGGREGATIONS.keys()
 
+def moving_window_values(function, values, window_size):
+    """Returns list of results of moving window calculator `function` (such
+    as ``sma``) for each of the `values` – a whole column of results at
+    once. See :meth:`MovingWindow.column` for more information."""
+
+    try:
+        factory = CALCULATED_AGGREGATIONS[function]
+    except KeyError:
+        raise ArgumentError("Unknown post-calculation function '%s'"
+                            % function)
+
+    if window_size < 1:
+        raise ArgumentError("Window size should be >= 1")
+
+    window = factory.keywords["window_function"]
+    return window.column(values, window_size)
+
 def aggregate_calculator_labels():
     return dict([(k, v.keywords['label']) for k, v in CALCULATED_AGGREGATIONS.items()])
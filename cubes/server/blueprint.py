@@ -14,12 +14,14 @@ from ..errors import *
 from ..formatters import JSONLinesGenerator, csv_generator
 from .. import ext
 from ..logging import get_logger
+from ..common import fingerprint
 from .logging import configured_request_log_handlers, RequestLogger
 from .logging import AsyncRequestLogger
 from .errors import *
 from .decorators import *
 from .local import *
 from .auth import NotAuthenticated
+from .coalescing import SingleFlight, SQLiteFlightLock
 
 
 from cubes import __version__
@@ -27,7 +29,6 @@ from cubes import __version__
 # TODO: missing features from the original Werkzeug Slicer:
 # * /locales and localization
 # * default cube: /aggregate
-# * caching
 # * root / index
 # * response.headers.add("Access-Control-Allow-Origin", "*")
 
@@ -46,6 +47,9 @@ API_VERSION = 2
 # Cross-origin resource sharing – 20 days cache
 CORS_MAX_AGE = 1728000
 
+# Response header with cursor of the next page for keyset pagination
+NEXT_CURSOR_HEADER = "X-Cubes-Next-Cursor"
+
 slicer = Blueprint("slicer", __name__, template_folder="templates")
 
 # Before
@@ -105,6 +109,7 @@ def initialize_slicer(state):
         # FIXME XXX this shouldn't be in the "server" section
         _store_option(config, "prettyprint", False, "bool")
         _store_option(config, "json_record_limit", 1000, "int")
+        _store_option(config, "json_chunk_size", 100, "int")
         _store_option(config, "hide_private_cuts", False, "bool")
         _store_option(config, "allow_cors_origin", None, "str")
         _store_option(config, "visualizer", None, "str")
@@ -141,6 +146,30 @@ def initialize_slicer(state):
         else:
             current_app.slicer.request_logger = RequestLogger(handlers)
 
+        # Result cache
+        if config.has_section("cache"):
+            options = dict(config.items("cache"))
+            cache_type = options.pop("type", "memory")
+            current_app.slicer.cache = ext.cache(cache_type, **options)
+            logger.debug("Server result cache: %s" % cache_type)
+        else:
+            current_app.slicer.cache = None
+
+        # Coalescing of identical concurrent requests
+        _store_option(config, "coalesce_requests", False, "bool")
+
+        if current_app.slicer.coalesce_requests:
+            current_app.slicer.coalescer = SingleFlight()
+        else:
+            current_app.slicer.coalescer = None
+
+        if config.has_option("server", "coalescing_lock"):
+            path = config.get("server", "coalescing_lock")
+            current_app.slicer.flight_lock = SQLiteFlightLock(path)
+            logger.debug("Cross-process request coalescing lock: %s" % path)
+        else:
+            current_app.slicer.flight_lock = None
+
 # Before and After
 # ================
 
@@ -150,6 +179,7 @@ def process_common_parameters():
 
     # Copy from the application context
     g.json_record_limit = current_app.slicer.json_record_limit
+    g.json_chunk_size = current_app.slicer.json_chunk_size
 
     if "prettyprint" in request.args:
         g.prettyprint = str_to_bool(request.args.get("prettyprint"))
@@ -306,9 +336,74 @@ def cube_model(cube_name):
     return jsonify(response)
 
 
+# Request arguments of /aggregate that are included in the aggregation
+# fingerprint
+AGGREGATE_ARGUMENTS = ["cut", "split", "drilldown", "aggregates", "order",
+                       "page", "pagesize", "cursor", "top", "remainder"]
+
+
+def aggregate_arguments():
+    """Returns keyword arguments of the browser's `aggregate()` for the
+    current request, except the cell."""
+
+    aggregates = []
+    for agg in request.args.getlist("aggregates") or []:
+        aggregates += agg.split("|")
+
+    drilldown = []
+
+    ddlist = request.args.getlist("drilldown")
+    if ddlist:
+        for ddstring in ddlist:
+            drilldown += ddstring.split("|")
+
+    prepare_cell("split", "split")
+
+    options = cursor_options()
+    options.update(top_options())
+
+    return dict(aggregates=aggregates,
+                drilldown=drilldown,
+                split=g.split,
+                page=g.page,
+                page_size=g.page_size,
+                order=g.order,
+                **options)
+
+
+def aggregate_fingerprint():
+    """Returns fingerprint of the aggregation of the current request, see
+    :meth:`AggregationBrowser.aggregate_fingerprint`. The fingerprint is
+    computed once per request."""
+
+    if "fingerprint" not in g:
+        g.fingerprint = g.browser.aggregate_fingerprint(g.cell,
+                                                        **aggregate_arguments())
+    return g.fingerprint
+
+
+def aggregate_flight_key():
+    """Returns key of the aggregation of the current request shared by
+    identical concurrent requests. Besides the aggregation fingerprint the
+    key contains everything else the result depends on: the locale, the
+    authenticated identity and the query limits."""
+
+    limits = g.browser.limits
+
+    return fingerprint([aggregate_fingerprint(),
+                        g.locale,
+                        g.auth_identity,
+                        limits.timeout,
+                        limits.max_rows])
+
+
 @slicer.route("/cube/<cube_name>/aggregate")
 @requires_browser
-@log_request("aggregate", "aggregates")
+@log_request("aggregate", "aggregates", fingerprint=aggregate_fingerprint)
+@conditional_response("aggregate", fingerprint=aggregate_fingerprint,
+                      arguments=AGGREGATE_ARGUMENTS)
+@cached_response("aggregate", fingerprint=aggregate_fingerprint,
+                 arguments=AGGREGATE_ARGUMENTS)
 def aggregate(cube_name):
     cube = g.cube
 
@@ -326,37 +421,35 @@ def aggregate(cube_name):
     else:
         fields = None
 
-    # Aggregates
-    # ----------
+    coalescer = current_app.slicer.coalescer
+    arguments = aggregate_arguments()
 
-    aggregates = []
-    for agg in request.args.getlist("aggregates") or []:
-        aggregates += agg.split("|")
+    # Cells of drill-downs without pagination are streamed, sharing them
+    # would fetch all of them into memory
+    if arguments["drilldown"] and g.page_size is None:
+        coalescer = None
 
-    drilldown = []
+    if coalescer is not None:
+        # Identical concurrent requests share one aggregation. The shared
+        # result is copied, as it is modified below.
+        key = aggregate_flight_key()
 
-    ddlist = request.args.getlist("drilldown")
-    if ddlist:
-        for ddstring in ddlist:
-            drilldown += ddstring.split("|")
+        def aggregate_cached():
+            return g.browser.aggregate(g.cell, **arguments).cached()
 
-    prepare_cell("split", "split")
-
-    result = g.browser.aggregate(g.cell,
-                                 aggregates=aggregates,
-                                 drilldown=drilldown,
-                                 split=g.split,
-                                 page=g.page,
-                                 page_size=g.page_size,
-                                 order=g.order)
+        result = coalescer.do(key, aggregate_cached).cached()
+    else:
+        result = g.browser.aggregate(g.cell, **arguments)
 
     # Hide cuts that were generated internally (default: don't)
     if current_app.slicer.hide_private_cuts:
         result.cell = result.cell.public_cell()
 
     if output_format == "json":
-        return jsonify(result)
+        response = close_with_response(jsonify(result), result)
+        return with_next_cursor(response, result)
     elif output_format != "csv":
+        result.close()
         raise RequestError("unknown response format '%s'" % output_format)
 
     # csv
@@ -380,14 +473,18 @@ def aggregate(cube_name):
                              header=header)
 
     headers = {"Content-Disposition": 'attachment; filename="aggregate.csv"'}
-    return Response(generator,
-                    mimetype='text/csv',
-                    headers=headers)
+    response = Response(generator,
+                        mimetype='text/csv',
+                        headers=headers)
+    response = close_with_response(response, result)
+
+    return with_next_cursor(response, result)
 
 
 @slicer.route("/cube/<cube_name>/facts")
 @requires_browser
 @log_request("facts", "fields")
+@conditional_response("facts")
 def cube_facts(cube_name):
     # Request parameters
     fields_str = request.args.get("fields")
@@ -410,7 +507,8 @@ def cube_facts(cube_name):
                              fields=fields,
                              order=g.order,
                              page=g.page,
-                             page_size=g.page_size)
+                             page_size=g.page_size,
+                             **cursor_options())
 
     # Add cube key to the fields (it is returned in the result)
     fields.insert(0, g.cube.key or "__fact_key__")
@@ -419,7 +517,9 @@ def cube_facts(cube_name):
     labels = [attr.label or attr.name for attr in attributes]
     labels.insert(0, g.cube.key or "__fact_key__")
 
-    return formatted_response(facts, fields, labels)
+    response = formatted_response(facts, fields, labels)
+
+    return with_next_cursor(response, facts)
 
 @slicer.route("/cube/<cube_name>/fact/<fact_id>")
 @requires_browser
@@ -436,6 +536,8 @@ def cube_fact(cube_name, fact_id):
 @slicer.route("/cube/<cube_name>/members/<dimension_name>")
 @requires_browser
 @log_request("members")
+@conditional_response("members")
+@cached_response("members")
 def cube_members(cube_name, dimension_name):
     # TODO: accept level name
     depth = request.args.get("depth")
@@ -470,7 +572,8 @@ def cube_members(cube_name, dimension_name):
                                depth=depth,
                                hierarchy=hierarchy,
                                page=g.page,
-                               page_size=g.page_size)
+                               page_size=g.page_size,
+                               **cursor_options())
 
     result = {
         "dimension": dimension.name,
@@ -479,6 +582,10 @@ def cube_members(cube_name, dimension_name):
         "data": values
     }
 
+    next_cursor = getattr(values, "next_cursor", None)
+    if next_cursor:
+        result["next_cursor"] = next_cursor
+
     # Collect fields and labels
     attributes = []
     for level in hierarchy.levels_for_depth(depth):
@@ -487,11 +594,57 @@ def cube_members(cube_name, dimension_name):
     fields = [attr.ref for attr in attributes]
     labels = [attr.label or attr.name for attr in attributes]
 
-    return formatted_response(result, fields, labels, iterable=values)
+    response = formatted_response(result, fields, labels, iterable=values)
+
+    return with_next_cursor(response, values)
+
+
+def cursor_options():
+    """Returns browser options for keyset pagination if the `cursor` was
+    requested. The option is not passed otherwise, as not all the backends
+    support it."""
+
+    if g.cursor is not None:
+        return {"cursor": g.cursor}
+    else:
+        return {}
+
+
+def top_options():
+    """Returns browser options for the top cells and the remainder of the
+    aggregation if the `top` was requested. The remainder is computed unless
+    the `remainder` argument is false."""
+
+    top = request.args.get("top")
+    if top is None:
+        return {}
+
+    try:
+        options = {"top": int(top)}
+    except ValueError:
+        raise RequestError("'top' should be a number")
+
+    if str_to_bool(request.args.get("remainder")) is False:
+        options["remainder"] = False
+
+    return options
+
+
+def with_next_cursor(response, result):
+    """Sets the header with cursor of the next page from the `result` if
+    the result was paginated with a cursor and there is a next page."""
+
+    next_cursor = getattr(result, "next_cursor", None)
+
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+    return response
 
 
 @slicer.route("/cube/<cube_name>/cell")
 @requires_browser
+@cached_response("cell")
 def cube_cell(cube_name):
     details = g.browser.cell_details(g.cell)
 
@@ -507,6 +660,8 @@ def cube_cell(cube_name):
 
 @slicer.route("/cube/<cube_name>/report", methods=["GET", "POST"])
 @requires_browser
+@conditional_response("report")
+@cached_response("report")
 def cube_report(cube_name):
     report_request = json.loads(request.data)
 
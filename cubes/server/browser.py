@@ -57,6 +57,10 @@ class SlicerBrowser(AggregationBrowser):
         if page_size is not None:
             params["page_size"] = str(page_size)
 
+        if options.get("top") is not None:
+            params["top"] = str(options["top"])
+            if options.get("remainder") is False:
+                params["remainder"] = "false"
 
         response = self.store.cube_request("aggregate",
                                            self.cube.basename, params)
@@ -68,6 +72,8 @@ class SlicerBrowser(AggregationBrowser):
         if "summary" in response:
             result.summary = response.get('summary')
 
+        result.remainder = response.get('remainder', {})
+
         result.levels = response.get('levels', {})
         result.labels = response.get('labels', [])
         result.cell = cell
@@ -1,43 +1,67 @@
 # -*- coding: utf-8 -*-
-import json
+"""Caches of the server results.
+
+Caches store values under canonical string keys, see :func:`cache_key`.
+Available cache backends:
+
+* :class:`MemoryCache` – least recently used values of one process, bounded
+  by total size of the values
+* :class:`SQLiteCache` – cache in a SQLite file shared by processes of the
+  server
+* :class:`MongoCache` – cache in a MongoDB collection
+"""
+
+from __future__ import absolute_import
+
 import logging
-from functools import update_wrapper, wraps
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from exceptions import BaseException
-import cPickle as pickle
-import types
+from functools import update_wrapper, wraps
 
-from werkzeug.routing import Rule
 from werkzeug.wrappers import Response
 
+from ..common import fingerprint
 
-def _make_key_str(name, *args, **kwargs):
-    key_str = name
+__all__ = (
+    "Cache",
+    "MemoryCache",
+    "SQLiteCache",
+    "MongoCache",
+    "cache_key",
+    "cacheable",
+    "response_dumps",
+    "response_loads",
+)
 
-    if args:
-        key_str += '::' + '::'.join([str(a) for a in args])
-    if kwargs:
-        key_str += '::' + '::'.join(['%s=%s' % (str(k), str(v)) for k, v in sorted(kwargs.items(), key=lambda x: x[0])])
 
-    return key_str
+# Default time to live of cached values in seconds
+DEFAULT_CACHE_TTL = 60
 
+# Default maximal size of cached values in bytes
+DEFAULT_MEMORY_CACHE_SIZE = 64 * 1024 * 1024
+DEFAULT_SQLITE_CACHE_SIZE = 256 * 1024 * 1024
 
-_NOOP = lambda x: x
+# Response headers that are not cached
+_UNCACHED_HEADERS = ("content-length", )
 
 
-def query_ttl_strategy(data):
-    import chat2query
-    import measures
+def cache_key(name, *args, **kwargs):
+    """Returns canonical cache key for `name` and arguments. The key is
+    `name` followed by fingerprint of the arguments, see
+    :func:`cubes.common.fingerprint`. Equal dictionaries give equal keys
+    regardless of order of their items, cells give equal keys regardless of
+    order of their cuts."""
 
-    if 'q' in data:
-        query = chat2query.parse(data['q'])
-        config = measures.get_measure_manifest().get(query.measure, {})
-        ttl = config.get('ttl', None)
-        if ttl:
-            logging.getLogger().debug('Using configured ttl: %s', ttl)
-        return ttl
+    return "%s:%s" % (name, fingerprint([args, kwargs]))
 
-    return None
+
+_NOOP = lambda x: x
 
 
 def _default_strategy(data):
@@ -45,18 +69,33 @@ def _default_strategy(data):
 
 
 def response_dumps(response):
+    """Returns a dictionary with content, status and headers of the
+    `response`, suitable for caching. Streamed response is read."""
+
+    headers = [(key, value) for key, value in response.headers.items()
+               if key.lower() not in _UNCACHED_HEADERS]
+
     return {
-        'data': response.data,
-        'mimetype': response.content_type
+        'data': response.get_data(),
+        'status': response.status_code,
+        'headers': headers
     }
 
 
 def response_loads(data):
-    return Response(data['data'], mimetype=data['mimetype'])
+    """Returns a response from a dictionary created by
+    :func:`response_dumps`."""
 
+    return Response(data['data'],
+                    status=data.get('status', 200),
+                    headers=data['headers'])
 
 
 def cacheable(fn):
+    """Caches return values of a method of an object with `cache`
+    attribute. The key consists of the class name, method name and method
+    arguments together with the object's `args` dictionary."""
+
     @wraps(fn)
     def _cache(self, *args, **kwargs):
 
@@ -64,12 +103,13 @@ def cacheable(fn):
             logging.getLogger().warn('Object is not configured with cache for @cacheable function: %s', self)
             return fn(self, *args, **kwargs)
 
-        additional_args = getattr(self, 'args', {})
+        additional_args = dict(getattr(self, 'args', {}))
+        additional_args.update(kwargs)
 
         cache_impl = self.cache
 
         name = '%s.%s' % (self.__class__.__name__, fn.__name__)
-        key = _make_key_str(name, *args, **dict(additional_args.items() + kwargs.items()))
+        key = cache_key(name, *args, **additional_args)
 
         try:
             v = cache_impl.get(key)
@@ -93,8 +133,23 @@ def cacheable(fn):
     return update_wrapper(_cache, fn)
 
 
-
 class Cache(object):
+    """Base class for caches. Subclasses implement `get()`, `set()`,
+    `rem()` and `clear()`. `get()` returns ``None`` if there is no valid
+    value for the key."""
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def rem(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
     def __setitem__(self, key, value):
         return self.set(key, value)
 
@@ -105,6 +160,24 @@ class Cache(object):
         return self.rem(key)
 
 
+def sqlite_connection(local, path):
+    """Returns connection to SQLite database at `path` stored in the
+    thread-local object `local`. A new connection is created for each thread
+    and each process, as SQLite connections can not be shared."""
+
+    pid = os.getpid()
+
+    if getattr(local, "pid", None) != pid:
+        connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        # Readers do not block the writers
+        connection.execute("PRAGMA journal_mode=WAL")
+
+        local.connection = connection
+        local.pid = pid
+
+    return local.connection
+
+
 def trap(fn):
     def _trap(*args, **kwargs):
         try:
@@ -115,9 +188,257 @@ def trap(fn):
     return _trap
 
 
+class MemoryCache(Cache):
+    """Cache of the least recently used values within one process. The
+    values are stored serialized by `dumps`, total size of the serialized
+    values is limited by `max_size` in bytes. Each value expires after its
+    time to live – `ttl` of the value, result of `ttl_strategy` or the
+    default `ttl` of the cache."""
+
+    __options__ = [
+        {
+            "name": "ttl",
+            "description": "Default time to live of values in seconds",
+            "type": "int"
+        },
+        {
+            "name": "max_size",
+            "description": "Maximal size of cached values in bytes",
+            "type": "int"
+        }
+    ]
+
+    def __init__(self, ttl=DEFAULT_CACHE_TTL, max_size=None,
+                 ttl_strategy=_default_strategy, dumps=pickle.dumps,
+                 loads=pickle.loads, logger=logging.getLogger(), **kwargs):
+        self.ttl = ttl
+        self.max_size = max_size or DEFAULT_MEMORY_CACHE_SIZE
+        self.ttl_strategy = ttl_strategy
+        self.dumps = dumps
+        self.loads = loads
+        self.logger = logger
+
+        # key -> (expires, size, data) in order of use
+        self._entries = OrderedDict()
+        self.size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.pop(key, None)
+
+            if entry is None:
+                self.logger.debug('Miss: %s', key)
+                return None
+            elif entry[0] < now:
+                self.logger.debug('Stale: %s', key)
+                self.size -= entry[1]
+                return None
+
+            # The most recently used entry is the last one
+            self._entries[key] = entry
+
+        self.logger.debug('Hit: %s', key)
+        return self.loads(entry[2])
+
+    def set(self, key, val, ttl=None):
+        t = ttl or self.ttl_strategy(val) or self.ttl
+        data = self.dumps(val)
+        size = len(data) + len(key)
+
+        with self._lock:
+            self._remove(key)
+
+            if size > self.max_size:
+                self.logger.debug('Too large: %s, %d bytes', key, size)
+                return False
+
+            self._entries[key] = (time.time() + t, size, data)
+            self.size += size
+
+            while self.size > self.max_size:
+                (oldest, entry) = self._entries.popitem(last=False)
+                self.size -= entry[1]
+
+        self.logger.debug('Set: %s, ttl: %s', key, t)
+        return True
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+        return entry is not None
+
+    def rem(self, key):
+        with self._lock:
+            return self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class SQLiteCache(Cache):
+    """Cache stored in a SQLite database file at `path`, which can be shared
+    by multiple processes of the server. Total size of the serialized values
+    is limited by `max_size` in bytes, the least recently used values are
+    removed first."""
+
+    __options__ = [
+        {
+            "name": "path",
+            "description": "Path to the cache database file",
+            "type": "string"
+        },
+        {
+            "name": "ttl",
+            "description": "Default time to live of values in seconds",
+            "type": "int"
+        },
+        {
+            "name": "max_size",
+            "description": "Maximal size of cached values in bytes",
+            "type": "int"
+        }
+    ]
+
+    def __init__(self, path, ttl=DEFAULT_CACHE_TTL, max_size=None,
+                 ttl_strategy=_default_strategy, dumps=pickle.dumps,
+                 loads=pickle.loads, logger=logging.getLogger(), **kwargs):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size or DEFAULT_SQLITE_CACHE_SIZE
+        self.ttl_strategy = ttl_strategy
+        self.dumps = dumps
+        self.loads = loads
+        self.logger = logger
+
+        # See sqlite_connection()
+        self._local = threading.local()
+
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, data BLOB, size INTEGER, "
+            "expires REAL, accessed REAL)"
+        )
+
+    def _connection(self):
+        return sqlite_connection(self._local, self.path)
+
+    @trap
+    def get(self, key):
+        now = time.time()
+        connection = self._connection()
+
+        row = connection.execute("SELECT data, expires FROM cache "
+                                 "WHERE key = ?", (key, )).fetchone()
+
+        if row is None:
+            self.logger.debug('Miss: %s', key)
+            return None
+        elif row[1] < now:
+            self.logger.debug('Stale: %s', key)
+            connection.execute("DELETE FROM cache WHERE key = ?", (key, ))
+            return None
+
+        connection.execute("UPDATE cache SET accessed = ? WHERE key = ?",
+                           (now, key))
+
+        self.logger.debug('Hit: %s', key)
+        return self.loads(bytes(row[0]))
+
+    @trap
+    def set(self, key, val, ttl=None):
+        t = ttl or self.ttl_strategy(val) or self.ttl
+        data = self.dumps(val)
+        size = len(data) + len(key)
+        now = time.time()
+
+        if size > self.max_size:
+            self.logger.debug('Too large: %s, %d bytes', key, size)
+            self.rem(key)
+            return False
+
+        connection = self._connection()
+        connection.execute("INSERT OR REPLACE INTO cache "
+                           "(key, data, size, expires, accessed) "
+                           "VALUES (?, ?, ?, ?, ?)",
+                           (key, sqlite3.Binary(data), size, now + t, now))
+
+        self._prune(connection, now)
+
+        self.logger.debug('Set: %s, ttl: %s', key, t)
+        return True
+
+    def _prune(self, connection, now):
+        """Removes expired values and the least recently used values over
+        the maximal size."""
+
+        connection.execute("DELETE FROM cache WHERE expires < ?", (now, ))
+
+        total = connection.execute("SELECT SUM(size) FROM cache").fetchone()[0]
+        if not total or total <= self.max_size:
+            return
+
+        excess = total - self.max_size
+        rows = connection.execute("SELECT key, size FROM cache "
+                                  "ORDER BY accessed")
+        keys = []
+        for (key, size) in rows:
+            keys.append((key, ))
+            excess -= size
+            if excess <= 0:
+                break
+
+        connection.executemany("DELETE FROM cache WHERE key = ?", keys)
+
+    @trap
+    def rem(self, key):
+        cursor = self._connection().execute("DELETE FROM cache WHERE key = ?",
+                                            (key, ))
+        return cursor.rowcount > 0
+
+    @trap
+    def clear(self):
+        self._connection().execute("DELETE FROM cache")
+
+
 class MongoCache(Cache):
+    """Cache stored in MongoDB collection `name` of the ``Caches`` database
+    of the `ds` client. If `ds` is not specified, then a client connected to
+    `url` is created."""
+
+    __options__ = [
+        {
+            "name": "name",
+            "description": "Name of the cache collection",
+            "type": "string"
+        },
+        {
+            "name": "url",
+            "description": "MongoDB connection URL",
+            "type": "string"
+        },
+        {
+            "name": "ttl",
+            "description": "Default time to live of values in seconds",
+            "type": "int"
+        }
+    ]
+
+    def __init__(self, name="cubes", ds=None, ttl=DEFAULT_CACHE_TTL,
+                 ttl_strategy=_default_strategy, dumps=_NOOP, loads=_NOOP,
+                 logger=logging.getLogger(), url=None, **kwargs):
+        if ds is None:
+            import pymongo
+            ds = pymongo.MongoClient(url)
 
-    def __init__(self, name, ds, ttl=60, ttl_strategy=_default_strategy, dumps=_NOOP, loads=_NOOP, logger=logging.getLogger(), **kwargs):
         self.ttl = ttl
         self.store = ds.Caches[name]
         self.dumps = dumps
@@ -137,9 +458,9 @@ class MongoCache(Cache):
         }
 
         self.logger.debug('Set: %s, ttl: %s', key, t)
-        item = self.store.save(p)
+        result = self.store.replace_one({'_id': key}, p, upsert=True)
 
-        return item is not None
+        return result is not None
 
     @trap
     def get(self, key):
@@ -155,20 +476,21 @@ class MongoCache(Cache):
                 return item['d']
             else:
                 self.logger.debug('Stale: %s', key)
-                self.store.remove({'_id': key})
+                self.store.delete_one({'_id': key})
                 return None
         else:
             self.logger.debug('Miss: %s', key)
             return None
 
     def rem(self, key):
-        n = datetime.utcnow()
-        item = self.store.find_one({'_id':key})
+        result = self.store.delete_one({'_id': key})
 
-        if item:
+        if result.deleted_count:
             self.logger.debug('Remove: %s', key)
-            self.store.remove(item)
             return True
         else:
             self.logger.debug('Miss: %s', key)
             return False
+
+    def clear(self):
+        self.store.delete_many({})
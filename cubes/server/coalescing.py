@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""Coalescing of identical concurrent requests.
+
+While a request is being executed, identical requests wait for it and share
+its result instead of executing the same queries again.
+
+* :class:`SingleFlight` – coalesces calls within one process
+* :class:`SQLiteFlightLock` – lock table in a SQLite file shared by
+  processes of the server, used together with a shared result cache
+"""
+
+from __future__ import absolute_import
+
+import os
+import threading
+import time
+
+from .caching import sqlite_connection
+
+__all__ = [
+    "SingleFlight",
+    "SQLiteFlightLock",
+]
+
+
+# Default time in seconds after which a flight is considered abandoned
+DEFAULT_FLIGHT_TIMEOUT = 60
+
+# Interval in seconds of checking whether a flight of other process landed
+DEFAULT_POLL_INTERVAL = 0.05
+
+
+class _Flight(object):
+    def __init__(self):
+        self.landed = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Coalesces concurrent calls with the same key within one process. The
+    first call executes the function, calls with the same key made before
+    it finishes wait and receive its result or its exception. The result is
+    shared, therefore it should not be modified by the callers."""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        """Returns result of `function` or result of the running call with
+        the same `key`."""
+
+        with self._lock:
+            flight = self._flights.get(key)
+
+            if flight is None:
+                flight = _Flight()
+                self._flights[key] = flight
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            flight.landed.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = function()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            # Following calls start a new flight
+            with self._lock:
+                del self._flights[key]
+            flight.landed.set()
+
+        return flight.result
+
+    def in_flight(self, key):
+        """Returns ``True`` if a call with `key` is being executed."""
+        return key in self._flights
+
+
+class SQLiteFlightLock(object):
+    """Lock table in a SQLite database file at `path` shared by multiple
+    processes of the server. A process holding the lock for a key executes
+    the request, other processes wait until the lock is released and then
+    look for the result in a shared cache.
+
+    Locks older than `timeout` seconds are considered abandoned, for
+    example by a killed process, and are taken over."""
+
+    def __init__(self, path, timeout=DEFAULT_FLIGHT_TIMEOUT,
+                 poll_interval=DEFAULT_POLL_INTERVAL):
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+
+        # See sqlite_connection()
+        self._local = threading.local()
+
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS flights ("
+            "key TEXT PRIMARY KEY, owner TEXT, started REAL)"
+        )
+
+    def _connection(self):
+        return sqlite_connection(self._local, self.path)
+
+    def _owner(self):
+        return "%d:%d" % (os.getpid(), threading.current_thread().ident)
+
+    def acquire(self, key):
+        """Acquires lock for `key`. Returns ``True`` if the lock was
+        acquired. Otherwise waits until the lock is released and returns
+        ``False``. Gives up waiting after `timeout` seconds."""
+
+        connection = self._connection()
+        now = time.time()
+
+        connection.execute("DELETE FROM flights WHERE key = ? AND started < ?",
+                           (key, now - self.timeout))
+        cursor = connection.execute("INSERT OR IGNORE INTO flights "
+                                    "(key, owner, started) VALUES (?, ?, ?)",
+                                    (key, self._owner(), now))
+        if cursor.rowcount == 1:
+            return True
+
+        deadline = now + self.timeout
+
+        while time.time() < deadline:
+            time.sleep(self.poll_interval)
+            row = connection.execute("SELECT 1 FROM flights WHERE key = ?",
+                                     (key, )).fetchone()
+            if row is None:
+                break
+
+        return False
+
+    def release(self, key):
+        """Releases lock for `key` held by the current thread."""
+
+        self._connection().execute("DELETE FROM flights "
+                                   "WHERE key = ? AND owner = ?",
+                                   (key, self._owner()))
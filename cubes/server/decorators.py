@@ -12,9 +12,17 @@ from .utils import *
 from .errors import *
 from .local import *
 from ..calendar import CalendarMemberConverter
+from ..logging import get_logger
+from .. import compat
+from .caching import cache_key, response_dumps, response_loads
 
 from contextlib import contextmanager
 
+import json
+import threading
+
+from datetime import datetime
+
 # Utils
 # -----
 
@@ -103,6 +111,33 @@ def requires_browser(f):
         else:
             g.page_size = None
 
+        # Keyset pagination: empty cursor requests the first page
+        g.cursor = request.args.get("cursor")
+
+        # Query limits: the request can only lower the configured limits.
+        # The queries are cancelled when the response is closed before the
+        # result was sent, see `close_with_response()`.
+        if "timeout" in request.args:
+            try:
+                timeout = float(request.args.get("timeout"))
+            except ValueError:
+                raise RequestError("'timeout' should be a number")
+        else:
+            timeout = None
+
+        if "maxrows" in request.args:
+            try:
+                max_rows = int(request.args.get("maxrows"))
+            except ValueError:
+                raise RequestError("'maxrows' should be a number")
+        else:
+            max_rows = None
+
+        g.cancellation = threading.Event()
+        g.browser.restrict_limits(timeout=timeout,
+                                  max_rows=max_rows,
+                                  cancellation=g.cancellation)
+
         # Collect orderings:
         # order is specified as order=<field>[:<direction>]
         #
@@ -139,7 +174,11 @@ def authorized_cube(cube_name, locale):
 # Query Logging
 # =============
 
-def log_request(action, attrib_field="attributes"):
+def log_request(action, attrib_field="attributes", fingerprint=None):
+    """Logs the request with the configured request logger. `fingerprint`
+    is a function returning fingerprint of the request, the fingerprint of
+    the cell is logged if not specified."""
+
     def decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
@@ -162,6 +201,11 @@ def log_request(action, attrib_field="attributes"):
                 "attributes": request.args.get(attrib_field)
             }
 
+            if fingerprint is not None:
+                other["fingerprint"] = fingerprint()
+            elif g.cell:
+                other["fingerprint"] = g.cell.fingerprint()
+
             with rlogger.log_time(action, g.browser, g.cell, g.auth_identity,
                                   **other):
                 retval = f(*args, **kwargs)
@@ -172,3 +216,179 @@ def log_request(action, attrib_field="attributes"):
 
     return decorator
 
+
+
+# Result Caching
+# ==============
+
+def data_version():
+    """Returns data version of the store of the current request's browser,
+    see :meth:`cubes.Store.data_version`. Returns ``None`` if the version
+    is not known. The version is retrieved once per request."""
+
+    if "data_version" not in g:
+        store = getattr(g.browser, "store", None)
+
+        try:
+            version = store.data_version() if store is not None else None
+        except Exception as e:
+            logger = get_logger()
+            logger.warn("Data version of the store is not available: %s" % e)
+            version = None
+
+        g.data_version = version
+
+    return g.data_version
+
+
+def request_cache_key(action, fingerprint=None, arguments=None):
+    """Returns canonical cache key of the current request for `action`. The
+    key depends on the requested cube and other URL parts, arguments,
+    locale, identity and JSON content of the request body. Order of the
+    arguments does not matter except for repeated arguments.
+
+    The cut argument is replaced by fingerprint of the requested cell,
+    therefore equivalent cells share the key. If `fingerprint` function is
+    specified, then its result replaces request `arguments` it covers.
+
+    The key includes the data version of the store, therefore cached
+    results are not used after the data change."""
+
+    ignored = set(arguments or [])
+    ignored.add("cut")
+
+    args = dict((name, request.args.getlist(name))
+                for name in request.args.keys()
+                if name not in ignored)
+
+    if fingerprint is not None:
+        args["fingerprint"] = fingerprint()
+    elif g.cell:
+        args["cell"] = g.cell.fingerprint()
+
+    if request.data:
+        try:
+            body = json.loads(compat.to_unicode(request.data))
+        except ValueError:
+            body = compat.to_unicode(request.data)
+    else:
+        body = None
+
+    return cache_key(action,
+                     view=request.view_args,
+                     args=args,
+                     body=body,
+                     locale=g.locale,
+                     identity=g.auth_identity,
+                     version=data_version())
+
+
+def cached_response(action, fingerprint=None, arguments=None):
+    """Caches successful responses of the decorated endpoint in the
+    configured server cache. Cached responses are read completely. See
+    :func:`request_cache_key` for `fingerprint` and `arguments`.
+
+    If the server has a cross-process coalescing lock, a request waits for
+    another server process computing the same response and then reads it
+    from the cache."""
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            cache = current_app.slicer.cache
+
+            if cache is None:
+                return f(*args, **kwargs)
+
+            key = request_cache_key(action, fingerprint, arguments)
+
+            try:
+                entry = cache.get(key)
+            except Exception as e:
+                logger = get_logger()
+                logger.warn("Result cache failed, skipping cache: %s" % e)
+                return f(*args, **kwargs)
+
+            if entry is not None:
+                return response_loads(entry)
+
+            # Wait for other server processes computing the same response
+            lock = current_app.slicer.flight_lock
+
+            if lock is not None and not lock.acquire(key):
+                entry = cache.get(key)
+                if entry is not None:
+                    return response_loads(entry)
+                # The other process failed or timed out
+                lock = None
+
+            try:
+                response = f(*args, **kwargs)
+
+                if response.status_code == 200:
+                    try:
+                        cache.set(key, response_dumps(response))
+                    except Exception as e:
+                        logger = get_logger()
+                        logger.warn("Result cache failed: %s" % e)
+            finally:
+                if lock is not None:
+                    lock.release(key)
+
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def conditional_response(action, fingerprint=None, arguments=None):
+    """Sets ``ETag`` of successful responses of the decorated endpoint to
+    the request cache key, which includes the data version (see
+    :func:`request_cache_key`), and ``Last-Modified`` to the data version if
+    it is a time. Requests with matching ``If-None-Match`` or
+    ``If-Modified-Since`` get a 304 response without executing the
+    endpoint. Responses are not conditional if the data version is not
+    known."""
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            version = data_version()
+
+            if version is None or request.method not in ("GET", "HEAD"):
+                return f(*args, **kwargs)
+
+            etag = request_cache_key(action, fingerprint, arguments)
+
+            if isinstance(version, datetime):
+                # HTTP dates are in UTC with a precision of seconds
+                modified = datetime(*version.utctimetuple()[:6])
+            else:
+                modified = None
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            elif modified is not None and request.if_modified_since:
+                since = request.if_modified_since.utctimetuple()
+                not_modified = modified <= datetime(*since[:6])
+            else:
+                not_modified = False
+
+            if not_modified:
+                response = Response(status=304)
+            else:
+                response = f(*args, **kwargs)
+
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if modified is not None:
+                response.last_modified = modified
+
+            return response
+
+        return wrapper
+
+    return decorator
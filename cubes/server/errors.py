@@ -4,7 +4,10 @@ import json
 
 server_error_codes = {
     "unknown": 400,
-    "missing_object": 404
+    "missing_object": 404,
+    "query_timeout": 503,
+    "query_cancelled": 503,
+    "too_many_rows": 413
 }
 
 try:
@@ -41,7 +41,8 @@ REQUEST_LOG_ITEMS = [
     "page",
     "page_size",
     "format",
-    "headers"
+    "headers",
+    "fingerprint"
 ]
 
 
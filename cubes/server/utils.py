@@ -9,7 +9,7 @@ import json
 import csv
 
 from .errors import *
-from ..formatters import csv_generator, JSONLinesGenerator, SlicerJSONEncoder
+from ..formatters import csv_generator, JSONLinesGenerator, JSONStreamEncoder
 from .. import compat
 
 
@@ -64,15 +64,17 @@ class CustomDict(dict):
 
 def jsonify(obj):
     """Returns a ``application/json`` `Response` object with `obj` converted
-    to JSON."""
+    to JSON. Records of iterators, such as aggregation cells or facts, are
+    streamed in chunks, see :class:`cubes.formatters.JSONStreamEncoder`."""
 
     if g.prettyprint:
         indent = 4
     else:
         indent = None
 
-    encoder = SlicerJSONEncoder(indent=indent)
-    encoder.iterator_limit = g.json_record_limit
+    encoder = JSONStreamEncoder(indent=indent,
+                                chunk_size=g.json_chunk_size,
+                                record_limit=g.json_record_limit)
     data = encoder.iterencode(obj)
 
     return Response(data, mimetype='application/json')
@@ -104,10 +106,10 @@ def formatted_response(response, fields, labels, iterable=None):
     iterable = iterable or response
 
     if output_format == "json":
-        return jsonify(response)
+        result = jsonify(response)
     elif output_format == "json_lines":
-        return Response(JSONLinesGenerator(iterable),
-                        mimetype='application/x-json-lines')
+        result = Response(JSONLinesGenerator(iterable),
+                          mimetype='application/x-json-lines')
     elif output_format == "csv":
         generator = csv_generator(iterable,
                                  fields,
@@ -116,8 +118,30 @@ def formatted_response(response, fields, labels, iterable=None):
 
         headers = {"Content-Disposition": 'attachment; filename="facts.csv"'}
 
-        return Response(generator,
-                        mimetype='text/csv',
-                        headers=headers)
+        result = Response(generator,
+                          mimetype='text/csv',
+                          headers=headers)
+
+    return close_with_response(result, iterable)
+
+
+def close_with_response(response, result):
+    """Closes the `result` (such as a database cursor of streamed facts)
+    when the `response` is closed – after all the data were sent or when the
+    request was interrupted."""
+
+    # Cancel queries of the request that might be still running, such as
+    # other queries of a report
+    cancellation = getattr(g, "cancellation", None)
+
+    if cancellation is not None:
+        response.call_on_close(cancellation.set)
+
+    close = getattr(result, "close", None)
+
+    if close is not None:
+        response.call_on_close(close)
+
+    return response
 
 
@@ -2,9 +2,10 @@ from __future__ import absolute_import
 
 from .browser import *
 from .store import *
+from .navigator import *
 
 __all__ = []
 
 __all__ += browser.__all__
 __all__ += store.__all__
-
+__all__ += navigator.__all__
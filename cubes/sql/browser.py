@@ -4,6 +4,11 @@
 from __future__ import absolute_import
 
 import collections
+import itertools
+import logging
+
+from functools import partial
+from multiprocessing.pool import ThreadPool
 
 try:
     import sqlalchemy
@@ -13,20 +18,29 @@ except ImportError:
     from ...common import MissingPackage
     sqlalchemy = sql = MissingPackage("sqlalchemy", "SQL aggregation browser")
 
-from ..query import available_calculators
+from ..query import available_calculators, window_parameters
 from ..query import AggregationBrowser, AggregationResult, Drilldown
-from ..query import Cell, PointCut
+from ..query import Cell, PointCut, SetCut, RangeCut, SPLIT_DIMENSION_NAME
+from ..query import ResultRow, RowLayout, HyperLogLog
 from ..logging import get_logger
-from ..errors import ArgumentError, InternalError
+from ..query import QueryLimits
+from ..errors import ArgumentError, InternalError, QueryLimitError
 from ..stores import Store
+from ..common import fingerprint
 from ..metadata import collect_attributes
 from .. import compat
 
 from .functions import available_aggregate_functions
+from .functions import available_window_functions, get_window_function
+from .navigator import ROLLUP_FUNCTIONS, cuboids_from_options
+from .navigator import smallest_cuboid, sketch_aggregates
 from .mapper import DenormalizedMapper, StarSchemaMapper, map_base_attributes
 from .mapper import distill_naming
 from .query import StarSchema, QueryContext, to_join, FACT_KEY_LABEL
-from .utils import paginate_query, order_query
+from .utils import paginate_query, order_query, order_columns, order_rows
+from .utils import seek_query, encode_cursor, supports_row_values
+from .utils import nulls_are_largest
+from .utils import bind_parameters, limited_connection, is_timeout_error
 
 
 __all__ = [
@@ -34,6 +48,33 @@ __all__ = [
 ]
 
 
+# Maximal number of query contexts cached per star schema
+CONTEXT_CACHE_SIZE = 256
+
+# Maximal number of compiled statements cached per star schema
+STATEMENT_CACHE_SIZE = 512
+
+# Prefixes of names of parameters of the cell and split conditions
+CELL_PARAMETER = "cell_"
+SPLIT_PARAMETER = "split_"
+
+# Number of rows fetched at once from streamed results
+DEFAULT_YIELD_PER = 1000
+
+# Maximal number of threads executing report queries concurrently
+DEFAULT_REPORT_WORKERS = 4
+
+# Arguments of report aggregate queries that can be fused into one statement
+FUSABLE_ARGUMENTS = set(["query", "aggregates", "drilldown", "rollup"])
+
+# Label of the column with index of a grouping set in the grouping sets
+# statement
+GROUPING_SET_LABEL = "__grouping_set__"
+
+# Roll-up function of sketches stored in pre-aggregated tables
+SKETCH_ROLLUP = "merge"
+
+
 class SQLBrowser(AggregationBrowser):
     """SnowflakeBrowser is a SQL-based AggregationBrowser implementation that
     can aggregate star and snowflake schemas without need of having
@@ -62,6 +103,65 @@ class SQLBrowser(AggregationBrowser):
       performance reasons
     * `safe_labels` – safe labelling of the attributes in databases which
       don't allow characters such as ``.`` dots in column names
+    * `use_aggregate_tables` – if ``True`` (default) then aggregations are
+      computed from pre-aggregated tables (cuboids) where possible. Cuboids
+      are registered in the store's aggregate navigator or listed in the
+      `aggregate_tables` option – list of dictionaries with keys: `table`,
+      `schema`, `dimensions` (grain levels), `aggregates` and `row_count`.
+      Sketches of `approx_count_distinct` aggregates stored in the tables
+      are merged by the browser.
+    * `use_grouping_sets` – if ``True`` then the summary, drilldown and the
+      total cell count are retrieved using single statement with ``GROUPING
+      SETS`` on databases that support it (PostgreSQL) or its ``UNION ALL``
+      emulation on databases with window functions (SQLite, MySQL 8).
+      Report aggregations of the same cell are fused into one such
+      statement as well. Default is ``False``.
+    * `eliminate_joins` – if ``True`` then dimension tables are not joined
+      when only their join keys are needed, the keys are taken from the
+      master table (usually the fact table) instead. Expects referential
+      integrity between the tables: with inner (``match``) joins facts
+      without a matching dimension row are not filtered out. See
+      :meth:`StarSchema.master_key_mappings`. Default is ``False``.
+    * `stream_results` – if ``True`` then facts and drill-down cells are
+      streamed from a server side cursor (where the database driver
+      supports it, such as psycopg2) instead of being buffered by the driver.
+      The result should be iterated completely or closed. Default is
+      ``False``.
+    * `yield_per` – number of rows fetched at once from the database when
+      iterating facts and drill-down cells. Default is 1000.
+    * `members_with_facts` – dimension members are selected only from the
+      dimension tables when the cell is not cut by other dimensions. If
+      ``True`` then only members that have at least one fact are listed,
+      using a semi-join with the fact table. Default is ``False`` – all
+      members in the dimension tables are listed.
+    * `report_workers` – maximal number of threads executing queries of a
+      report concurrently. The number is also limited by the size of the
+      connection pool. Default is 4.
+    * `cache_statements` – if ``True`` (default) then the summary, drill-down
+      and cell count statements are compiled once for each query shape –
+      structure of the cell, aggregates, drilldown, order and page – and
+      executed with values of the cell cuts as parameters. Sets of
+      different sizes share the shape.
+    * `use_statistics` – if ``True`` then the number of drill-down cells is
+      estimated from the dimension statistics collected by the store, see
+      :meth:`SQLStore.cardinality_estimator`. Default is ``False``.
+    * `row_budget` – maximal estimated number of drill-down cells of a not
+      paginated aggregation. Used only with `use_statistics`, the drilldown
+      is checked only by the model's `cardinality` annotations if not set
+      or if the statistics are not collected yet.
+    * `over_budget` – what to do when the estimated number of cells exceeds
+      the `row_budget`: ``refuse`` (default) raises an error, ``paginate``
+      returns the first page of `row_budget` cells.
+    * `statement_timeout` – maximal time of a statement execution in
+      seconds. Enforced by the database in PostgreSQL, MySQL and SQLite,
+      :class:`QueryTimeoutError` is raised when exceeded. Default is no
+      timeout.
+    * `max_rows` – maximal number of rows fetched by a query,
+      :class:`TooManyRowsError` is raised when exceeded. Default is no
+      limit.
+
+    The limits can be lowered for a request with :meth:`restrict_limits`,
+    which also accepts a cancellation event.
 
     Limitations:
 
@@ -95,6 +195,78 @@ class SQLBrowser(AggregationBrowser):
             "description": "Use internally SQL statement column labels " \
                            "without special characters",
             "type": "bool"
+        },
+        {
+            "name": "use_aggregate_tables",
+            "description": "Use pre-aggregated tables where possible",
+            "type": "bool"
+        },
+        {
+            "name": "use_grouping_sets",
+            "description": "Get summary and drilldown using single " \
+                           "statement where possible",
+            "type": "bool"
+        },
+        {
+            "name": "eliminate_joins",
+            "description": "Don't join dimension tables if only their " \
+                           "keys are needed",
+            "type": "bool"
+        },
+        {
+            "name": "stream_results",
+            "description": "Stream facts and drilldown cells from a " \
+                           "server side cursor",
+            "type": "bool"
+        },
+        {
+            "name": "yield_per",
+            "description": "Number of rows fetched at once",
+            "type": "int"
+        },
+        {
+            "name": "members_with_facts",
+            "description": "List only dimension members that have facts",
+            "type": "bool"
+        },
+        {
+            "name": "report_workers",
+            "description": "Number of report queries executed concurrently",
+            "type": "int"
+        },
+        {
+            "name": "cache_statements",
+            "description": "Cache compiled statements by query shape",
+            "type": "bool"
+        },
+        {
+            "name": "use_statistics",
+            "description": "Estimate number of cells from dimension " \
+                           "statistics",
+            "type": "bool"
+        },
+        {
+            "name": "row_budget",
+            "description": "Maximal estimated number of not paginated " \
+                           "drilldown cells",
+            "type": "int"
+        },
+        {
+            "name": "over_budget",
+            "description": "Refuse or paginate drilldowns over the row " \
+                           "budget",
+            "type": "string"
+        },
+        {
+            "name": "statement_timeout",
+            "description": "Maximal time of a statement execution in " \
+                           "seconds",
+            "type": "float"
+        },
+        {
+            "name": "max_rows",
+            "description": "Maximal number of rows fetched by a query",
+            "type": "int"
         }
 
     ]
@@ -141,6 +313,29 @@ class SQLBrowser(AggregationBrowser):
             self.logger.debug("using safe labels for cube {}"
                               .format(cube.name))
 
+        self.use_grouping_sets = options.get("use_grouping_sets", False)
+        self.eliminate_joins = options.get("eliminate_joins", False)
+
+        self.stream_results = options.get("stream_results", False)
+        self.yield_per = options.get("yield_per") or DEFAULT_YIELD_PER
+
+        self.members_with_facts = options.get("members_with_facts", False)
+        self.report_workers = options.get("report_workers") \
+                                or DEFAULT_REPORT_WORKERS
+
+        self.cache_statements = options.get("cache_statements", True)
+
+        self.use_statistics = options.get("use_statistics", False)
+        self.row_budget = options.get("row_budget")
+        self.over_budget = options.get("over_budget") or "refuse"
+        if self.over_budget not in ("refuse", "paginate"):
+            raise ArgumentError("Unknown over_budget option '{}', should be "
+                                "refuse or paginate"
+                                .format(self.over_budget))
+
+        self.limits = QueryLimits(timeout=options.get("statement_timeout"),
+                                  max_rows=options.get("max_rows"))
+
         # Whether to ignore cells where at least one aggregate is NULL
         # TODO: this is undocumented
         self.exclude_null_agregates = options.get("exclude_null_agregates",
@@ -161,34 +356,69 @@ class SQLBrowser(AggregationBrowser):
         self.logger.debug("using mapper %s for cube '%s' (locale: %s)" %
                           (str(mapper.__name__), cube.name, locale))
 
-        # Prepare the mappings of base attributes
-        #
         naming = distill_naming(options)
-        (fact_name, mappings) = map_base_attributes(cube, mapper,
-                                                    naming=naming,
-                                                    locale=locale)
-
         tables = options.get("tables")
-
-        # Prepare Join objects
-        if cube.joins:
-            joins = [to_join(join) for join in cube.joins]
+        aggregate_tables = options.get("aggregate_tables")
+
+        def create_schema():
+            star = self._create_star(mapper, naming, metadata, locale, tables)
+            cuboids = cuboids_from_options(cube, aggregate_tables)
+            # Query contexts and compiled statements are cached together
+            # with the star schema, since they are bound to its columns
+            return (star, {}, cuboids, {})
+
+        # Star schema construction is expensive – all the base attributes are
+        # mapped and the physical tables are reflected. The schema is shared
+        # by all browsers of the same store unless custom table expressions
+        # are used. See `SQLStore.flush_cache()` for invalidation.
+        if tables is None and hasattr(store, "star_schema"):
+            key = (cube.name, locale, mapper.__name__,
+                   tuple(sorted(naming.items())),
+                   fingerprint(aggregate_tables or []))
+            schema = store.star_schema(key, create_schema)
         else:
-            joins = []
+            schema = create_schema()
+
+        (self.star, self._contexts, self._cuboids, self._statements) = schema
+
+        # Aggregate navigator
+        # -------------------
+        #
+        # Pre-aggregated tables are registered in the store (see
+        # `SQLStore.create_cube_aggregate()`) or in the `aggregate_tables`
+        # option.
 
-        self.star = StarSchema(self.cube.name,
-                               metadata,
-                               mappings=mappings,
-                               fact=fact_name,
-                               joins=joins,
-                               schema=naming.schema,
-                               tables=tables)
+        self.use_aggregate_tables = options.get("use_aggregate_tables", True)
+        self.navigator = getattr(store, "navigator", None)
 
         # Extract hierarchies
         # -------------------
         #
         self.hierarchies = self.cube.distilled_hierarchies
 
+    def _create_star(self, mapper, naming, metadata, locale, tables):
+        """Creates a star schema of the browsed cube."""
+
+        # Prepare the mappings of base attributes
+        #
+        (fact_name, mappings) = map_base_attributes(self.cube, mapper,
+                                                    naming=naming,
+                                                    locale=locale)
+
+        # Prepare Join objects
+        if self.cube.joins:
+            joins = [to_join(join) for join in self.cube.joins]
+        else:
+            joins = []
+
+        return StarSchema(self.cube.name,
+                          metadata,
+                          mappings=mappings,
+                          fact=fact_name,
+                          joins=joins,
+                          schema=naming.schema,
+                          tables=tables)
+
     def features(self):
         """Return SQL features. Currently they are all the same for every
         cube, however in the future they might depend on the SQL engine or
@@ -202,11 +432,44 @@ class SQLBrowser(AggregationBrowser):
 
         return features
 
+    def cardinality_estimator(self):
+        """Returns the cardinality estimator of the store with statistics of
+        the browsed cube, if `use_statistics` is ``True``. The statistics
+        are collected in the background, ``None`` is returned until they are
+        available."""
+
+        if not self.use_statistics \
+                or not hasattr(self.store, "cardinality_estimator"):
+            return None
+
+        return self.store.cardinality_estimator(self.cube)
+
     def is_builtin_function(self, funcname):
         """Returns `True` if the function `funcname` is backend's built-in
-        function."""
+        function. Moving window functions are built-in if the database
+        supports window functions, see :meth:`window_functions`."""
+
+        return funcname in available_aggregate_functions() \
+                or funcname in self.window_functions()
+
+    def _plain_aggregates(self, aggregates):
+        """Returns ``True`` if all the `aggregates` are computed by aggregate
+        functions – there are no post-aggregation calculations and no moving
+        window functions."""
 
-        return funcname in available_aggregate_functions()
+        return all(not agg.function
+                   or agg.function in available_aggregate_functions()
+                   for agg in aggregates)
+
+    def window_functions(self):
+        """Returns list of moving window post-aggregation functions that are
+        computed in the database using window functions over the aggregated
+        rows instead of computing them on the fetched result."""
+
+        if not self.supports_window_functions():
+            return []
+
+        return available_window_functions(self.connectable.dialect.name)
 
     def fact(self, key_value, fields=None):
         """Get a single fact with key `key_value` from cube.
@@ -232,13 +495,18 @@ class SQLBrowser(AggregationBrowser):
         return record
 
     def facts(self, cell=None, fields=None, order=None, page=None,
-              page_size=None, fact_list=None):
+              page_size=None, fact_list=None, cursor=None):
         """Return all facts from `cell`, might be ordered and paginated.
 
         `fact_list` is a list of fact keys to be selected. Might be used to
         fetch multiple facts using single query instead of multiple `fact()`
         queries.
 
+        If `cursor` is not ``None`` then keyset pagination is used instead
+        of `page`: empty cursor requests the first page, the cursor for the
+        next page is in the `next_cursor` attribute of the result. The fact
+        key is used to make the order unique. See :meth:`paginate`.
+
         Number of SQL queries: 1.
         """
         attrs = self.cube.get_attributes(fields)
@@ -252,17 +520,67 @@ class SQLBrowser(AggregationBrowser):
             in_condition = self.star.fact_key_column.in_(fact_list)
             statement = statement.where(in_condition)
 
-        statement = paginate_query(statement, page, page_size)
-
         # TODO: use natural order
-        statement = order_query(statement,
-                                order,
-                                natural_order={},
-                                labels=labels)
+        return self.paginate(statement, labels, "facts", order,
+                             natural_order={},
+                             page=page,
+                             page_size=page_size,
+                             cursor=cursor,
+                             keys=[FACT_KEY_LABEL])
+
+    def paginate(self, statement, labels, label, order=None,
+                 natural_order=None, page=None, page_size=None, cursor=None,
+                 keys=None):
+        """Orders and paginates the `statement`, executes it and returns a
+        `ResultIterator`.
+
+        If `cursor` is ``None`` then the page is selected by offset,
+        otherwise keyset pagination is used: the page continues after the
+        row the `cursor` points to. Keyset pagination requires `page_size`
+        and `keys` – labels of columns that make the order unique. Unlike
+        the offset pagination, its cost does not grow with the page
+        number."""
+
+        if cursor is None:
+            statement = order_query(statement,
+                                    order,
+                                    natural_order,
+                                    labels=labels)
+            statement = paginate_query(statement, page, page_size)
 
-        cursor = self.execute(statement, "facts")
+            result = self.execute(statement, label, stream=True)
+            return ResultIterator(result, labels, self.yield_per,
+                                  limits=self.limits)
+
+        if not page_size:
+            raise ArgumentError("Page size is required for pagination "
+                                "with a cursor")
+
+        (statement, keys) = seek_query(statement,
+                                       order,
+                                       natural_order,
+                                       labels=labels,
+                                       keys=keys,
+                                       cursor=cursor,
+                                       page_size=page_size,
+                                       row_values=self.supports_row_values(),
+                                       explicit_nulls=nulls_are_largest(
+                                           self.connectable.dialect))
+
+        result = ResultIterator(self.execute(statement, label), labels,
+                                limits=self.limits)
+        result.fetch_page(keys, page_size)
 
-        return ResultIterator(cursor, labels)
+        return result
+
+    def supports_row_values(self):
+        """Returns ``True`` if the database supports row value comparison
+        such as ``(a, b) > (1, 2)``."""
+
+        # The version of the server is needed
+        self.server_version()
+
+        return supports_row_values(self.connectable.dialect)
 
     def test(self, aggregate=False):
         """Tests whether the statement can be constructed and executed. Does
@@ -287,9 +605,14 @@ class SQLBrowser(AggregationBrowser):
 
     def provide_members(self, cell, dimension, depth=None, hierarchy=None,
                         levels=None, attributes=None, page=None,
-                        page_size=None, order=None):
+                        page_size=None, order=None, cursor=None):
         """Return values for `dimension` with level depth `depth`. If `depth`
-        is ``None``, all levels are returned.
+        is ``None``, all levels are returned. If `cursor` is not ``None``
+        then keyset pagination is used, see :meth:`paginate`.
+
+        Members are selected only from the dimension tables when the `cell`
+        is not cut by other dimensions and the dimension is not in the fact
+        table. See the `members_with_facts` browser option.
 
         Number of database queries: 1.
         """
@@ -298,18 +621,26 @@ class SQLBrowser(AggregationBrowser):
             for level in levels:
                 attributes += level.attributes
 
-        (statement, labels) = self.denormalized_statement(attributes, cell)
+        statement = None
+        if not cell or all(str(cut.dimension) == str(dimension)
+                           for cut in cell.cuts):
+            statement = self.dimension_statement(attributes, cell)
+
+        if statement is not None:
+            (statement, labels) = statement
+        else:
+            (statement, labels) = self.denormalized_statement(attributes,
+                                                              cell)
         # Order and paginate
         #
         statement = statement.group_by(*statement.columns)
-        statement = order_query(statement,
-                                order,
-                                labels=labels)
-        statement = paginate_query(statement, page, page_size)
-
-        result = self.execute(statement, "members")
 
-        return ResultIterator(result, labels)
+        # All the selected attributes are unique together
+        return self.paginate(statement, labels, "members", order,
+                             page=page,
+                             page_size=page_size,
+                             cursor=cursor,
+                             keys=labels)
 
     def path_details(self, dimension, path, hierarchy=None):
         """Returns details for `path` in `dimension`. Can be used for
@@ -342,11 +673,363 @@ class SQLBrowser(AggregationBrowser):
 
         return member
 
-    def execute(self, statement, label=None):
+    def report(self, cell, queries):
+        """Executes report `queries`, see :meth:`AggregationBrowser.report`.
+
+        If `use_grouping_sets` is ``True`` then aggregations of the same
+        cell with the same built-in aggregates and a drill-down, but without
+        pagination, ordering or split, are fused into one grouping sets
+        statement where the database supports it (see
+        :meth:`grouping_sets_mode`). The rest of the queries are executed
+        concurrently, see :meth:`report_concurrency`.
+        """
+
+        for result_name, query in queries.items():
+            if not query.get("query"):
+                raise ArgumentError("No report query for '%s'" % result_name)
+
+        tasks = []
+        fused = set()
+
+        for names, query_cell, aggregates in self._fusable_queries(cell,
+                                                                  queries):
+            drilldowns = [Drilldown(queries[name]["drilldown"], query_cell)
+                          for name in names]
+            tasks.append(partial(self._fused_report_task, names, query_cell,
+                                 aggregates, drilldowns))
+            fused.update(names)
+
+        for result_name, query in queries.items():
+            if result_name not in fused:
+                tasks.append(partial(self._report_task, cell, result_name,
+                                     query))
+
+        workers = min(self.report_concurrency(), len(tasks))
+
+        if workers > 1:
+            pool = ThreadPool(workers)
+            try:
+                outputs = pool.map(lambda task: task(fetch=True), tasks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            outputs = [task(fetch=False) for task in tasks]
+
+        results = {}
+        for output in outputs:
+            results.update(output)
+
+        return dict((name, results[name]) for name in queries)
+
+    def report_concurrency(self):
+        """Returns number of threads that can execute report queries
+        concurrently: the `report_workers` option limited by the size of the
+        connection pool. Returns 1 if the browser uses a single connection,
+        for example an in-memory SQLite database, or if the connections can
+        not be used by multiple threads."""
+
+        engine = self.connectable
+        if not isinstance(engine, sqlalchemy.engine.Engine):
+            return 1
+
+        pool = engine.pool
+        if isinstance(pool, (sqlalchemy.pool.SingletonThreadPool,
+                             sqlalchemy.pool.StaticPool,
+                             sqlalchemy.pool.AssertionPool)):
+            return 1
+
+        # SQLite connections can not be shared between threads
+        if engine.dialect.name == "sqlite" \
+                and not isinstance(pool, sqlalchemy.pool.NullPool):
+            return 1
+
+        workers = self.report_workers
+        if isinstance(pool, sqlalchemy.pool.QueuePool):
+            workers = min(workers, pool.size())
+
+        return max(workers, 1)
+
+    def _report_task(self, cell, result_name, query, fetch=False):
+        """Executes a report query and returns a dictionary with the result.
+        If `fetch` is ``True`` then the result rows are fetched, so the
+        result can be used in other thread and the connection is returned to
+        the pool."""
+
+        result = self._report_query(cell, result_name, query)
+
+        if fetch:
+            if isinstance(result, AggregationResult):
+                result = result.cached()
+            elif isinstance(result, ResultIterator):
+                result.fetch_all()
+
+        return {result_name: result}
+
+    def _fused_report_task(self, names, cell, aggregates, drilldowns,
+                           fetch=False):
+        results = self.provide_fused_aggregates(cell, aggregates, drilldowns)
+        return dict(zip(names, results))
+
+    def _fusable_queries(self, cell, queries):
+        """Returns list of tuples (`names`, `cell`, `aggregates`) of report
+        aggregate queries that can be computed by one grouping sets
+        statement. Only groups of at least two queries are returned."""
+
+        if not self.use_grouping_sets \
+                or self.grouping_sets_mode() is None \
+                or self.exclude_null_agregates:
+            return []
+
+        groups = []
+
+        for result_name, query in queries.items():
+            if query.get("query") != "aggregate" \
+                    or not query.get("drilldown") \
+                    or not FUSABLE_ARGUMENTS.issuperset(query.keys()):
+                continue
+
+            aggregates = self.prepare_aggregates(query.get("aggregates"))
+            if not self._plain_aggregates(aggregates):
+                continue
+
+            rollup = query.get("rollup")
+            query_cell = cell.rollup(rollup) if rollup else cell
+            if query_cell is None:
+                query_cell = Cell(self.cube)
+
+            drilldown = Drilldown(query["drilldown"], query_cell)
+            if self.find_cuboid(query_cell, aggregates, drilldown):
+                continue
+
+            # Fused results are not paginated
+            if self.over_budget == "paginate" \
+                    and self.exceeds_row_budget(query_cell, drilldown):
+                continue
+
+            refs = [agg.ref for agg in aggregates]
+            for group in groups:
+                if group[1] == query_cell and group[3] == refs:
+                    group[0].append(result_name)
+                    break
+            else:
+                groups.append(([result_name], query_cell, aggregates, refs))
+
+        return [(names, query_cell, aggregates)
+                for (names, query_cell, aggregates, refs) in groups
+                if len(names) > 1]
+
+    def provide_fused_aggregates(self, cell, aggregates, drilldowns):
+        """Returns list of aggregation results of the `cell`, one for each of
+        the `drilldowns`, using one grouping sets statement. The results have
+        the same summary and the cells are in the natural order of the
+        drill-downs. The cells are fetched and the results are not
+        paginated. The row budget and the maximal number of rows apply to
+        each of the drill-downs.
+
+        Number of database queries: 1.
+        """
+
+        for drilldown in drilldowns:
+            self.assert_low_cardinality(cell, drilldown)
+
+        (statement, labels) = self.grouping_sets_statement(cell,
+                                                           aggregates,
+                                                           [None] + drilldowns)
+
+        grouped = statement.alias("grouped")
+        columns = collections.OrderedDict(zip(labels, grouped.columns))
+
+        # Columns of other grouping sets are NULL, therefore the natural
+        # orders of all the drilldowns can be chained
+        ordering = [columns[GROUPING_SET_LABEL]]
+        for drilldown in drilldowns:
+            ordering += order_columns(columns, None, drilldown.natural_order)
+
+        statement = sql.expression.select(list(grouped.columns),
+                                          from_obj=grouped)
+        statement = statement.order_by(*ordering)
+
+        cursor = self.execute(statement, "fused aggregations")
+
+        sets = [[] for drilldown in [None] + drilldowns]
+        try:
+            for row in cursor:
+                rows = sets[row[-1]]
+                rows.append(row)
+                self.limits.check_rows(len(rows))
+        finally:
+            cursor.close()
+
+        layout = RowLayout(labels)
+        agg_refs = [agg.ref for agg in aggregates]
+
+        if sets[0]:
+            summary = dict(zip(agg_refs, layout.getter(agg_refs)(sets[0][0])))
+        else:
+            summary = None
+
+        results = []
+        for drilldown, rows in zip(drilldowns, sets[1:]):
+            result = AggregationResult(cell=cell, aggregates=aggregates,
+                                       drilldown=drilldown)
+            result.levels = drilldown.result_levels()
+
+            refs = [attr.ref for attr in drilldown.all_attributes] + agg_refs
+            getter = layout.getter(refs)
+            cell_layout = RowLayout(refs)
+
+            result.summary = dict(summary) if summary is not None else None
+            result.cells = [ResultRow(cell_layout, getter(row))
+                            for row in rows]
+            result.labels = refs
+
+            if self.include_cell_count:
+                result.total_cell_count = len(rows)
+
+            results.append(result)
+
+        return results
+
+    def cell_details(self, cell=None, dimension=None):
+        """Returns details for the `cell`, see
+        :meth:`AggregationBrowser.cell_details`. Details of all the cut paths
+        of a dimension hierarchy are retrieved together using
+        :meth:`paths_details`.
+
+        Number of SQL queries: one per dimension hierarchy and path depth
+        used in the cuts.
+        """
+
+        if not cell:
+            return []
+
+        if dimension:
+            cuts = [cut for cut in cell.cuts
+                    if str(cut.dimension) == str(dimension)]
+        else:
+            cuts = cell.cuts
+
+        # Collect paths of each dimension hierarchy
+        groups = collections.OrderedDict()
+        for cut in cuts:
+            cut_dimension = self.cube.dimension(cut.dimension)
+            hierarchy = cut_dimension.hierarchy(cut.hierarchy)
+
+            if isinstance(cut, PointCut):
+                paths = [cut.path]
+            elif isinstance(cut, SetCut):
+                paths = cut.paths
+            elif isinstance(cut, RangeCut):
+                paths = [cut.from_path, cut.to_path]
+            else:
+                paths = []
+
+            key = (cut_dimension.name, hierarchy.name)
+            group = groups.setdefault(key, (cut_dimension, hierarchy, []))
+            group[2].extend(path for path in paths if path)
+
+        records = {}
+        for key, (cut_dimension, hierarchy, paths) in groups.items():
+            records[key] = self.paths_details(cut_dimension, paths, hierarchy)
+
+        def path_details(dimension, path, hierarchy=None):
+            # Open range boundaries are resolved as before
+            if not path:
+                return self._path_details(dimension, path, hierarchy)
+
+            hierarchy = dimension.hierarchy(hierarchy)
+            details = records[(dimension.name, hierarchy.name)]
+            record = details.get(_path_key(path))
+
+            return self._format_path_details(dimension, hierarchy, path,
+                                             record)
+
+        return [self._cut_details(cut, path_details) for cut in cuts]
+
+    def paths_details(self, dimension, paths, hierarchy=None):
+        """Returns details for multiple `paths` of `dimension`. The result is
+        a dictionary where keys are tuples of path values converted to
+        strings and values are records as returned by :meth:`path_details`.
+        Paths without details are not included.
+
+        The details are selected from the dimension tables, if possible (see
+        :meth:`dimension_statement`).
+
+        Number of SQL queries: one per distinct path length.
+        """
+
+        dimension = self.cube.dimension(dimension)
+        hierarchy = dimension.hierarchy(hierarchy)
+
+        by_depth = {}
+        for path in paths:
+            by_depth.setdefault(len(path), []).append(path)
+
+        details = {}
+
+        for depth, depth_paths in sorted(by_depth.items()):
+            levels = hierarchy.levels_for_depth(depth)
+            attributes = []
+            for level in levels:
+                attributes += level.attributes
+
+            cut = SetCut(dimension, depth_paths, hierarchy=hierarchy)
+            cell = Cell(self.cube, [cut])
+
+            statement = self.dimension_statement(attributes, cell)
+            if statement is None:
+                statement = self.denormalized_statement(attributes, cell)
+
+            (statement, labels) = statement
+            statement = statement.group_by(*statement.columns)
+
+            keys = [level.key.ref for level in levels]
+            for row in self.execute(statement, "paths details"):
+                record = dict(zip(labels, row))
+                path = _path_key(record[key] for key in keys)
+                details.setdefault(path, record)
+
+        return details
+
+    def execute(self, statement, label=None, stream=False):
         """Execute the `statement`, optionally log it. Returns the result
-        cursor."""
+        cursor. If `stream` is ``True`` and the browser option
+        `stream_results` is set, then the rows are streamed from a server
+        side cursor, where the database driver supports it."""
         self._log_statement(statement, label)
-        return self.connectable.execute(statement)
+
+        if stream and self.stream_results:
+            statement = statement.execution_options(stream_results=True,
+                                                    max_row_buffer=self.yield_per)
+
+        return self._execute(statement)
+
+    def _execute(self, statement, params=None):
+        """Executes the `statement` (an expression or a compiled statement)
+        with `params` within the browser's limits. Raises
+        :class:`QueryTimeoutError` or :class:`QueryCancelledError` if the
+        database stopped the statement."""
+
+        if not self.limits or not hasattr(self.connectable, "pool"):
+            if params:
+                return self.connectable.execute(statement, params)
+            else:
+                return self.connectable.execute(statement)
+
+        self.limits.check()
+
+        connection = limited_connection(self.connectable, self.limits,
+                                        self.limits.deadline())
+        try:
+            if params:
+                return connection.execute(statement, params)
+            else:
+                return connection.execute(statement)
+        except sqlalchemy.exc.DBAPIError as e:
+            if is_timeout_error(e):
+                raise self.limits.timeout_error()
+            raise
 
     def provide_aggregate(self, cell, aggregates, drilldown, split, order,
                           page, page_size, **options):
@@ -373,7 +1056,17 @@ class SQLBrowser(AggregationBrowser):
         * `include_summary`: if ``True`` (default) then summary is computed,
           otherwise it will be ``None``
 
-        Result is paginated by `page_size` and ordered by `order`.
+        Result is paginated by `page_size` and ordered by `order`. If
+        `cursor` option is not ``None`` then the drill-down is paginated
+        using keyset pagination, see :meth:`paginate`. The cursor of the next
+        page is in the `next_cursor` attribute of the result.
+
+        If `top` option is a number then only that many best cells ranked by
+        `order` are returned – by the first aggregate in descending order if
+        the `order` is not specified. The remaining cells are collapsed into
+        one row in `result.remainder` unless the `remainder` option is
+        ``False``, see :meth:`_provide_top_cells`. The `top` can not be
+        combined with `split` or pagination.
 
         Number of database queries:
 
@@ -387,22 +1080,93 @@ class SQLBrowser(AggregationBrowser):
 
         """
 
-        # TODO: implement reminder
+        top = options.get("top")
+        if top is not None:
+            try:
+                top = int(top)
+            except (TypeError, ValueError):
+                raise ArgumentError("Number of top cells should be an "
+                                    "integer, is '{}'".format(top))
+            if top < 1:
+                raise ArgumentError("Number of top cells should be at least "
+                                    "1, is {}".format(top))
+            if not drilldown:
+                raise ArgumentError("Top cells require a drilldown")
+            if split or page_size or options.get("cursor") is not None:
+                raise ArgumentError("Top cells can not be combined with "
+                                    "split or pagination")
 
         result = AggregationResult(cell=cell, aggregates=aggregates,
                                    drilldown=drilldown,
                                    has_split=split is not None)
 
+        # Note: `cursor` is used for the database cursors below
+        page_cursor = options.get("cursor")
+
+        if drilldown or split:
+            paginated = page_size and (page is not None
+                                       or page_cursor is not None)
+
+            if top is None and not paginated:
+                if self.over_budget == "paginate" \
+                        and self.exceeds_row_budget(cell, drilldown, split):
+                    self.logger.debug("drilldown exceeds the row budget, "
+                                      "returning the first page")
+                    page = page or 0
+                    page_size = self.row_budget
+                else:
+                    self.assert_low_cardinality(cell, drilldown, split)
+
+            result.estimated_cell_count = self.estimate_cell_count(cell,
+                                                                   drilldown,
+                                                                   split)
+            result.levels = drilldown.result_levels(include_split=bool(split))
+
+        # Merged sketches
+        # ---------------
+        #
+        # Sketches stored in pre-aggregated tables are merged by the browser
+        if top is None and page_cursor is None \
+                and sketch_aggregates(aggregates):
+            cuboid = self.find_cuboid(cell, aggregates, drilldown, split,
+                                      sketches=True)
+            if cuboid is not None:
+                self._provide_merged_aggregate(result, cuboid, cell,
+                                               aggregates, drilldown, split,
+                                               order, page, page_size)
+                return result
+
+        # Summary and drill-down in one statement
+        # ---------------------------------------
+
+        # Pre-aggregated tables are preferred to the single statement
+        grouped = bool(drilldown or split) and self.include_summary \
+                    and page_cursor is None \
+                    and top is None \
+                    and self._plain_aggregates(aggregates) \
+                    and self.use_grouping_sets \
+                    and self.grouping_sets_mode() is not None \
+                    and self.find_cuboid(cell, aggregates,
+                                         drilldown, split) is None
+
+        if grouped:
+            self._provide_grouped_aggregate(result, cell, aggregates,
+                                            drilldown, split, order,
+                                            page, page_size)
+
         # Summary
         # -------
 
-        if self.include_summary or not (drilldown or split):
-            (statement, labels) = self.aggregation_statement(cell,
-                                                             aggregates=aggregates,
-                                                             drilldown=drilldown,
-                                                             for_summary=True)
+        elif self.include_summary or not (drilldown or split):
+            build = partial(self.aggregation_statement, cell,
+                            aggregates=aggregates,
+                            drilldown=drilldown,
+                            for_summary=True)
 
-            cursor = self.execute(statement, "aggregation summary")
+            (cursor, labels) = self._execute_shaped("summary", build,
+                                                    "aggregation summary",
+                                                    cell, aggregates,
+                                                    drilldown)
             row = cursor.first()
 
             if row:
@@ -418,37 +1182,90 @@ class SQLBrowser(AggregationBrowser):
         #
         # Note that a split cell if present prepends the drilldown
 
-        if drilldown or split:
-            if not (page_size and page is not None):
-                self.assert_low_cardinality(cell, drilldown)
+        if top is not None:
+            self._provide_top_cells(result, cell, aggregates, drilldown,
+                                    order, top,
+                                    remainder=options.get("remainder", True))
 
-            result.levels = drilldown.result_levels(include_split=bool(split))
+        elif (drilldown or split) and not grouped:
             natural_order = drilldown.natural_order
 
             self.logger.debug("preparing drilldown statement")
 
-            (statement, labels) = self.aggregation_statement(cell,
-                                                             aggregates=aggregates,
-                                                             drilldown=drilldown,
-                                                             split=split)
+            # The statement is built only if it is not cached, once for
+            # both the count and the cells
+            built = []
+
+            def aggregation():
+                if not built:
+                    built.append(self.aggregation_statement(cell,
+                                                            aggregates=aggregates,
+                                                            drilldown=drilldown,
+                                                            split=split))
+                return built[0]
+
+            def count():
+                (statement, labels) = aggregation()
+                return (statement.alias().count(), None)
+
+            def ordered():
+                (statement, labels) = aggregation()
+                statement = order_query(statement, order, natural_order,
+                                        labels=labels)
+                statement = paginate_query(statement, page, page_size)
+                return (statement, labels)
+
             # Get the total cell count before the pagination
             #
             if self.include_cell_count:
-                count_statement = statement.alias().count()
-                counts = self.execute(count_statement)
+                (counts, _) = self._execute_shaped("count", count,
+                                                   "aggregation count",
+                                                   cell, aggregates,
+                                                   drilldown, split)
                 result.total_cell_count = counts.scalar()
 
+                # Refuse the drilldown before fetching any rows
+                if page_cursor is None:
+                    if page_size:
+                        rows = max(0, min(page_size,
+                                          result.total_cell_count
+                                          - (page or 0) * page_size))
+                    else:
+                        rows = result.total_cell_count
+                    self.limits.check_rows(rows)
+
             # Order and paginate
             #
-            statement = order_query(statement,
-                                    order,
-                                    natural_order,
-                                    labels=labels)
-            statement = paginate_query(statement, page, page_size)
-
-            cursor = self.execute(statement, "aggregation drilldown")
-
-            result.cells = ResultIterator(cursor, labels)
+            if page_cursor is None:
+                ordering = tuple((str(attr), direction)
+                                 for attr, direction in order or [])
+                (rows, labels) = self._execute_shaped("drilldown", ordered,
+                                                      "aggregation drilldown",
+                                                      cell, aggregates,
+                                                      drilldown, split,
+                                                      extra=(ordering, page,
+                                                             page_size),
+                                                      stream=True)
+                cells = ResultIterator(rows, labels, self.yield_per,
+                                       limits=self.limits)
+            else:
+                (statement, labels) = aggregation()
+
+                # Drill-down level keys are unique together in the result
+                keys = [attr.ref for attr in drilldown.key_attributes
+                        if attr.ref in labels]
+                if split:
+                    keys.insert(0, SPLIT_DIMENSION_NAME)
+
+                cells = self.paginate(statement, labels,
+                                      "aggregation drilldown",
+                                      order, natural_order,
+                                      cursor=page_cursor,
+                                      page_size=page_size,
+                                      keys=keys)
+
+            result.next_cursor = cells.next_cursor
+            result.cells = cells
             result.labels = labels
 
         # If exclude_null_aggregates is True then don't include cells where
@@ -460,16 +1277,447 @@ class SQLBrowser(AggregationBrowser):
 
         return result
 
-    def _create_context(self, attributes):
+    def _provide_merged_aggregate(self, result, cuboid, cell, aggregates,
+                                  drilldown, split, order, page, page_size):
+        """Fills the summary, cells and total cell count of `result` by
+        rolling-up the rows of pre-aggregated table `cuboid` in the browser.
+        Sketches of the sketch aggregates are merged, other aggregates are
+        rolled-up using their roll-up functions. The summary and the cells
+        are computed from one statement, the cells are ordered and
+        paginated in Python."""
+
+        (statement, labels) = self.cuboid_statement(cuboid, cell, aggregates,
+                                                    drilldown, split,
+                                                    rollup=False)
+
+        sketched = set(agg.ref for agg in sketch_aggregates(aggregates))
+        functions = [SKETCH_ROLLUP if agg.ref in sketched
+                     else ROLLUP_FUNCTIONS[agg.function.lower()]
+                     for agg in aggregates]
+
+        # Rows are ordered by the drilldown attributes, which precede the
+        # aggregates
+        width = len(labels) - len(aggregates)
+        summary = [None] * len(aggregates)
+        rows = []
+
+        result_rows = ResultIterator(self.execute(statement,
+                                                  "aggregation merge",
+                                                  stream=True),
+                                     labels, self.yield_per)
+
+        for key, group in itertools.groupby(result_rows.tuples(),
+                                            lambda row: row[:width]):
+            values = [None] * len(aggregates)
+            for row in group:
+                for i, function in enumerate(functions):
+                    values[i] = _rollup(function, values[i], row[width + i])
+
+            for i, function in enumerate(functions):
+                summary[i] = _rollup(function, summary[i], values[i])
+
+            rows.append(key + tuple(_rollup_result(function, value)
+                                    for function, value
+                                    in zip(functions, values)))
+
+        if self.include_summary or not (drilldown or split):
+            values = [_rollup_result(function, value)
+                      for function, value in zip(functions, summary)]
+            result.summary = dict(zip(labels[width:], values))
+
+        if drilldown or split:
+            if self.include_cell_count:
+                result.total_cell_count = len(rows)
+
+            rows = order_rows(rows, labels, order, drilldown.natural_order)
+            if page is not None and page_size:
+                rows = rows[page * page_size:(page + 1) * page_size]
+
+            layout = RowLayout(labels)
+            result.cells = [ResultRow(layout, row) for row in rows]
+            result.labels = labels
+
+    # Statement cache
+    # ===============
+    #
+    # Statements of the same shape – same structure of the cell and split
+    # conditions, aggregates, drilldown, order and page – are compiled once
+    # and executed with the condition values as parameters.
+
+    def _cell_condition(self, context, cell, prefix=CELL_PARAMETER):
+        """Returns condition of the `cell` with the values passed as
+        parameters named with `prefix`, see :func:`bind_parameters`.
+        Returns ``None`` for an empty cell."""
+
+        condition = context.condition_for_cell(cell)
+        if condition is None:
+            return None
+
+        return bind_parameters(condition, prefix)[0]
+
+    def _split_column(self, context, split):
+        """Returns the split column with the values of the `split` cell
+        condition passed as parameters."""
+
+        condition = self._cell_condition(context, split, SPLIT_PARAMETER)
+        return context.column_for_split(split, condition=condition)
+
+    def _cuts_shape(self, cell):
+        """Returns a tuple describing the cuts of the `cell` – dimension,
+        hierarchy, level depth and type of each cut. Conditions of cuts of
+        different dimensions might differ only in the tables compared."""
+
+        return tuple((str(cut.dimension),
+                      str(cut.hierarchy) if cut.hierarchy else None,
+                      cut.level_depth(),
+                      type(cut).__name__)
+                     for cut in cell.cuts)
+
+    def _condition_parameters(self, cell, split=None, cuboid=None):
+        """Returns a tuple (`signature`, `params`) of the conditions of the
+        `cell` and `split` – structure of the conditions and values of their
+        parameters. The conditions are created in the context of the
+        `cuboid`, if specified, as the pre-aggregated tables might have
+        different conditions."""
+
+        refs = collect_attributes([], cell, split)
+        refs = list(collections.OrderedDict.fromkeys(attr.ref
+                                                     for attr in refs))
+
+        if not refs:
+            return (None, {})
+
+        if cuboid is not None:
+            context = self._cuboid_context(cuboid, refs)
+        else:
+            context = self._create_context(self.cube.get_attributes(refs))
+
+        signature = []
+        params = {}
+
+        for (condition_cell, prefix) in ((cell, CELL_PARAMETER),
+                                         (split, SPLIT_PARAMETER)):
+            condition = context.condition_for_cell(condition_cell)
+            if condition is None:
+                signature.append(None)
+                continue
+
+            (_, values, structure) = bind_parameters(condition, prefix)
+            signature.append((self._cuts_shape(condition_cell), structure))
+            params.update(values)
+
+        return (tuple(signature), params)
+
+    def _execute_shaped(self, kind, build, label, cell, aggregates,
+                        drilldown, split=None, extra=(), stream=False):
+        """Executes statement of `kind` returned by `build` and returns a
+        tuple (`result`, `labels`). `build` is a function returning a tuple
+        (`statement`, `labels`). `extra` is a tuple of other arguments the
+        statement depends on, such as order and page.
+
+        If `cache_statements` is ``True`` then the statement is compiled and
+        cached by its shape and it is executed with values of the `cell`
+        and `split` conditions as parameters. The statement is not built
+        again for queries of the same shape."""
+
+        if not self.cache_statements:
+            (statement, labels) = build()
+            return (self.execute(statement, label, stream=stream), labels)
+
+        cuboid = self.find_cuboid(cell, aggregates, drilldown, split)
+        (signature, params) = self._condition_parameters(cell, split, cuboid)
+
+        if cuboid is not None:
+            cuboid_key = (cuboid.schema, cuboid.table)
+        else:
+            cuboid_key = None
+
+        stream = stream and self.stream_results
+        shape = (kind, signature,
+                 tuple(agg.ref for agg in aggregates),
+                 tuple(drilldown.items_as_strings()) if drilldown else (),
+                 cuboid_key,
+                 self.safe_labels,
+                 self.eliminate_joins,
+                 tuple(self.window_functions()),
+                 self.yield_per if stream else None) + tuple(extra)
+
+        try:
+            (compiled, labels) = self._statements[shape]
+        except KeyError:
+            (statement, labels) = build()
+
+            if stream:
+                statement = statement.execution_options(stream_results=True,
+                                                        max_row_buffer=self.yield_per)
+
+            compiled = statement.compile(dialect=self.connectable.dialect)
+
+            # Keep the cache bounded, see `_create_context()`
+            if len(self._statements) >= STATEMENT_CACHE_SIZE:
+                self._statements.clear()
+            self._statements[shape] = (compiled, labels)
+
+        self._log_statement(compiled, label)
+
+        return (self._execute(compiled, params), labels)
+
+    def grouping_sets_mode(self):
+        """Returns how the grouping sets statement is executed in the
+        database: ``native`` for databases supporting ``GROUPING SETS``,
+        ``union`` for databases that support window functions, where the
+        grouping sets are emulated with ``UNION ALL``. Returns ``None`` if the
+        database supports neither."""
+
+        dialect = self.connectable.dialect
+        version = dialect.server_version_info
+
+        if dialect.name == "postgresql":
+            if version is None or version >= (9, 5):
+                return "native"
+        elif dialect.name == "sqlite":
+            if self.server_version() >= (3, 25):
+                return "union"
+        elif dialect.name == "mysql":
+            if self.server_version() >= (8, ):
+                return "union"
+
+        return None
+
+    def server_version(self):
+        """Returns version of the database server as a tuple, as reported
+        by SQLAlchemy. The version is known after the first connection to
+        the database, therefore a connection is opened if necessary. Returns
+        an empty tuple if the version is not known."""
+
+        dialect = self.connectable.dialect
+
+        if dialect.server_version_info is None:
+            self.connectable.connect().close()
+
+        return dialect.server_version_info or ()
+
+    def _provide_grouped_aggregate(self, result, cell, aggregates, drilldown,
+                                   split, order, page, page_size):
+        """Fills the summary, cells and total cell count of `result` using
+        single grouping sets statement. The summary is the first row of the
+        result, the cells are ranked by the requested order and paginated
+        within the statement. The total cell count is counted over all the
+        rows before pagination."""
+
+        (statement, labels) = self.grouping_sets_statement(cell,
+                                                           aggregates,
+                                                           [None, drilldown],
+                                                           split=split)
+
+        grouped = statement.alias("grouped")
+        columns = collections.OrderedDict(zip(labels, grouped.columns))
+        marker = columns[GROUPING_SET_LABEL]
+
+        ordering = order_columns(columns, order, drilldown.natural_order)
+        rank = sql.expression.func.row_number() \
+                .over(partition_by=marker, order_by=ordering) \
+                .label("__rank__")
+        count = sql.expression.func.count().over().label("__count__")
+
+        ranked = sql.expression.select(list(grouped.columns) + [rank, count])
+        ranked = ranked.alias("ranked")
+
+        # Summary is the grouping set 0 and it is never paginated
+        if page is not None and page_size:
+            offset = page * page_size
+            rank = ranked.c["__rank__"]
+            in_page = sql.expression.and_(rank > offset,
+                                          rank <= offset + page_size)
+            condition = sql.expression.or_(ranked.c[GROUPING_SET_LABEL] == 0,
+                                           in_page)
+        else:
+            condition = None
+
+        selection = [ranked.c[column.name] for column in grouped.columns]
+        selection.append(ranked.c["__count__"])
+        statement = sql.expression.select(selection,
+                                          from_obj=ranked,
+                                          whereclause=condition)
+        statement = statement.order_by(ranked.c[GROUPING_SET_LABEL],
+                                       ranked.c["__rank__"])
+
+        cursor = self.execute(statement, "aggregation grouping sets")
+
+        # The grouping set column and the count are the last two columns of
+        # the row, after the drilldown attributes and aggregates
+        summary = cursor.fetchone()
+        agg_labels = labels[-len(aggregates) - 1:-1]
+        agg_values = summary[-len(aggregates) - 2:-2]
+        result.summary = dict(zip(agg_labels, agg_values))
+
+        # Count over all the rows includes the summary row
+        total_cell_count = summary[-1] - 1
+        if self.include_cell_count:
+            result.total_cell_count = total_cell_count
+
+        # Refuse the drilldown before fetching any rows, as in
+        # `provide_aggregate()`
+        if page is not None and page_size:
+            rows = max(0, min(page_size, total_cell_count - page * page_size))
+        else:
+            rows = total_cell_count
+
+        try:
+            self.limits.check_rows(rows)
+        except QueryLimitError:
+            cursor.close()
+            raise
+
+        # Only the drilldown rows remain in the cursor. The trailing grouping
+        # set and count columns are cut off by the shorter list of labels.
+        labels = labels[:-1]
+        result.cells = ResultIterator(cursor, labels, limits=self.limits)
+        result.labels = labels
+
+    def _provide_top_cells(self, result, cell, aggregates, drilldown, order,
+                           top, remainder=True):
+        """Fills the cells, remainder and total cell count of `result` with
+        `top` cells ranked by `order` and with the remaining cells collapsed
+        into one row, using single statement. The drill-down rows are ranked
+        by a window function, the rows ranked below `top` share one group
+        which is aggregated again. Aggregates that can be rolled-up (see
+        `ROLLUP_FUNCTIONS`) are computed for the remainder, other aggregates
+        of the remainder are ``None``. If `remainder` is ``False`` then the
+        remaining cells are not aggregated."""
+
+        if not self.supports_window_functions():
+            raise ArgumentError("Top cells are not supported by the "
+                                "database '{}'"
+                                .format(self.connectable.dialect.name))
+
+        (statement, labels) = self.aggregation_statement(cell,
+                                                         aggregates=aggregates,
+                                                         drilldown=drilldown)
+
+        grouped = statement.alias("grouped")
+        columns = collections.OrderedDict(zip(labels, grouped.columns))
+
+        if not order:
+            ranking = [agg for agg in aggregates if agg.ref in columns]
+            order = [(ranking[0], "desc")] if ranking else []
+
+        ordering = order_columns(columns, order, drilldown.natural_order)
+        rank = sql.expression.func.row_number() \
+                .over(order_by=ordering) \
+                .label("__rank__")
+        count = sql.expression.func.count().over().label("__count__")
+
+        ranked = sql.expression.select(list(grouped.columns) + [rank, count])
+        ranked = ranked.alias("ranked")
+
+        # Rank of a top cell or one rank for all the remaining cells
+        bucket = sql.expression.case([(ranked.c["__rank__"] <= top,
+                                       ranked.c["__rank__"])],
+                                     else_=top + 1)
+        bucketed = sql.expression.select(list(ranked.columns)
+                                         + [bucket.label("__bucket__")])
+        bucketed = bucketed.alias("bucketed")
+        bucket = bucketed.c["__bucket__"]
+
+        rollups = {}
+        for agg in aggregates:
+            function = (agg.function or "").lower()
+            if not (agg.expression or agg.nonadditive) \
+                    and function in ROLLUP_FUNCTIONS:
+                rollups[agg.ref] = ROLLUP_FUNCTIONS[function]
+
+        # There is only one row in a group of a top cell, therefore any
+        # aggregate function returns the value of the cell
+        selection = []
+        for label, column in columns.items():
+            name = column.name
+            column = bucketed.c[name]
+            if label in rollups:
+                function = getattr(sql.expression.func, rollups[label])
+                column = function(column)
+            else:
+                column = sql.expression.case([(bucket <= top,
+                                               sql.expression.func.max(column))])
+            selection.append(column.label(name))
+
+        if remainder:
+            condition = None
+        else:
+            condition = bucket <= top
+
+        selection.append(sql.expression.func.max(bucketed.c["__count__"]))
+        selection.append(bucket)
+
+        statement = sql.expression.select(selection,
+                                          from_obj=bucketed,
+                                          whereclause=condition,
+                                          group_by=[bucket])
+        statement = statement.order_by(bucket)
+
+        rows = self.execute(statement, "aggregation top").fetchall()
+
+        layout = RowLayout(labels)
+        cells = []
+
+        for row in rows:
+            if row[-1] > top:
+                values = dict(zip(labels, row))
+                result.remainder = dict((agg.ref, values.get(agg.ref))
+                                        for agg in aggregates
+                                        if agg.ref in values)
+            else:
+                cells.append(ResultRow(layout, tuple(row)))
+
+        if self.include_cell_count:
+            result.total_cell_count = rows[0][-2] if rows else 0
+
+        result.cells = cells
+        result.labels = labels
+
+    def supports_window_functions(self):
+        """Returns ``True`` if the database supports window functions."""
+
+        dialect = self.connectable.dialect
+
+        if dialect.name == "sqlite":
+            return self.server_version() >= (3, 25)
+        elif dialect.name == "mysql":
+            return self.server_version() >= (8, )
+        else:
+            return dialect.name in ("postgresql", "oracle", "mssql")
+
+    def _create_context(self, attributes, dimension_only=False):
         """Create a query context for `attributes`. The `attributes` should
-        contain all attributes that will be somehow involved in the query."""
+        contain all attributes that will be somehow involved in the query.
+        If `dimension_only` is ``True`` then the context star does not
+        contain the fact table."""
 
         collected = self.cube.collect_dependencies(attributes)
-        return QueryContext(self.star,
-                            attributes=collected,
-                            hierarchies=self.hierarchies,
-                            parameters=None,
-                            safe_labels=self.safe_labels)
+
+        key = (tuple(attr.ref for attr in collected), self.safe_labels,
+               self.eliminate_joins, dimension_only)
+        try:
+            return self._contexts[key]
+        except KeyError:
+            pass
+
+        context = QueryContext(self.star,
+                               attributes=collected,
+                               hierarchies=self.hierarchies,
+                               parameters=None,
+                               safe_labels=self.safe_labels,
+                               dialect=self.connectable.dialect,
+                               eliminate_joins=self.eliminate_joins,
+                               dimension_only=dimension_only)
+
+        # Keep the cache bounded. Contexts are cheap to re-create compared to
+        # the cost of tracking their usage.
+        if len(self._contexts) >= CONTEXT_CACHE_SIZE:
+            self._contexts.clear()
+        self._contexts[key] = context
+
+        return context
 
     def denormalized_statement(self, attributes=None, cell=None,
                                include_fact_key=False):
@@ -501,6 +1749,48 @@ class SQLBrowser(AggregationBrowser):
 
         return (statement, context.get_labels(statement.columns))
 
+    def dimension_statement(self, attributes, cell=None):
+        """Returns a tuple (`statement`, `labels`) selecting `attributes`
+        restricted by `cell` only from the dimension tables, without the fact
+        table. If `members_with_facts` option is set, then only rows joined
+        to at least one fact are selected. Returns ``None`` if the attributes
+        can not be selected without the fact table, for example for flat
+        dimensions stored in the fact table."""
+
+        refs = [attr.ref for attr in collect_attributes(attributes, cell)]
+        context_attributes = self.cube.get_attributes(refs)
+        base = [attr.ref for attr
+                in self.cube.collect_dependencies(context_attributes)
+                if attr.is_base]
+
+        if self.star.dimension_tables(base) is None:
+            return None
+
+        context = self._create_context(context_attributes,
+                                       dimension_only=True)
+
+        names = [attr.ref for attr in attributes]
+        selection = context.get_columns(names)
+
+        conditions = []
+        if cell:
+            conditions.append(context.condition_for_cell(cell))
+        if self.members_with_facts:
+            exists = self.star.fact_exists_condition(base)
+            if exists is not None:
+                conditions.append(exists)
+
+        if conditions:
+            condition = sql.expression.and_(*conditions)
+        else:
+            condition = None
+
+        statement = sql.expression.select(selection,
+                                          from_obj=context.star,
+                                          whereclause=condition)
+
+        return (statement, context.get_labels(statement.columns))
+
     # Aggregate
     # =========
     #
@@ -543,9 +1833,39 @@ class SQLBrowser(AggregationBrowser):
                           (",".join([compat.to_unicode(cut) for cut in cell.cuts]),
                            drilldown, for_summary))
 
+        cuboid = self.find_cuboid(cell, aggregates, drilldown, split)
+        if cuboid is not None:
+            return self.cuboid_statement(cuboid, cell, aggregates, drilldown,
+                                         split, for_summary)
+
+        # Post-aggregation calculations are not part of the statement, they
+        # are computed on the result. Moving window aggregates are computed
+        # over the aggregated source aggregates.
+        window_functions = self.window_functions()
+        windowed = [agg for agg in aggregates
+                    if agg.function in window_functions]
+
+        for agg in aggregates:
+            if agg.function and not self.is_builtin_function(agg.function) \
+                    and agg.function not in available_calculators():
+                raise ArgumentError("Unknown aggregate function '{}' for "
+                                    "aggregate '{}'"
+                                    .format(agg.function, agg.name))
+
+        aggregates = [agg for agg in aggregates
+                      if not agg.function
+                      or agg.function in available_aggregate_functions()]
+
+        sources = [self.cube.aggregate(agg.measure) for agg in windowed]
+
+        if not aggregates and not windowed:
+            raise ArgumentError("No aggregates to be computed by the "
+                                "database")
+
         # TODO: it is verylikely that the _create_context is not getting all
         # attributes, for example those that aggregate depends on
-        refs = collect_attributes(aggregates, cell, drilldown, split)
+        refs = collect_attributes(aggregates + sources, cell, drilldown,
+                                  split)
         attributes = self.cube.get_attributes(refs, aggregated=True)
         context = self._create_context(attributes)
 
@@ -561,17 +1881,20 @@ class SQLBrowser(AggregationBrowser):
         # SPLIT
         # -----
         if split:
-            selection.append(context.column_for_split(split))
+            selection.append(self._split_column(context, split))
 
         # WHERE
         # -----
-        condition = context.condition_for_cell(cell)
+        condition = self._cell_condition(context, cell)
 
         group_by = selection[:] if not for_summary else None
 
         # TODO: coalesce if there are outer joins
-        # TODO: ignore post-aggregations
-        aggregate_cols = context.get_columns([agg.ref for agg in aggregates])
+        # Sources of moving window aggregates are aggregated as well
+        agg_refs = [agg.ref for agg in aggregates]
+        agg_refs += [source.ref for source in sources
+                     if source.ref not in agg_refs]
+        aggregate_cols = context.get_columns(agg_refs)
 
         if for_summary:
             # Don't include the group-by part (see issue #157 for more
@@ -586,35 +1909,481 @@ class SQLBrowser(AggregationBrowser):
                                           whereclause=condition,
                                           group_by=group_by)
 
+        labels = context.get_labels(statement.columns)
+
+        if windowed:
+            (statement, labels) = self._window_statement(statement, labels,
+                                                         aggregates, windowed,
+                                                         drilldown, split)
+
+        return (statement, labels)
+
+    def _window_statement(self, statement, labels, aggregates, windowed,
+                          drilldown, split=None):
+        """Returns a tuple (`statement`, `labels`) where the `statement`
+        selects from the aggregation `statement` the drilldown attributes,
+        `aggregates` and moving window aggregates `windowed`. The window
+        function is applied on the aggregated source aggregate, the window is
+        partitioned by the window key and ordered by the natural order of the
+        `drilldown`. See :func:`cubes.query.statutils.window_parameters`."""
+
+        aggregated = statement.alias("aggregated")
+        columns = collections.OrderedDict(zip(labels, aggregated.columns))
+
+        # Source aggregates that were not requested are not selected
+        agg_refs = set(agg.ref for agg in aggregates)
+        sources = set(agg.measure for agg in windowed)
+        selection = [column for label, column in columns.items()
+                     if label not in sources or label in agg_refs]
+        labels = [label for label in columns.keys()
+                  if label not in sources or label in agg_refs]
+
+        ordering = order_columns(columns, None, drilldown.natural_order)
+
+        for i, agg in enumerate(windowed):
+            (window_key, window_size) = window_parameters(agg, drilldown,
+                                                          split)
+            partition = [columns[ref] for ref in window_key
+                         if ref in columns]
+            window = {
+                "partition_by": partition or None,
+                "order_by": ordering or None,
+                "rows": (-(window_size - 1), 0)
+            }
+
+            function = get_window_function(agg.function)
+            column = function(columns[agg.measure], window)
+
+            if self.safe_labels:
+                label = "w{}".format(i)
+            else:
+                label = agg.ref
+
+            selection.append(column.label(label))
+            labels.append(agg.ref)
+
+        # Conditions, ordering and pagination of the statement should not
+        # affect the windows, therefore the windows are computed in a
+        # subquery
+        windowed = sql.expression.select(selection).alias("windowed")
+        statement = sql.expression.select(list(windowed.columns))
+
+        return (statement, labels)
+
+    def find_cuboid(self, cell, aggregates, drilldown=None, split=None,
+                    sketches=False):
+        """Returns the smallest pre-aggregated table (`Cuboid`) that can be
+        used to aggregate `cell` by `drilldown` and `split`. Returns ``None``
+        if there is no such cuboid or pre-aggregated tables are not used.
+
+        Sketch aggregates (see `SKETCH_FUNCTIONS`) can not be rolled-up by
+        the database, they are merged by the browser. Cuboids are considered
+        for them only if `sketches` is ``True``."""
+
+        if not self.use_aggregate_tables:
+            return None
+
+        if not sketches and sketch_aggregates(aggregates):
+            return None
+
+        cuboids = list(self._cuboids)
+        if self.navigator is not None:
+            cuboids += self.navigator.cuboids(self.cube.name)
+
+        if not cuboids:
+            return None
+
+        refs = [attr.ref for attr in collect_attributes([], cell, drilldown,
+                                                        split)]
+
+        cuboid = smallest_cuboid(cuboids, refs, aggregates)
+
+        if cuboid is not None:
+            self.logger.debug("using aggregate table '%s' for cube '%s'"
+                              % (cuboid.table, self.cube.name))
+
+        return cuboid
+
+    def _cuboid_context(self, cuboid, refs):
+        """Returns a query context of the `cuboid` with attributes
+        `refs`."""
+
+        return QueryContext(cuboid.star_schema(self.star.metadata),
+                            attributes=cuboid.context_attributes(refs),
+                            hierarchies=self.hierarchies,
+                            safe_labels=self.safe_labels,
+                            dialect=self.connectable.dialect)
+
+    def cuboid_statement(self, cuboid, cell, aggregates, drilldown=None,
+                         split=None, for_summary=False, rollup=True):
+        """Builds a statement that aggregates the `cell` from pre-aggregated
+        table `cuboid`. The pre-aggregated values are aggregated again using
+        the roll-up functions of the aggregates. Arguments and return value
+        are the same as in :meth:`aggregation_statement`.
+
+        If `rollup` is ``False`` then the pre-aggregated values are selected
+        as they are, ordered by the drilldown attributes, to be rolled-up by
+        the browser. See :meth:`_provide_merged_aggregate`."""
+
+        refs = collect_attributes([], cell, drilldown, split)
+        refs = list(collections.OrderedDict.fromkeys(attr.ref
+                                                     for attr in refs))
+
+        star = cuboid.star_schema(self.star.metadata)
+        context = self._cuboid_context(cuboid, refs)
+
+        if drilldown:
+            selection = context.get_columns([attr.ref for attr in
+                                             drilldown.all_attributes])
+        else:
+            selection = []
+
+        if split:
+            selection.append(self._split_column(context, split))
+
+        condition = self._cell_condition(context, cell)
+
+        if not rollup:
+            aggregate_cols = [star.fact_table.columns[agg.ref]
+                              .label(agg.ref)
+                              for agg in aggregates]
+            ordering = selection[:]
+            statement = sql.expression.select(selection + aggregate_cols,
+                                              from_obj=context.star,
+                                              whereclause=condition)
+            statement = statement.order_by(*ordering)
+
+            return (statement, context.get_labels(statement.columns))
+
+        aggregate_cols = []
+        for aggregate in aggregates:
+            name = ROLLUP_FUNCTIONS[aggregate.function.lower()]
+            column = star.fact_table.columns[aggregate.ref]
+            column = getattr(sql.expression.func, name)(column)
+
+            if name == "sum":
+                column = sql.expression.func.coalesce(column, 0)
+
+            aggregate_cols.append(column.label(aggregate.ref))
+
+        if for_summary:
+            selection = aggregate_cols
+            group_by = None
+        else:
+            group_by = selection[:]
+            selection += aggregate_cols
+
+        statement = sql.expression.select(selection,
+                                          from_obj=context.star,
+                                          whereclause=condition,
+                                          group_by=group_by)
+
+        return (statement, context.get_labels(statement.columns))
+
+    def grouping_sets_statement(self, cell, aggregates, drilldowns,
+                                split=None):
+        """Builds a statement to aggregate the `cell` by multiple grouping
+        sets at once and returns a tuple (`statement`, `labels`).
+        `drilldowns` is a list of `Drilldown` objects, one for each grouping
+        set. ``None`` in the list stands for the summary – aggregation of the
+        whole cell. `split` is added to every grouping set except the summary.
+
+        Selected are attributes of all the drilldowns, the split column,
+        `aggregates` and a column labelled ``__grouping_set__`` with index of
+        the row's grouping set in the `drilldowns` list. Attributes that are
+        not part of the row's grouping set are ``NULL``.
+
+        The statement uses ``GROUPING SETS`` or ``UNION ALL`` of simple
+        aggregation statements, depending on :meth:`grouping_sets_mode`.
+        """
+
+        if not aggregates:
+            raise ArgumentError("List of aggregates should not be empty")
+
+        refs = collect_attributes(aggregates, cell, split, *drilldowns)
+        attributes = self.cube.get_attributes(refs, aggregated=True)
+        context = self._create_context(attributes)
+
+        # Attributes of all grouping sets in order of their appearance
+        dd_refs = []
+        sets = []
+        for drilldown in drilldowns:
+            if drilldown is None:
+                sets.append(None)
+                continue
+
+            set_refs = [attr.ref for attr in drilldown.all_attributes]
+            dd_refs += [ref for ref in set_refs if ref not in dd_refs]
+            sets.append(set_refs)
+
+        group_columns = context.get_columns(dd_refs)
+        if split:
+            dd_refs.append(SPLIT_DIMENSION_NAME)
+            group_columns.append(self._split_column(context, split))
+
+        condition = self._cell_condition(context, cell)
+        aggregate_cols = context.get_columns([agg.ref for agg in aggregates])
+
+        def is_grouped(set_refs, ref):
+            if set_refs is None:
+                return False
+            return ref == SPLIT_DIMENSION_NAME or ref in set_refs
+
+        if self.grouping_sets_mode() == "native" and group_columns:
+            # Columns are labelled, we group by the underlying expressions
+            expressions = [column.element for column in group_columns]
+            count = len(expressions)
+
+            # GROUPING() returns a bit mask of columns that are not part of
+            # the row's grouping set, the first column being the most
+            # significant bit
+            grouping = sql.expression.func.grouping(*expressions)
+            grouping_sets = []
+            whens = []
+
+            for i, set_refs in enumerate(sets):
+                grouped = [is_grouped(set_refs, ref) for ref in dd_refs]
+                mask = sum(1 << (count - j - 1)
+                           for j, flag in enumerate(grouped) if not flag)
+                whens.append((grouping == mask, i))
+
+                items = [expr for expr, flag in zip(expressions, grouped)
+                         if flag]
+                grouping_sets.append(sql.expression.tuple_(*items))
+
+            marker = sql.expression.case(whens).label(GROUPING_SET_LABEL)
+            group_by = sql.expression.func.grouping_sets(*grouping_sets)
+
+            selection = group_columns + aggregate_cols + [marker]
+            statement = sql.expression.select(selection,
+                                              from_obj=context.star,
+                                              whereclause=condition,
+                                              group_by=[group_by])
+        else:
+            selects = []
+            for i, set_refs in enumerate(sets):
+                selection = []
+                group_by = []
+
+                for ref, column in zip(dd_refs, group_columns):
+                    if is_grouped(set_refs, ref):
+                        selection.append(column)
+                        group_by.append(column)
+                    else:
+                        null = sql.expression.null()
+                        null = sql.expression.type_coerce(null, column.type)
+                        selection.append(null.label(column.name))
+
+                marker = sql.expression.literal_column(str(i),
+                                                       sqlalchemy.Integer)
+                selection += aggregate_cols
+                selection.append(marker.label(GROUPING_SET_LABEL))
+
+                select = sql.expression.select(selection,
+                                               from_obj=context.star,
+                                               whereclause=condition,
+                                               group_by=group_by or None)
+                selects.append(select)
+
+            statement = sql.expression.union_all(*selects)
+
         return (statement, context.get_labels(statement.columns))
 
     def _log_statement(self, statement, label=None):
+        # Compilation of the statement to string is not for free
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+
         label = "SQL(%s):" % label if label else "SQL:"
         self.logger.debug("%s\n%s\n" % (label, str(statement)))
 
 
+def _path_key(path):
+    """Returns a path as a tuple of strings, used to match paths from
+    requests with values from the database."""
+    return tuple(compat.to_unicode(value) if value is not None else None
+                 for value in path)
+
+
+def _rollup(function, current, value):
+    """Returns pre-aggregated `value` rolled-up into the `current` value
+    using roll-up `function` – one of the `ROLLUP_FUNCTIONS` values or
+    `SKETCH_ROLLUP` for serialized sketches."""
+
+    if value is None:
+        return current
+
+    if function == SKETCH_ROLLUP:
+        if not isinstance(value, HyperLogLog):
+            value = HyperLogLog.from_bytes(value)
+        if current is None:
+            current = HyperLogLog(value.precision)
+        current.merge(value)
+        return current
+    elif current is None:
+        return value
+    elif function == "sum":
+        return current + value
+    elif function == "min":
+        return min(current, value)
+    elif function == "max":
+        return max(current, value)
+    else:
+        raise InternalError("Unknown roll-up function '{}'".format(function))
+
+
+def _rollup_result(function, value):
+    """Returns the result of rolled-up `value` – count of a sketch, sums are
+    coalesced to 0."""
+
+    if function == SKETCH_ROLLUP:
+        return value.count() if value is not None else 0
+    elif function == "sum" and value is None:
+        return 0
+    else:
+        return value
+
+
 class ResultIterator(object):
     """
-    Iterator that returns SQLAlchemy ResultProxy rows as dictionaries
+    Iterator that returns SQLAlchemy ResultProxy rows as :class:`ResultRow`
+    records – mappings of labels to values sharing one label index. Rows
+    are fetched in batches of `batch_size` rows, default batch size of the
+    result is used if not specified. The result is closed when all rows are
+    fetched or when :meth:`close` is called.
+
+    Use :meth:`tuples` to get plain value tuples in order of `labels` or
+    :meth:`batches` to get fetched batches in columnar form.
+
+    If `limits` (a :class:`QueryLimits` object) are specified, then the
+    cancellation is checked before each batch is fetched and the number of
+    fetched rows is checked against the maximal number of rows.
     """
-    def __init__(self, result, labels):
+    def __init__(self, result, labels, batch_size=None, limits=None):
         self.result = result
         self.batch = None
         self.labels = labels
+        self.layout = RowLayout(labels)
+        self.batch_size = batch_size
         self.exclude_if_null = None
+        self.next_cursor = None
+        self.exhausted = False
+        self.limits = limits
+        self.row_count = 0
+
+    def close(self):
+        """Closes the underlying result and releases the database
+        connection. Required when a streamed result is not iterated
+        completely."""
+
+        self.result.close()
+        self.exhausted = True
+        self.batch = None
 
-    def __iter__(self):
-        while True:
-            if not self.batch:
-                many = self.result.fetchmany()
-                if not many:
-                    break
-                self.batch = collections.deque(many)
+    def fetch_all(self):
+        """Fetches all the remaining rows and releases the database
+        connection. The iterator can be used in other thread than the one
+        that executed the statement."""
+
+        if not self.exhausted:
+            fetched = self._fetch(self.result.fetchall)
+            rows = list(self.batch or []) + fetched
+            self.batch = collections.deque(rows)
+            self.result.close()
+            self.exhausted = True
+
+    def fetch_page(self, keys, page_size):
+        """Fetches rows of a page of a statement created by `seek_query()`,
+        which selects one row more than the `page_size`. `keys` are tuples
+        (`label`, `direction`) of the ordering columns. Sets `next_cursor`
+        to the cursor of the next page or to ``None`` if this is the last
+        page."""
+
+        rows = self._fetch(self.result.fetchmany, page_size + 1)
+        self.result.close()
+        self.exhausted = True
+
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = ResultRow(self.layout, rows[-1])
+            labels = [label for label, _ in keys]
+            self.next_cursor = encode_cursor(keys, last.pick(labels))
+
+        self.batch = collections.deque(rows)
+
+    def _fetch(self, fetch, *args):
+        """Fetches rows using the `fetch` method of the result within the
+        limits. The result is closed if a limit is exceeded."""
+
+        if self.limits is None:
+            return fetch(*args)
+
+        try:
+            self.limits.check()
+            rows = fetch(*args)
+            self.row_count += len(rows)
+            self.limits.check_rows(self.row_count)
+        except sqlalchemy.exc.DBAPIError as e:
+            self.close()
+            if is_timeout_error(e):
+                raise self.limits.timeout_error()
+            raise
+        except QueryLimitError:
+            self.close()
+            raise
+
+        return rows
+
+    def _fill_batch(self):
+        """Fetches next batch of rows, without the rows excluded by
+        `exclude_if_null`, if the current batch is empty. Returns ``False``
+        when there are no more rows."""
+
+        while not self.batch:
+            if self.exhausted:
+                return False
+
+            if self.batch_size:
+                rows = self._fetch(self.result.fetchmany, self.batch_size)
+            else:
+                rows = self._fetch(self.result.fetchmany)
 
-            row = self.batch.popleft()
+            if not rows:
+                self.close()
+                return False
 
-            if self.exclude_if_null \
-                    and any(row[agg] is None for agg in self.exclude_if_null):
-                continue
+            if self.exclude_if_null:
+                excluded = [self.layout.index[label]
+                            for label in self.exclude_if_null]
+                rows = [row for row in rows
+                        if not any(row[i] is None for i in excluded)]
+
+            self.batch = collections.deque(rows)
+
+        return True
 
-            yield dict(zip(self.labels, row))
+    def tuples(self):
+        """Yields rows as tuples of values in order of `labels`."""
+
+        width = len(self.labels)
+        while self._fill_batch():
+            batch = self.batch
+            while batch:
+                yield tuple(batch.popleft()[:width])
+
+    def batches(self):
+        """Yields fetched batches of rows as dictionaries of labels and lists
+        of column values."""
+
+        while self._fill_batch():
+            columns = zip(*self.batch)
+            self.batch = None
+            yield dict((label, list(column))
+                       for label, column in zip(self.labels, columns))
+
+    def __iter__(self):
+        layout = self.layout
+        while self._fill_batch():
+            batch = self.batch
+            while batch:
+                yield ResultRow(layout, batch.popleft())
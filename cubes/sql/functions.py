@@ -5,8 +5,10 @@
 # this type.
 
 try:
+    import sqlalchemy
     import sqlalchemy.sql as sql
-    from sqlalchemy.sql.functions import ReturnTypeFromArgs
+    from sqlalchemy.sql.functions import ReturnTypeFromArgs, FunctionElement
+    from sqlalchemy.ext.compiler import compiles
 except ImportError:
     from ...common import MissingPackage
     sqlalchemy = sql = MissingPackage("sqlalchemy", "SQL aggregation browser")
@@ -17,12 +19,20 @@ except ImportError:
             # Just fail by trying to call missing package
             missing_error()
 
+    FunctionElement = ReturnTypeFromArgs
+
+    def compiles(*args):
+        return lambda function: function
+
 from ..errors import ModelError
 
 
 __all__ = (
     "get_aggregate_function",
-    "available_aggregate_functions"
+    "available_aggregate_functions",
+    "APPROX_COUNT_DISTINCT_FUNCTIONS",
+    "get_window_function",
+    "available_window_functions",
 )
 
 
@@ -156,6 +166,36 @@ class avg(ReturnTypeFromArgs):
     pass
 
 
+# Native approximate distinct count functions by database dialect name. In
+# other databases the approximate distinct counts are computed from
+# HyperLogLog sketches by the browser.
+APPROX_COUNT_DISTINCT_FUNCTIONS = {
+    "bigquery": "APPROX_COUNT_DISTINCT",
+    "mssql": "APPROX_COUNT_DISTINCT",
+    "oracle": "APPROX_COUNT_DISTINCT",
+    "snowflake": "APPROX_COUNT_DISTINCT",
+    "presto": "approx_distinct",
+    "trino": "approx_distinct",
+}
+
+
+class approx_count_distinct(FunctionElement):
+    name = "approx_count_distinct"
+    type = sqlalchemy.types.Integer()
+
+
+@compiles(approx_count_distinct)
+def _compile_approx_count_distinct(element, compiler, **kw):
+    function = APPROX_COUNT_DISTINCT_FUNCTIONS.get(compiler.dialect.name)
+    argument = compiler.process(element.clauses, **kw)
+
+    if function:
+        return "{}({})".format(function, argument)
+    else:
+        # Exact count in the databases without approximation
+        return "COUNT(DISTINCT {})".format(argument)
+
+
 # Works with PostgreSQL
 class stddev(ReturnTypeFromArgs):
     pass
@@ -170,6 +210,7 @@ _functions = (
     SummaryCoalescingFunction("count_nonempty", sql.functions.count),
     FactCountFunction("count"),
     FactCountDistinctFunction("count_distinct"),
+    AggregateFunction("approx_count_distinct", approx_count_distinct),
     ValueCoalescingFunction("min", sql.functions.min),
     ValueCoalescingFunction("max", sql.functions.max),
     ValueCoalescingFunction("avg", avg),
@@ -200,3 +241,74 @@ def available_aggregate_functions():
     _create_function_dict()
     return _function_dict.keys()
 
+
+
+# Moving window aggregations
+# ==========================
+#
+# Moving window post-aggregation calculators (see `cubes.query.statutils`)
+# that can be computed with SQL window functions over the aggregated rows.
+# The functions take the aggregated source column and a dictionary of
+# arguments of the ``OVER`` clause.
+
+
+def _moving_average(column, window):
+    return avg(column).over(**window)
+
+
+def _moving_sum(column, window):
+    return sql.functions.sum(column).over(**window)
+
+
+def _moving_variance(column, window):
+    # Sample variance from the sums, as not all the databases have the
+    # variance function. Window of one value has variance 0.
+    column = sql.expression.cast(column, sqlalchemy.types.Float)
+    count = sql.functions.count(column).over(**window)
+    total = sql.functions.sum(column).over(**window)
+    squares = sql.functions.sum(column * column).over(**window)
+
+    variance = (squares - total * total / count) / (count - 1)
+    return sql.expression.case([(count > 1, variance)], else_=0)
+
+
+def _moving_stdev(column, window):
+    return sql.expression.func.sqrt(_moving_variance(column, window))
+
+
+def _moving_relative_stdev(column, window):
+    mean = _moving_average(column, window)
+    return sql.expression.case([(mean > 0,
+                                 _moving_stdev(column, window) / mean)],
+                               else_=0)
+
+
+_window_functions = {
+    "sma": _moving_average,
+    "sms": _moving_sum,
+    "smvar": _moving_variance,
+    "smstd": _moving_stdev,
+    "smrsd": _moving_relative_stdev,
+}
+
+# Functions that require square root – not available in SQLite
+_sqrt_window_functions = ("smstd", "smrsd")
+
+
+def get_window_function(name):
+    """Returns a moving window function `name`. The returned function takes
+    two arguments: aggregated source column and a dictionary of the
+    ``OVER`` clause arguments and returns a SQL expression."""
+
+    return _window_functions[name]
+
+
+def available_window_functions(dialect=None):
+    """Returns a list of names of moving window functions available in the
+    database `dialect` (dialect name)."""
+
+    if dialect == "sqlite":
+        return [name for name in _window_functions
+                if name not in _sqrt_window_functions]
+    else:
+        return list(_window_functions.keys())
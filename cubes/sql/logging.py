@@ -42,6 +42,7 @@ class SQLRequestLogHandler(RequestLogHandler):
                 Column('page_size', Integer),
                 Column('format', String(50)),
                 Column('header', String(50)),
+                Column('fingerprint', String(40)),
             ]
 
             self.table = Table(table, metadata, extend_existing=True, *columns)
@@ -88,6 +89,10 @@ class SQLRequestLogHandler(RequestLogHandler):
         connection = self.engine.connect()
         trans = connection.begin()
 
+        # Tables created by older versions might not have all the columns
+        record = dict((key, value) for key, value in record.items()
+                      if key in self.table.columns)
+
         insert = self.table.insert().values(record)
         result = connection.execute(insert)
         query_id = result.inserted_primary_key[0]
@@ -0,0 +1,263 @@
+# -*- encoding=utf -*-
+"""Aggregate navigator – routing of aggregation queries to pre-aggregated
+tables (cuboids)."""
+
+from __future__ import absolute_import
+
+from collections import namedtuple
+
+from ..errors import ArgumentError
+from ..metadata import string_to_dimension_level
+from .. import compat
+
+from .query import Column, StarSchema
+
+
+__all__ = (
+    "Cuboid",
+    "AggregateNavigator",
+    "ROLLUP_FUNCTIONS",
+    "SKETCH_FUNCTIONS",
+)
+
+
+# Functions that can be used to aggregate already aggregated values. Keys
+# are aggregate functions, values are functions used to roll-up the
+# pre-aggregated values.
+ROLLUP_FUNCTIONS = {
+    "sum": "sum",
+    "count": "sum",
+    "count_nonempty": "sum",
+    "min": "min",
+    "max": "max",
+}
+
+# Functions of aggregates that are stored in pre-aggregated tables as
+# mergeable sketches (see :class:`cubes.query.HyperLogLog`). The sketches are
+# merged on roll-up by the browser.
+SKETCH_FUNCTIONS = ("approx_count_distinct", )
+
+
+"""Attribute of a cuboid – pre-aggregated values are always directly
+represented by columns. See `QueryContext` for more information."""
+CuboidAttribute = namedtuple("CuboidAttribute", ["ref", "is_base",
+                                                 "expression"])
+
+
+class Cuboid(object):
+    """Pre-aggregated table of a cube. The table contains one column for
+    each attribute of the grain levels and one column for each aggregate.
+    Columns are named by the attribute and aggregate references, as created
+    by :meth:`SQLStore.create_cube_aggregate`."""
+
+    def __init__(self, cube, table, attributes, aggregates, schema=None,
+                 row_count=None):
+        """Creates a cuboid description.
+
+        * `cube` – name of the aggregated cube
+        * `table` – name of the pre-aggregated table
+        * `attributes` – references of dimension attributes in the table
+        * `aggregates` – references of aggregates in the table
+        * `schema` – database schema of the table
+        * `row_count` – number of rows in the table, used to choose the
+          smallest cuboid. If not known, the number of attributes is used to
+          estimate the cuboid size
+        """
+
+        self.cube = cube
+        self.table = table
+        self.schema = schema
+        self.attributes = set(attributes)
+        self.aggregates = set(aggregates)
+        self.row_count = row_count
+
+        self._stars = {}
+
+    @classmethod
+    def from_grain(cls, cube, table, dimensions=None, aggregates=None,
+                   schema=None, row_count=None):
+        """Creates a cuboid of `cube` from grain `dimensions` – list of
+        dimension level references in form ``dimension@hierarchy:level``. If
+        the level is not specified, the last level of the hierarchy is used.
+        If `dimensions` is ``None`` then all cube's dimensions are considered.
+        `aggregates` is list of aggregate names, all cube's aggregates if not
+        specified."""
+
+        dimensions = dimensions or [dim.name for dim in cube.dimensions]
+        if aggregates:
+            aggregates = cube.get_aggregates(aggregates)
+        else:
+            aggregates = cube.aggregates
+
+        attributes = []
+        for dimref in grain_levels(cube, dimensions):
+            (dimension, hierarchy, level) = dimref
+            depth = hierarchy.level_index(level) + 1
+            for level in hierarchy.levels[0:depth]:
+                attributes += [attr.ref for attr in level.attributes]
+
+        return cls(cube.name, table,
+                   attributes=attributes,
+                   aggregates=[agg.ref for agg in aggregates],
+                   schema=schema,
+                   row_count=row_count)
+
+    @property
+    def size(self):
+        """Estimated size of the cuboid – used for choosing the cheapest
+        cuboid."""
+        if self.row_count is not None:
+            return (0, self.row_count)
+        else:
+            return (1, len(self.attributes))
+
+    def can_answer(self, attributes, aggregates):
+        """Returns `True` if the cuboid contains all dimension `attributes`
+        (references) and all `aggregates` can be computed by aggregating the
+        pre-aggregated values or by merging the stored sketches."""
+
+        if not self.attributes.issuperset(attributes):
+            return False
+
+        for aggregate in aggregates:
+            if aggregate.ref not in self.aggregates \
+                    or aggregate.expression \
+                    or not aggregate.function:
+                return False
+
+            function = aggregate.function.lower()
+            if function in SKETCH_FUNCTIONS:
+                continue
+            elif aggregate.nonadditive or function not in ROLLUP_FUNCTIONS:
+                return False
+
+        return True
+
+    def star_schema(self, metadata):
+        """Returns a star schema with the cuboid table as fact table."""
+
+        try:
+            return self._stars[metadata]
+        except KeyError:
+            pass
+
+        refs = list(self.attributes) + list(self.aggregates)
+        mappings = dict((ref, Column(self.schema, self.table, ref, None, None))
+                        for ref in refs)
+        star = StarSchema(self.table, metadata,
+                          mappings=mappings,
+                          fact=self.table,
+                          schema=self.schema)
+
+        self._stars[metadata] = star
+        return star
+
+    def context_attributes(self, refs):
+        """Returns list of attribute objects for the query context. All the
+        attributes of the cuboid are base attributes."""
+        return [CuboidAttribute(ref, True, None) for ref in refs]
+
+
+class AggregateNavigator(object):
+    """Registry of cuboids – pre-aggregated tables of cubes."""
+
+    def __init__(self):
+        self._cuboids = {}
+
+    def register(self, cuboid):
+        """Registers the `cuboid`. Cuboid with the same table replaces
+        previously registered one."""
+
+        cuboids = self._cuboids.setdefault(cuboid.cube, [])
+        cuboids[:] = [c for c in cuboids
+                      if (c.schema, c.table) != (cuboid.schema, cuboid.table)]
+        cuboids.append(cuboid)
+
+    def unregister(self, cube, table, schema=None):
+        """Removes cuboid with `table` of `cube` from the registry."""
+
+        cuboids = self._cuboids.get(cube, [])
+        cuboids[:] = [c for c in cuboids
+                      if (c.schema, c.table) != (schema, table)]
+
+    def cuboids(self, cube):
+        """Returns list of cuboids registered for `cube` (name)."""
+        return list(self._cuboids.get(cube, []))
+
+    def find(self, cube, attributes, aggregates):
+        """Returns the smallest cuboid of `cube` that can answer a query with
+        dimension `attributes` and `aggregates`. See
+        :func:`smallest_cuboid`."""
+
+        return smallest_cuboid(self.cuboids(cube), attributes, aggregates)
+
+
+def smallest_cuboid(cuboids, attributes, aggregates):
+    """Returns the smallest cuboid from `cuboids` that can answer a query
+    with dimension `attributes` (references) and `aggregates`. Returns
+    ``None`` if there is no such cuboid."""
+
+    candidates = [cuboid for cuboid in cuboids
+                  if cuboid.can_answer(attributes, aggregates)]
+
+    if not candidates:
+        return None
+
+    return min(candidates, key=lambda cuboid: cuboid.size)
+
+
+def sketch_aggregates(aggregates):
+    """Returns list of `aggregates` that are stored in pre-aggregated tables
+    as sketches, see `SKETCH_FUNCTIONS`."""
+
+    return [agg for agg in aggregates
+            if agg.function and agg.function.lower() in SKETCH_FUNCTIONS]
+
+
+def grain_levels(cube, dimensions):
+    """Returns list of tuples (`dimension`, `hierarchy`, `level`) for grain
+    `dimensions` of `cube` given as dimension level references."""
+
+    levels = []
+
+    for dimref in dimensions:
+        if not isinstance(dimref, compat.string_type):
+            raise ArgumentError("Grain level should be a string, is {}"
+                                .format(type(dimref)))
+
+        (dimname, hiername, level) = string_to_dimension_level(dimref)
+        dimension = cube.dimension(dimname)
+        hierarchy = dimension.hierarchy(hiername)
+
+        if level:
+            level = dimension.level(level)
+        else:
+            level = hierarchy.levels[-1]
+
+        levels.append((dimension, hierarchy, level))
+
+    return levels
+
+
+def cuboids_from_options(cube, specs):
+    """Returns list of cuboids from the browser option `aggregate_tables`.
+    `specs` is a list of dictionaries with keys: `table`, `schema`,
+    `dimensions` (grain levels), `aggregates` and `row_count`."""
+
+    cuboids = []
+
+    for spec in specs or []:
+        try:
+            table = spec["table"]
+        except KeyError:
+            raise ArgumentError("Aggregate table specification of cube '{}' "
+                                "has no table".format(cube.name))
+
+        cuboid = Cuboid.from_grain(cube, table,
+                                   dimensions=spec.get("dimensions"),
+                                   aggregates=spec.get("aggregates"),
+                                   schema=spec.get("schema"),
+                                   row_count=spec.get("row_count"))
+        cuboids.append(cuboid)
+
+    return cuboids
@@ -18,10 +18,12 @@ Star/snowflake schema query construction structures
 from __future__ import absolute_import
 
 import logging
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+from datetime import datetime
 
 import sqlalchemy as sa
 import sqlalchemy.sql as sql
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.sql.expression import and_
 
 from ..metadata import object_dict
@@ -30,12 +32,22 @@ from .. import compat
 from ..query import SPLIT_DIMENSION_NAME
 from ..query import PointCut, SetCut, RangeCut
 
+from ..calendar import add_time_units, month_to_quarter
 from .expressions import compile_attributes
+from .utils import supports_row_values
 
 
 # Default label for all fact keys
 FACT_KEY_LABEL = '__fact_key__'
 
+# Number of set cut keys from which the keys are passed as an array, where
+# supported
+LARGE_SET_SIZE = 100
+
+# Units extracted from date/time columns that can be converted to date/time
+# ranges, from the coarsest one
+CALENDAR_UNITS = ["year", "quarter", "month", "day", "hour", "minute"]
+
 # Attribute -> Column
 # IF attribute has no 'expression' then mapping is used
 # IF attribute has expression, the expression is used and underlying mappings
@@ -536,9 +548,11 @@ class StarSchema(object):
         return table
 
 
-    def column(self, logical):
+    def column(self, logical, mapping=None):
         """Return a column for `logical` reference. The returned column will
-        have a label same as the `logical`.
+        have a label same as the `logical`. If `mapping` is specified, then
+        it is used instead of the attribute's mapping, for example a master
+        key mapping from :meth:`master_key_mappings`.
         """
         # IMPORTANT
         #
@@ -555,16 +569,37 @@ class StarSchema(object):
         #
         # -- END OF IMPORTANT MESSAGE ---
 
-        if logical in self._columns:
-            return self._columns[logical]
+        cache_key = (logical, mapping) if mapping else logical
 
-        try:
-            mapping = self.mappings[logical]
-        except KeyError:
-            if logical == FACT_KEY_LABEL:
-                return self.fact_key_column
-            else:
-                raise NoSuchAttributeError(logical)
+        if cache_key in self._columns:
+            return self._columns[cache_key]
+
+        if mapping is None:
+            try:
+                mapping = self.mappings[logical]
+            except KeyError:
+                if logical == FACT_KEY_LABEL:
+                    return self.fact_key_column
+                else:
+                    raise NoSuchAttributeError(logical)
+
+        column = self._physical_column(mapping)
+
+        # Extract part of the date
+        if mapping.extract:
+            column = sql.expression.extract(mapping.extract, column)
+        if mapping.function:
+            # FIXME: add some protection here for the function name!
+            column = getattr(sql.expression.func, mapping.function)(column)
+
+        column = column.label(logical)
+
+        self._columns[cache_key] = column
+
+        return column
+
+    def _physical_column(self, mapping):
+        """Returns the physical table column for `mapping`."""
 
         key = (mapping.schema or self.schema, mapping.table or self.fact_name)
 
@@ -572,24 +607,30 @@ class StarSchema(object):
         table = ref.table
 
         try:
-            column = table.columns[mapping.column]
+            return table.columns[mapping.column]
         except KeyError:
             avail = ", ".join(str(c) for c in table.columns)
             raise SchemaError("Unknown column '%s' in table '%s' possible: %s"
                               % (mapping.column, mapping.table, avail))
 
-        # Extract part of the date
-        if mapping.extract:
-            column = sql.expression.extract(mapping.extract, column)
-        if mapping.function:
-            # FIXME: add some protection here for the function name!
-            column = getattr(sql.expression.func, mapping.function)(column)
+    def calendar_column(self, logical):
+        """Returns a tuple (`column`, `unit`) if the attribute `logical` is
+        mapped to a calendar unit extracted from a date/time column, such as
+        `year` or `month`. `column` is the physical date/time column. Returns
+        ``None`` if the attribute is not mapped to an extracted calendar
+        unit.
 
-        column = column.label(logical)
+        Conditions on such attributes can be converted to date/time ranges on
+        the physical column, which can use indexes."""
 
-        self._columns[logical] = column
+        mapping = self.mappings.get(logical)
 
-        return column
+        if mapping is None or mapping.function \
+                or not mapping.extract \
+                or mapping.extract.lower() not in CALENDAR_UNITS:
+            return None
+
+        return (self._physical_column(mapping), mapping.extract.lower())
 
     def _master_key(self, join):
         """Generate join master key, use schema defaults"""
@@ -603,10 +644,92 @@ class StarSchema(object):
         return (join.detail.schema or self.schema,
                 join.alias or join.detail.table)
 
-    def required_tables(self, attributes):
+    def master_key_mappings(self, attributes):
+        """Returns a dictionary of mappings that can replace mappings of
+        `attributes` to eliminate joins. Keys are attribute names, values are
+        mappings of the master columns of the joins.
+
+        A join can be eliminated when all the `attributes` from its detail
+        table are the detail join keys, the join method is `match` or
+        `master` and no other required table is joined through the detail
+        table. The detail key values are then the same as the master key
+        values.
+
+        .. note::
+
+            Facts without matching detail are not excluded when a `match`
+            join is eliminated. The schema is expected to have referential
+            integrity.
+        """
+
+        candidates = {}
+        blocked = set()
+
+        for attr in attributes:
+            mapping = self.mappings.get(attr)
+            if mapping is None:
+                continue
+
+            ref = self.table((mapping.schema, mapping.table))
+            master = self._master_key_mapping(ref.join, mapping)
+
+            if master is None:
+                blocked.add(ref.key)
+            else:
+                candidates.setdefault(ref.key, {})[attr] = master
+
+        substitutes = {}
+        for key, mappings in candidates.items():
+            if key not in blocked:
+                substitutes.update(mappings)
+
+        if not substitutes:
+            return substitutes
+
+        # Keep joins of tables that are still required as masters of other
+        # joins
+        required = set(ref.key for ref
+                       in self.required_tables(attributes, substitutes))
+
+        for attr in list(substitutes.keys()):
+            mapping = self.mappings[attr]
+            if self.table((mapping.schema, mapping.table)).key in required:
+                del substitutes[attr]
+
+        return substitutes
+
+    def _master_key_mapping(self, join, mapping):
+        """Returns mapping of the master column of `join` that corresponds to
+        the detail column `mapping`. Returns ``None`` if the mapping is not
+        a detail key or if the join can not be eliminated."""
+
+        if join is None or mapping.extract or mapping.function \
+                or join.method not in (None, "match", "master"):
+            return None
+
+        detail_columns = join.detail.column
+        master_columns = join.master.column
+
+        if not isinstance(detail_columns, (list, tuple)):
+            detail_columns = [detail_columns]
+        if not isinstance(master_columns, (list, tuple)):
+            master_columns = [master_columns]
+
+        if mapping.column not in detail_columns \
+                or len(detail_columns) != len(master_columns):
+            return None
+
+        column = master_columns[list(detail_columns).index(mapping.column)]
+        (schema, table) = self._master_key(join)
+
+        return Column(schema, table, column, None, None)
+
+    def required_tables(self, attributes, substitutes=None):
         """Get all tables that are required to be joined to get `attributes`.
         `attributes` is a list of `StarSchema` attributes (or objects with
-        same kind of attributes).
+        same kind of attributes). `substitutes` is a dictionary of mappings
+        that are used instead of the attribute mappings, see
+        :meth:`master_key_mappings`.
         """
 
         # Attribute: (schema, table, column)
@@ -615,8 +738,11 @@ class StarSchema(object):
         if not self.joins:
             self.logger.debug("no joins to be searched for")
 
+        substitutes = substitutes or {}
+
         # Get the physical mappings for attributes
-        mappings = [self.mappings[attr] for attr in attributes]
+        mappings = [substitutes.get(attr) or self.mappings[attr]
+                    for attr in attributes]
 
         # Generate table keys
         relevant = set(self.table((m.schema, m.table)) for m in mappings)
@@ -675,14 +801,128 @@ class StarSchema(object):
 
         return sorted_tables
 
+    def _master_path(self, key):
+        """Returns list of table references from the table `key` through the
+        masters of the joins up to the fact table."""
+
+        path = [self.table(key)]
+
+        while path[-1].join:
+            master = self._master_key(path[-1].join)
+            path.append(self.table(master, "master"))
+
+        return path
+
+    def dimension_tables(self, attributes):
+        """Returns list of tables required to get `attributes` without
+        joining the fact table. The first table is the root – the closest
+        common master of the tables containing the `attributes`, the rest is
+        sorted by joins as in :meth:`required_tables`.
+
+        Returns ``None`` if the tables can not be joined without the fact
+        table, for example when some of the attributes are in the fact table
+        or in two dimension tables joined only through the fact."""
+
+        keys = set()
+        for attr in attributes:
+            try:
+                mapping = self.mappings[attr]
+            except KeyError:
+                return None
+            keys.add(self.table((mapping.schema, mapping.table)).key)
+
+        if not keys:
+            return None
+
+        paths = [self._master_path(key) for key in keys]
+        common = set.intersection(*[set(ref.key for ref in path)
+                                    for path in paths])
+        root = [ref for ref in paths[0] if ref.key in common][0]
+
+        if not root.join:
+            return None
+
+        required = {}
+        for path in paths:
+            for ref in path:
+                if ref.key == root.key:
+                    break
+                required[ref.key] = ref
+
+        sorted_tables = [root]
+        masters = set([root.key])
+
+        while required:
+            details = [ref for ref in required.values()
+                       if self._master_key(ref.join) in masters]
+
+            if not details:
+                break
+
+            for detail in details:
+                masters.add(detail.key)
+                sorted_tables.append(detail)
+                del required[detail.key]
+
+        return sorted_tables
+
+    def get_dimension_star(self, attributes):
+        """Returns a JOIN expression of dimension tables containing
+        `attributes` without the fact table. See :meth:`dimension_tables`.
+        Raises `SchemaError` when there is no such join."""
+
+        attributes = [str(attr) for attr in attributes]
+        tables = self.dimension_tables(attributes)
+
+        if tables is None:
+            raise SchemaError("Attributes {} can not be selected without "
+                              "the fact table in star {}"
+                              .format(", ".join(attributes), self.label))
+
+        return self._join_tables(tables)
+
+    def fact_exists_condition(self, attributes):
+        """Returns a semi-join condition for the dimension star of
+        `attributes` (see :meth:`get_dimension_star`) which selects only rows
+        that are joined to at least one fact. The condition is ``EXISTS`` of
+        the join of the star from the fact table to the root dimension table.
+        Returns ``None`` if the root table is joined with the `detail` method
+        – all the detail rows are part of the star then."""
+
+        attributes = [str(attr) for attr in attributes]
+        root = self.dimension_tables(attributes)[0]
+        join = root.join
+
+        if join.method == "detail":
+            return None
+
+        master_key = self._master_key(join)
+        tables = list(reversed(self._master_path(master_key)))
+        star = self._join_tables(tables)
+
+        master_columns = _make_compound_key(self.table(master_key).table,
+                                            join.master.column)
+        detail_columns = _make_compound_key(root.table, join.detail.column)
+
+        condition = and_(*[master == detail
+                           for master, detail
+                           in zip(master_columns, detail_columns)])
+
+        statement = sql.expression.select([sql.expression.literal(1)],
+                                          from_obj=star,
+                                          whereclause=condition)
+
+        return sql.expression.exists(statement)
+
     # Note: This is "The Method"
     # ==========================
 
-    def get_star(self, attributes):
+    def get_star(self, attributes, substitutes=None):
         """The main method for generating underlying star schema joins.
         Returns a denormalized JOIN expression that includes all relevant
         tables containing base `attributes` (attributes representing actual
-        columns).
+        columns). `substitutes` are mappings used instead of the attribute
+        mappings, see :meth:`master_key_mappings`.
 
         Example use:
 
@@ -697,7 +937,14 @@ class StarSchema(object):
 
         attributes = [str(attr) for attr in attributes]
         # Collect all the tables first:
-        tables = self.required_tables(attributes)
+        tables = self.required_tables(attributes, substitutes)
+
+        return self._join_tables(tables)
+
+    def _join_tables(self, tables):
+        """Returns a JOIN expression of `tables` – list of table references
+        sorted by their joins, as returned by :meth:`required_tables`. The
+        first table is the central table of the joined star."""
 
         # Dictionary of raw tables and their joined products
         # At the end this should contain only one item representing the whole
@@ -832,7 +1079,8 @@ class QueryContext(object):
     """
 
     def __init__(self, star_schema, attributes, hierarchies=None,
-                 parameters=None, safe_labels=None):
+                 parameters=None, safe_labels=None, dialect=None,
+                 eliminate_joins=False, dimension_only=False):
         """Creates a query context for `cube`.
 
         * `attributes` – list of all attributes that are relevant to the
@@ -844,6 +1092,15 @@ class QueryContext(object):
            for SQL dialects that don't support characters such as dot ``.`` in
            column labels.  See :meth:`QueryContext.column` for more
            information.
+        * `dialect` – SQLAlchemy dialect of the database. Used to choose
+           constructs supported by the database, such as row value
+           comparison. Only portable constructs are used if not specified.
+        * `eliminate_joins` – if `True` then detail join keys are taken from
+           the master tables where possible and the joins are not used. See
+           :meth:`StarSchema.master_key_mappings` for more information.
+        * `dimension_only` – if `True` then the star contains only the
+           dimension tables without the fact table. See
+           :meth:`StarSchema.get_dimension_star` for more information.
 
         `attributes` are objects that have attributes: `ref` – attribute
         reference, `is_base` – `True` when attribute does not depend on any
@@ -866,6 +1123,7 @@ class QueryContext(object):
         self.attributes = object_dict(attributes, True)
         self.hierarchies = hierarchies
         self.safe_labels = safe_labels
+        self.dialect = dialect
 
         # Collect base attributes
         #
@@ -875,12 +1133,21 @@ class QueryContext(object):
         # This is "the star" to be used by the owners of the context to select
         # from.
         #
-        self.star = star_schema.get_star(base_names)
+        if eliminate_joins and not dimension_only:
+            substitutes = star_schema.master_key_mappings(base_names)
+        else:
+            substitutes = {}
+
+        if dimension_only:
+            self.star = star_schema.get_dimension_star(base_names)
+        else:
+            self.star = star_schema.get_star(base_names, substitutes)
         # TODO: determne from self.star
 
         # Collect all the columns
         #
-        bases = {attr:self.star_schema.column(attr) for attr in base_names}
+        bases = {attr:self.star_schema.column(attr, substitutes.get(attr))
+                 for attr in base_names}
         bases[FACT_KEY_LABEL] = self.star_schema.fact_key_column
 
         self._columns = compile_attributes(bases, dependants, parameters,
@@ -965,19 +1232,9 @@ class QueryContext(object):
                                                      hierarchy, cut.invert)
 
             elif isinstance(cut, SetCut):
-                set_conds = []
-
-                for path in cut.paths:
-                    condition = self.condition_for_point(str(cut.dimension),
-                                                         path,
-                                                         str(cut.hierarchy),
-                                                         invert=False)
-                    set_conds.append(condition)
-
-                condition = sql.expression.or_(*set_conds)
-
-                if cut.invert:
-                    condition = sql.expression.not_(condition)
+                condition = self.condition_for_set(str(cut.dimension),
+                                                   cut.paths,
+                                                   hierarchy, cut.invert)
 
             elif isinstance(cut, RangeCut):
                 condition = self.range_condition(str(cut.dimension),
@@ -1002,11 +1259,16 @@ class QueryContext(object):
 
         levels = self.level_keys(dim, hierarchy, path)
 
-        for level_key, value in zip(levels, path):
+        time_range = self.calendar_range(levels, path)
+        if time_range is not None:
+            (column, start, end) = time_range
+            conditions = [column >= start, column < end]
+        else:
+            for level_key, value in zip(levels, path):
 
-            # Prepare condition: dimension.level_key = path_value
-            column = self.column(level_key)
-            conditions.append(column == value)
+                # Prepare condition: dimension.level_key = path_value
+                column = self.column(level_key)
+                conditions.append(column == value)
 
         condition = sql.expression.and_(*conditions)
 
@@ -1015,13 +1277,189 @@ class QueryContext(object):
 
         return condition
 
+    def calendar_range(self, levels, path):
+        """Returns a tuple (`column`, `start`, `end`) where `column` is a
+        physical date/time column and `start` and `end` are bounds of the
+        half-open time range represented by `path` of level keys `levels`.
+        Returns ``None`` if the level keys are not all extracted from the
+        same date/time column as consecutive calendar units starting with the
+        year, or if the `path` is not a valid date.
+
+        The range condition ``start <= column < end`` is equivalent to the
+        path condition on extracted units, but can use an index on the
+        column."""
+
+        if not path:
+            return None
+
+        columns = []
+        units = []
+
+        for level_key in levels:
+            attribute = self.attributes.get(level_key)
+            if attribute is not None and not attribute.is_base:
+                return None
+
+            calendar_column = self.star_schema.calendar_column(level_key)
+            if calendar_column is None:
+                return None
+
+            columns.append(calendar_column[0])
+            units.append(calendar_column[1])
+
+        column = columns[0]
+        if any(other is not column for other in columns[1:]):
+            return None
+
+        # Quarter is optional, other units have to be consecutive
+        expected = [unit for unit in CALENDAR_UNITS
+                    if unit != "quarter" or "quarter" in units]
+        if units != expected[:len(units)]:
+            return None
+
+        try:
+            values = dict((unit, int(value))
+                          for unit, value in zip(units, path))
+            quarter = values.pop("quarter", None)
+            if quarter is not None:
+                month = (quarter - 1) * 3 + 1
+                if month_to_quarter(values.get("month", month)) != quarter:
+                    return None
+                values.setdefault("month", month)
+
+            start = datetime(values["year"],
+                             values.get("month", 1),
+                             values.get("day", 1),
+                             values.get("hour", 0),
+                             values.get("minute", 0))
+        except (TypeError, ValueError):
+            return None
+
+        end = add_time_units(start, units[-1], 1)
+
+        if isinstance(column.type, sa.DateTime):
+            return (column, start, end)
+        elif isinstance(column.type, sa.Date):
+            if units[-1] in ("hour", "minute"):
+                return None
+            return (column, start.date(), end.date())
+        else:
+            return None
+
+    def condition_for_set(self, dim, paths, hierarchy=None, invert=False):
+        """Returns a condition for dimension `dim` points at any of the
+        `paths`. Paths are grouped by their depth. Single level paths are
+        compared with ``key IN (...)``, multi-level paths with
+        ``(key1, key2) IN ((...), ...)`` if the database supports row values,
+        otherwise paths with the same parent are grouped into ``key1 = ...
+        AND key2 IN (...)``.
+
+        The values are passed as a single "expanding" bound parameter, so the
+        statement does not grow with the number of paths. Large sets of
+        single level keys are passed as an array on PostgreSQL.
+        """
+
+        by_depth = OrderedDict()
+        conditions = []
+
+        for path in paths:
+            levels = self.level_keys(dim, hierarchy, path)
+            time_range = self.calendar_range(levels, path)
+
+            if not path:
+                # Empty path is the whole dimension
+                conditions.append(sql.expression.true())
+            elif time_range is not None:
+                (column, start, end) = time_range
+                conditions.append(sql.expression.and_(column >= start,
+                                                      column < end))
+            elif any(value is None for value in path):
+                # NULL is never IN (...)
+                conditions.append(self.condition_for_point(dim, path,
+                                                           hierarchy))
+            else:
+                by_depth.setdefault(len(path), []).append(tuple(path))
+
+        row_values = supports_row_values(self.dialect)
+
+        for depth, paths in by_depth.items():
+            levels = self.level_keys(dim, hierarchy, paths[0])
+            columns = [self.column(level) for level in levels]
+
+            if depth == 1:
+                values = [path[0] for path in paths]
+                conditions.append(self._in_condition(columns[0], values))
+            elif row_values:
+                param = sql.expression.bindparam("set_paths", paths,
+                                                 unique=True, expanding=True)
+                condition = sql.expression.tuple_(*columns).in_(param)
+                conditions.append(condition)
+            else:
+                by_parent = OrderedDict()
+                for path in paths:
+                    by_parent.setdefault(path[:-1], []).append(path[-1])
+
+                for parent, values in by_parent.items():
+                    condition = [column == value for column, value
+                                 in zip(columns, parent)]
+                    condition.append(self._in_condition(columns[-1], values))
+                    conditions.append(sql.expression.and_(*condition))
+
+        condition = sql.expression.or_(*conditions)
+
+        if invert:
+            condition = sql.expression.not_(condition)
+
+        return condition
+
+    def _in_condition(self, column, values):
+        """Returns condition `column` ``IN`` `values` with the values passed
+        as a single bound parameter."""
+
+        if len(values) == 1:
+            return column == values[0]
+
+        if self.dialect is not None \
+                and self.dialect.name == "postgresql" \
+                and len(values) >= LARGE_SET_SIZE \
+                and not isinstance(column.type, sa.types.NullType):
+            # Cast the array, the values might be strings from the URL
+            array = postgresql.ARRAY(column.type)
+            param = sql.expression.bindparam("set_values", values,
+                                             unique=True)
+            return column == sql.expression.any_(sql.expression.cast(param,
+                                                                     array))
+
+        param = sql.expression.bindparam("set_values", values,
+                                         unique=True, expanding=True)
+        return column.in_(param)
+
     def range_condition(self, dim, hierarchy, from_path, to_path,
                         invert=False):
         """Return a condition for a hierarchical range (`from_path`,
         `to_path`). Return value is a `Condition` tuple."""
 
-        lower = self._boundary_condition(dim, hierarchy, from_path, 0)
-        upper = self._boundary_condition(dim, hierarchy, to_path, 1)
+        lower_range = self.calendar_range(self.level_keys(dim, hierarchy,
+                                                          from_path),
+                                          from_path)
+        upper_range = self.calendar_range(self.level_keys(dim, hierarchy,
+                                                          to_path),
+                                          to_path)
+
+        if (lower_range or not from_path) and (upper_range or not to_path):
+            # Range of calendar paths – from the start of the lower path to
+            # the end of the upper path
+            lower = upper = None
+
+            if lower_range:
+                (column, start, _) = lower_range
+                lower = column >= start
+            if upper_range:
+                (column, _, end) = upper_range
+                upper = column < end
+        else:
+            lower = self._boundary_condition(dim, hierarchy, from_path, 0)
+            upper = self._boundary_condition(dim, hierarchy, to_path, 1)
 
         conditions = []
         if lower is not None:
@@ -1099,10 +1537,12 @@ class QueryContext(object):
 
         return levels[0:depth]
 
-    def column_for_split(self, split_cell, label=None):
-        """Create a column for a cell split from list of `cust`."""
+    def column_for_split(self, split_cell, label=None, condition=None):
+        """Create a column for a cell split from list of `cust`. `condition`
+        is the condition of the `split_cell`, if already prepared."""
 
-        condition = self.condition_for_cell(split_cell)
+        if condition is None:
+            condition = self.condition_for_cell(split_cell)
         split_column = sql.expression.case([(condition, True)],
                                            else_=False)
 
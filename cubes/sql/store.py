@@ -2,6 +2,14 @@
 
 from __future__ import absolute_import
 
+import threading
+
+from datetime import datetime, date
+from decimal import Decimal
+from itertools import groupby
+
+from dateutil.parser import parse as parse_datetime
+
 try:
     import sqlalchemy as sa
     import sqlalchemy.sql as sql
@@ -14,14 +22,17 @@ except ImportError:
     reflection = sa = sql = MissingPackage("sqlalchemy", "SQL")
 
 from .browser import SQLBrowser
+from .navigator import AggregateNavigator, Cuboid, ROLLUP_FUNCTIONS
+from .navigator import grain_levels, sketch_aggregates
 from .mapper import distill_naming, Naming
 from ..logging import get_logger
 from ..common import coalesce_options
 from ..stores import Store
 from ..errors import ArgumentError, StoreError, ConfigurationError
-from ..query import Drilldown, Cell
+from ..query import Drilldown, Cell, HyperLogLog, CardinalityEstimator
 from .utils import CreateTableAsSelect, CreateOrReplaceView
 from ..metadata import string_to_dimension_level
+from .. import compat
 
 
 __all__ = [
@@ -30,6 +41,13 @@ __all__ = [
 ]
 
 
+# Bookkeeping table of incrementally refreshed tables
+WATERMARK_TABLE = "cubes_watermarks"
+
+# Age in seconds after which the dimension statistics are collected again
+DEFAULT_STATISTICS_MAX_AGE = 24 * 60 * 60
+
+
 # Data types of options passed to sqlalchemy.create_engine
 # This is used to coalesce configuration string values into appropriate types
 SQLALCHEMY_OPTION_TYPES = {
@@ -53,10 +71,43 @@ OPTION_TYPES = {
     "include_summary": "bool",
     "include_cell_count": "bool",
     "use_denormalization": "bool",
-    "safe_labels": "bool"
+    "safe_labels": "bool",
+    "use_grouping_sets": "bool",
+    "use_aggregate_tables": "bool",
+    "eliminate_joins": "bool",
+    "stream_results": "bool",
+    "yield_per": "int",
+    "members_with_facts": "bool",
+    "report_workers": "int",
+    "cache_statements": "bool",
+    "use_statistics": "bool",
+    "row_budget": "int",
+    "statistics_max_age": "int",
+    "statement_timeout": "float",
+    "max_rows": "int",
+    "data_version_interval": "float"
 }
 
 
+def coerce_watermark(value, column):
+    """Converts watermark `value` recorded as a string to the Python type of
+    `column`."""
+
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+
+    if issubclass(python_type, datetime):
+        return parse_datetime(value)
+    elif issubclass(python_type, date):
+        return parse_datetime(value).date()
+    elif python_type in (int, float, Decimal):
+        return python_type(value)
+    else:
+        return value
+
+
 def sqlalchemy_options(options, prefix="sqlalchemy_"):
     """Return converted `options` to match SQLAlchemy create_engine options
     and their types. The `options` are expected to have prefix
@@ -144,6 +195,25 @@ class SQLStore(Store):
         * `denormalized_schema` - schema wehere denormalized views are
           located (use this if the views are in different schema than fact
           tables, otherwise default schema is going to be used)
+
+        Statistics:
+
+        * `statistics_max_age` – age in seconds after which the dimension
+          statistics used for estimates of the number of cells are collected
+          again. Default is one day. See :meth:`cardinality_estimator`.
+
+        Data version, see :meth:`data_version`:
+
+        * `data_version_query` – SQL query returning a single value which
+          changes when the data change, such as ``SELECT max(loaded) FROM
+          etl_runs``
+        * `data_version_table` and `data_version_column` – the data version
+          is the greatest value of the column of the table in the store's
+          schema, such as a watermark column of the fact table
+        * `data_version_file` – the data version is modification time of
+          the file
+        * `data_version_interval` – the version is polled at most once per
+          interval in seconds, default is 5
         """
         super(SQLStore, self).__init__(**options)
 
@@ -178,6 +248,174 @@ class SQLStore(Store):
             self.metadata = sa.MetaData(bind=self.connectable,
                                         schema=self.schema)
 
+        # Star schemas shared by browsers of this store. See `star_schema()`.
+        self._star_schemas = {}
+
+        # Registry of pre-aggregated tables used by the browsers
+        self.navigator = AggregateNavigator()
+
+        # Dimension statistics of cubes. See `cardinality_estimator()`.
+        self._statistics = {}
+        self._statistics_jobs = set()
+        self._statistics_lock = threading.Lock()
+        self.statistics_max_age = self.options.get("statistics_max_age") \
+                                    or DEFAULT_STATISTICS_MAX_AGE
+
+        self._data_version_statement = self._create_data_version_statement()
+
+    def star_schema(self, key, factory):
+        """Returns a cached star schema object for `key`. If there is no such
+        object, then `factory` is called to create one. The `key` should
+        contain everything the star schema construction depends on, such as
+        cube name, locale and naming options."""
+
+        try:
+            return self._star_schemas[key]
+        except KeyError:
+            star = factory()
+            self._star_schemas[key] = star
+            return star
+
+    def flush_cache(self):
+        """Flushes the cached star schemas. Should be called when the model
+        or the physical database schema changes."""
+
+        self.logger.debug("flushing star schema cache")
+        self._star_schemas.clear()
+
+    # Statistics
+    # ----------
+    #
+    # Number of distinct members of dimension levels, used to estimate the
+    # number of cells of aggregations.
+
+    def cardinality_estimator(self, cube):
+        """Returns a `CardinalityEstimator` with the statistics of `cube`.
+        If there are no statistics or they are older than
+        `statistics_max_age`, then they are collected by a background job.
+        Until the job finishes the stale estimator is returned or ``None``
+        if there is none."""
+
+        estimator = self._statistics.get(cube.name)
+
+        if estimator is None or estimator.age > self.statistics_max_age:
+            with self._statistics_lock:
+                if cube.name in self._statistics_jobs:
+                    return estimator
+                self._statistics_jobs.add(cube.name)
+
+            job = threading.Thread(target=self._statistics_job,
+                                   args=(cube, ),
+                                   name="statistics-%s" % cube.name)
+            job.daemon = True
+            job.start()
+
+        return estimator
+
+    def _statistics_job(self, cube):
+        try:
+            self.collect_statistics(cube)
+        except Exception as e:
+            self.logger.error("collecting statistics of cube '%s' failed: %s"
+                              % (cube.name, e))
+        finally:
+            with self._statistics_lock:
+                self._statistics_jobs.discard(cube.name)
+
+    def collect_statistics(self, cube):
+        """Collects number of distinct members of every level of every
+        hierarchy of the `cube` dimensions and number of the cube's facts.
+        The members are counted in the dimension tables where possible.
+        Returns a `CardinalityEstimator` which is cached and used by the
+        browsers of this store."""
+
+        self.logger.info("collecting statistics of cube '%s'" % cube.name)
+
+        browser = SQLBrowser(cube, self, use_aggregate_tables=False)
+
+        # Levels shared by multiple hierarchies are counted only once
+        counts = {}
+        level_counts = {}
+
+        for dimension in cube.dimensions:
+            for hierarchy in dimension.hierarchies:
+                for depth in range(1, len(hierarchy) + 1):
+                    keys = [level.key for level in hierarchy.levels[:depth]]
+                    refs = tuple(key.ref for key in keys)
+
+                    if refs not in counts:
+                        counts[refs] = self._count_members(browser, keys)
+
+                    key = (dimension.name, hierarchy.name, depth)
+                    level_counts[key] = counts[refs]
+
+        statement = sql.expression.select([sql.expression.func.count()],
+                                          from_obj=browser.star.fact_table)
+        fact_count = self.execute(statement).scalar()
+
+        estimator = CardinalityEstimator(cube, level_counts,
+                                         fact_count=fact_count)
+        self._statistics[cube.name] = estimator
+
+        return estimator
+
+    def _count_members(self, browser, keys):
+        """Returns number of distinct combinations of the level `keys`."""
+
+        selected = browser.dimension_statement(keys)
+        if selected is None:
+            selected = browser.denormalized_statement(keys)
+
+        (statement, _) = selected
+        members = statement.distinct().alias("__members")
+        count = sql.expression.select([sql.expression.func.count()],
+                                      from_obj=members)
+
+        return self.execute(count).scalar()
+
+    # Data Version
+    # ------------
+
+    def _create_data_version_statement(self):
+        """Returns statement selecting the data version or ``None`` if the
+        data version is not provided by the database."""
+
+        query = self.options.get("data_version_query")
+        table_name = self.options.get("data_version_table")
+
+        if query and table_name:
+            raise ConfigurationError("Both data_version_query and "
+                                     "data_version_table specified. "
+                                     "Use only one.")
+        elif query:
+            return sql.expression.text(query)
+        elif not table_name:
+            return None
+
+        column_name = self.options.get("data_version_column")
+        if not column_name:
+            raise ConfigurationError("No data_version_column specified for "
+                                     "data version table '%s'" % table_name)
+
+        # The table is not reflected, only the column is needed
+        table = sa.Table(table_name, sa.MetaData(),
+                         sa.Column(column_name),
+                         schema=self.schema)
+        column = table.c[column_name]
+
+        return sql.expression.select([sql.expression.func.max(column)])
+
+    def provide_data_version(self):
+        """Returns the data version selected by the `data_version_query` or
+        the greatest value of `data_version_column` of `data_version_table`.
+        If neither is configured, then modification time of
+        `data_version_file` is returned, if specified."""
+
+        if self._data_version_statement is None:
+            return super(SQLStore, self).provide_data_version()
+
+        return self.execute(self._data_version_statement).scalar()
+
     # TODO: make a separate SQL utils function
     def _drop_table(self, table, schema, force=False):
         """Drops `table` in `schema`. If table exists, exception is raised
@@ -293,7 +531,8 @@ class SQLStore(Store):
 
     def create_denormalized_view(self, cube, view_name=None, materialize=False,
                                  replace=False, create_index=False,
-                                 keys_only=False, schema=None):
+                                 keys_only=False, schema=None,
+                                 watermark=None):
         """Creates a denormalized view named `view_name` of a `cube`. If
         `view_name` is ``None`` then view name is constructed by pre-pending
         value of `denormalized_view_prefix` from workspace options to the cube
@@ -316,14 +555,29 @@ class SQLStore(Store):
           then `denormalized_view_schema` from options is used if specified,
           otherwise default workspace schema is used (same schema as fact
           table schema).
+        * `watermark` – name of a fact table column with monotonically
+          increasing values, such as a load sequence number or load
+          timestamp. Requires `materialize`. If the materialized view exists
+          and it was refreshed with the watermark before, only facts with
+          watermark greater than the recorded one are appended. The facts
+          are expected not to be updated or deleted.
         """
 
+        if watermark and not materialize:
+            raise ArgumentError("Incremental refresh requires materialized "
+                                "denormalized view")
+
         browser = SQLBrowser(cube, self, schema=schema)
 
         if browser.safe_labels:
             raise ConfigurationError("Denormalization does not work with "
                                      "safe_labels turned on")
 
+        if keys_only:
+            attributes = cube.all_dimension_keys + cube.measures
+        else:
+            attributes = cube.all_fact_attributes
+
         # Note: this does not work with safe labels – since they are "safe"
         # they can not conform to the cubes implicit naming schema dim.attr
 
@@ -341,6 +595,21 @@ class SQLStore(Store):
         table = sa.Table(view_name, self.metadata,
                                  autoload=False, schema=schema)
 
+        if watermark:
+            (column, last, current) = self._watermark_range(browser,
+                                                            watermark,
+                                                            view_name,
+                                                            schema)
+            if current is not None:
+                statement = statement.where(column <= current)
+
+            if last is not None and table.exists():
+                table = sa.Table(view_name, self.metadata, autoload=True,
+                                 schema=schema, extend_existing=True)
+                self._append_denormalized(table, statement, column, last,
+                                          current)
+                return
+
         if table.exists():
             self._drop_table(table, schema, force=replace)
 
@@ -354,13 +623,15 @@ class SQLStore(Store):
                          % (str(table), materialize))
         # print("SQL statement:\n%s" % statement)
         self.execute(create_view)
+
+        if watermark:
+            self._record_watermark(self.connectable, view_name, schema,
+                                   current)
+
         if create_index:
             table = sa.Table(view_name, self.metadata,
                                      autoload=True, schema=schema)
 
-            insp = reflection.Inspector.from_engine(engine)
-            insp.reflecttable(table, None)
-
             for attribute in attributes:
                 label = attribute.ref
                 self.logger.info("creating index for %s" % label)
@@ -369,6 +640,106 @@ class SQLStore(Store):
                 index = sa.schema.Index(name, column)
                 index.create(self.connectable)
 
+    def _append_denormalized(self, table, statement, column, last, current):
+        """Appends facts with watermark `column` in the range (`last`,
+        `current`] to the materialized denormalized view `table`."""
+
+        if current is None or current == last:
+            self.logger.info("denormalized view %s is up to date"
+                             % str(table))
+            return
+
+        self.logger.info("appending new facts to denormalized view %s"
+                         % str(table))
+
+        statement = statement.where(column > last)
+        insert = table.insert().from_select([c.name for c in
+                                             statement.columns],
+                                            statement)
+
+        with self.connectable.begin() as connection:
+            connection.execute(insert)
+            self._record_watermark(connection, table.name, table.schema,
+                                   current)
+
+    # Watermarks
+    # ----------
+    #
+    # Incrementally refreshed tables record the greatest watermark value of
+    # processed facts in a bookkeeping table.
+
+    def _watermark_table(self):
+        """Returns the bookkeeping table of refresh watermarks. The table is
+        created if it does not exist."""
+
+        table = sa.Table(WATERMARK_TABLE, self.metadata,
+                         sa.Column("table_schema", sa.String(255)),
+                         sa.Column("table_name", sa.String(255)),
+                         sa.Column("watermark", sa.String(255)),
+                         sa.Column("refreshed", sa.DateTime),
+                         schema=self.schema,
+                         extend_existing=True)
+        table.create(self.connectable, checkfirst=True)
+
+        return table
+
+    def watermark(self, table_name, schema=None):
+        """Returns the recorded watermark of incrementally refreshed table
+        `table_name` as a string. Returns ``None`` if the table was not
+        refreshed with a watermark yet."""
+
+        table = self._watermark_table()
+        condition = sql.expression.and_(
+            table.c.table_schema == (schema or ""),
+            table.c.table_name == table_name
+        )
+        statement = sql.expression.select([table.c.watermark],
+                                          whereclause=condition)
+
+        return self.execute(statement).scalar()
+
+    def _record_watermark(self, connection, table_name, schema, value):
+        """Records the watermark `value` of `table_name` using
+        `connection`."""
+
+        table = self._watermark_table()
+        condition = sql.expression.and_(
+            table.c.table_schema == (schema or ""),
+            table.c.table_name == table_name
+        )
+
+        if value is not None and not isinstance(value, compat.string_type):
+            value = value.isoformat() if hasattr(value, "isoformat") \
+                        else compat.to_unicode(value)
+
+        connection.execute(table.delete().where(condition))
+        connection.execute(table.insert().values(table_schema=schema or "",
+                                                 table_name=table_name,
+                                                 watermark=value,
+                                                 refreshed=datetime.now()))
+
+    def _watermark_range(self, browser, watermark, table_name, schema):
+        """Returns a tuple (`column`, `last`, `current`) where `column` is
+        the `watermark` column of the cube's fact table, `last` is the
+        recorded watermark of `table_name` and `current` is the greatest
+        watermark value in the fact table."""
+
+        try:
+            column = browser.star.fact_table.columns[watermark]
+        except KeyError:
+            raise ArgumentError("Fact table of cube '{}' has no watermark "
+                                "column '{}'".format(browser.cube.name,
+                                                     watermark))
+
+        last = self.watermark(table_name, schema)
+        if last is not None:
+            last = coerce_watermark(last, column)
+
+        statement = sql.expression.select([sql.expression.func.max(column)])
+        current = self.execute(statement).scalar()
+
+        return (column, last, current)
+
     def execute(self, *args, **kwargs):
         return self.connectable.execute(*args, **kwargs)
 
@@ -541,24 +912,48 @@ class SQLStore(Store):
 
         if insert:
             self.logger.debug("inserting into table '%s'" % str(table))
-            insert_statement = table.insert().from_select(statement.columns, statemnet)
+            insert_statement = table.insert().from_select(statement.columns,
+                                                         statement)
             self.connectable.execute(insert_statement)
 
         return table
 
     def create_cube_aggregate(self, cube, table_name=None, dimensions=None,
-                                 replace=False, create_index=False,
-                                 schema=None):
+                              replace=False, create_index=False,
+                              schema=None, aggregates=None,
+                              watermark=None):
         """Creates an aggregate table. If dimensions is `None` then all cube's
-        dimensions are considered.
+        dimensions are considered. The created table is registered in the
+        store's aggregate navigator and is used by the browsers of this store
+        for aggregations that can be answered from the table.
 
         Arguments:
 
         * `dimensions`: list of dimensions to use in the aggregated cuboid, if
-          `None` then all cube dimensions are used
+          `None` then all cube dimensions are used. Dimensions might be
+          specified with hierarchy and grain level as
+          ``dimension@hierarchy:level``, last level of the hierarchy is used
+          if not specified.
+        * `aggregates`: list of aggregate names to be included in the table,
+          if `None` then all cube aggregates are used
+        * `watermark`: name of a fact table column with monotonically
+          increasing values, such as a load sequence number or load
+          timestamp. If the aggregate table exists and it was refreshed with
+          the watermark before, only facts with watermark greater than the
+          recorded one are aggregated and merged into the table. The facts
+          are expected not to be updated or deleted.
+
+        Aggregates with a sketch function (`approx_count_distinct`) are
+        stored as serialized HyperLogLog sketches, computed from streamed
+        distinct values of their measures. The sketches are merged by the
+        browser on roll-up. Tables with sketches are always re-created, they
+        are not refreshed incrementally.
+
+        Returns the registered `Cuboid` object.
         """
 
-        browser = SQLBrowser(cube, self, schema=schema)
+        browser = SQLBrowser(cube, self, schema=schema,
+                             use_aggregate_tables=False)
 
         if browser.safe_labels:
             raise ConfigurationError("Aggregation does not work with "
@@ -568,7 +963,7 @@ class SQLStore(Store):
                     or self.naming.schema
 
         # TODO: this is very similar to the denormalization prep.
-        table_name = table_name or self.naming.aggregate_table_name(cube.name)
+        table_name = table_name or self.naming.aggregated_table_name(cube.name)
         fact_name = cube.fact or self.naming.fact_table_name(cube.name)
 
         dimensions = dimensions or [dim.name for dim in cube.dimensions]
@@ -576,27 +971,65 @@ class SQLStore(Store):
         if fact_name == table_name and schema == self.naming.schema:
             raise StoreError("Aggregation target is the same as fact")
 
-        drilldown = []
-        keys = []
-        for dimref in dimensions:
-            (dimname, hiername, level) = string_to_dimension_level(dimref)
-            dimension = cube.dimension(dimname)
-            hierarchy = dimension.hierarchy(hiername)
-            levels = hierarchy.levels
-            drilldown.append((dimension, hierarchy, levels[-1]))
-            keys += [l.key for l in levels]
-
         cell = Cell(cube)
-        drilldown = Drilldown(drilldown, cell)
+        drilldown = Drilldown(grain_levels(cube, dimensions), cell)
+
+        if aggregates:
+            aggregates = cube.get_aggregates(aggregates)
+        else:
+            aggregates = cube.aggregates
+
+        sketched = sketch_aggregates(aggregates)
+        plain = [agg for agg in aggregates if agg not in sketched]
+
+        # The table is going to be replaced, the browser should not use it
+        self.navigator.unregister(cube.name, table_name, schema)
 
         # Create statement of all dimension level keys for
         # getting structure for table creation
         (statement, _) = browser.aggregation_statement(
             cell,
             drilldown=drilldown,
-            aggregates=cube.aggregates
+            aggregates=plain or aggregates
         )
 
+        condition = None
+
+        if watermark:
+            (column, last, current) = self._watermark_range(browser,
+                                                            watermark,
+                                                            table_name,
+                                                            schema)
+            if current is not None:
+                condition = column <= current
+                statement = statement.where(condition)
+
+            table = sa.Table(table_name, self.metadata, autoload=False,
+                             schema=schema)
+
+            if sketched:
+                self.logger.info("aggregate table with sketches is "
+                                 "re-created")
+                replace = True
+            elif last is not None and table.exists():
+                table = sa.Table(table_name, self.metadata, autoload=True,
+                                 schema=schema, extend_existing=True)
+                self._refresh_cube_aggregate(table, statement, aggregates,
+                                             column, last, current)
+                return self._register_cuboid(cube, table, dimensions,
+                                             aggregates)
+
+        if sketched:
+            # Sketches are filled in after the insert
+            grouped = statement.alias("grouped")
+            names = set(agg.ref for agg in sketched)
+            selection = [c for c in grouped.columns if c.name not in names]
+            for agg in sketched:
+                empty = sql.expression.cast(sql.expression.null(),
+                                            sa.LargeBinary)
+                selection.append(empty.label(agg.ref))
+            statement = sql.expression.select(selection, from_obj=grouped)
+
         # Create table
         table = self.create_table_from_statement(
             table_name,
@@ -609,13 +1042,24 @@ class SQLStore(Store):
         self.logger.info("Inserting...")
 
         insert = table.insert().from_select(statement.columns, statement)
-        self.execute(insert)
+
+        if watermark:
+            with self.connectable.begin() as connection:
+                connection.execute(insert)
+                self._record_watermark(connection, table_name, schema,
+                                       current)
+        else:
+            self.execute(insert)
+
+        for aggregate in sketched:
+            self._fill_sketches(browser, table, drilldown, aggregate,
+                                condition)
 
         self.logger.info("Done")
 
         if create_index:
             self.logger.info("Creating indexes...")
-            aggregated_columns = [a.name for a in cube.aggregates]
+            aggregated_columns = [a.name for a in aggregates]
             for column in table.columns:
                 if column.name in aggregated_columns:
                     continue
@@ -627,6 +1071,167 @@ class SQLStore(Store):
 
         self.logger.info("Done")
 
+        return self._register_cuboid(cube, table, dimensions, aggregates)
+
+    def _fill_sketches(self, browser, table, drilldown, aggregate,
+                       condition=None):
+        """Fills the sketch column of `aggregate` in the aggregate `table`.
+        Distinct values of the aggregate's measure are streamed from the
+        facts for each group of the grain `drilldown` and added to the
+        group's sketch. `condition` restricts the facts."""
+
+        self.logger.info("computing sketches of '%s'" % aggregate.ref)
+
+        measure = browser.cube.measure(aggregate.measure)
+        attributes = drilldown.all_attributes
+        (statement, labels) = browser.denormalized_statement(
+            attributes + [measure]
+        )
+
+        keys = [column for column in statement.inner_columns][:-1]
+        if condition is not None:
+            statement = statement.where(condition)
+        statement = statement.distinct().order_by(*keys)
+
+        # NULL-safe comparison – keys of the grain might be NULL
+        key_refs = [attr.ref for attr in attributes]
+        match = sql.expression.and_(
+            *[table.c[ref].isnot_distinct_from(sql.expression.bindparam(
+                "k%d" % i)) for i, ref in enumerate(key_refs)]
+        )
+        sketch = sql.expression.bindparam("sketch")
+        update = table.update().where(match).values({aggregate.ref: sketch})
+
+        # Rows are ordered by the grain keys, sketch of a group is complete
+        # when the key changes. The table is updated after the values are
+        # read, as some databases do not allow writing while reading.
+        result = browser.execute(statement, "sketch values", stream=True)
+        width = len(key_refs)
+        params = []
+
+        for key, rows in groupby(result, lambda row: tuple(row[:width])):
+            sketch = HyperLogLog()
+            sketch.update(row[width] for row in rows
+                          if row[width] is not None)
+
+            values = dict(("k%d" % i, value) for i, value in enumerate(key))
+            values["sketch"] = sketch.to_bytes()
+            params.append(values)
+
+        for start in range(0, len(params), browser.yield_per):
+            self.execute(update, params[start:start + browser.yield_per])
+
+    def _register_cuboid(self, cube, table, dimensions, aggregates):
+        """Registers aggregate `table` in the navigator and returns the
+        cuboid."""
+
+        count = sql.expression.select([sql.expression.func.count()],
+                                      from_obj=table)
+        row_count = self.execute(count).scalar()
+
+        cuboid = Cuboid.from_grain(cube, table.name,
+                                   dimensions=dimensions,
+                                   aggregates=[agg.name for agg in aggregates],
+                                   schema=table.schema,
+                                   row_count=row_count)
+        self.navigator.register(cuboid)
+
+        return cuboid
+
+    def _refresh_cube_aggregate(self, table, statement, aggregates, column,
+                                last, current):
+        """Merges facts with watermark `column` in the range (`last`,
+        `current`] into the aggregate `table`. `statement` is the aggregation
+        statement of the whole table.
+
+        The groups affected by the new facts are aggregated into a staging
+        table first. If all the aggregates can be rolled-up, the new values
+        are combined with the existing ones, otherwise the affected groups
+        are re-aggregated from the fact table. The affected groups are then
+        replaced in a single transaction."""
+
+        if current is None or current == last:
+            self.logger.info("aggregate table %s is up to date" % str(table))
+            return
+
+        self.logger.info("refreshing aggregate table %s" % str(table))
+
+        agg_names = set(agg.name for agg in aggregates)
+        keys = [c.name for c in statement.columns if c.name not in agg_names]
+        base_columns = dict((c.name, c.element) for c in statement.inner_columns
+                            if c.name not in agg_names)
+
+        delta = self.create_table_from_statement(
+            "%s__delta" % table.name,
+            statement.where(column > last),
+            schema=table.schema,
+            replace=True,
+            insert=True
+        )
+
+        def affected(columns):
+            # NULL-safe comparison – keys of the grain might be NULL
+            condition = sql.expression.and_(
+                *[delta.c[key].isnot_distinct_from(columns[key])
+                  for key in keys]
+            )
+            one = sql.expression.literal_column("1")
+            return sql.expression.exists(
+                sql.expression.select([one], from_obj=delta,
+                                      whereclause=condition)
+            )
+
+        if all(agg.function and not agg.expression and not agg.nonadditive
+               and agg.function.lower() in ROLLUP_FUNCTIONS
+               for agg in aggregates):
+            # Combine the pre-aggregated values with the new ones
+            names = [c.name for c in table.columns]
+            current_rows = sql.expression.select([table.c[name]
+                                                  for name in names],
+                                                 whereclause=affected(table.c))
+            new_rows = sql.expression.select([delta.c[name]
+                                              for name in names])
+            union = sql.expression.union_all(current_rows, new_rows) \
+                        .alias("__merge")
+
+            functions = dict((agg.name, ROLLUP_FUNCTIONS[agg.function.lower()])
+                             for agg in aggregates)
+            selection = []
+            for name in names:
+                if name in functions:
+                    function = getattr(sql.expression.func, functions[name])
+                    selection.append(function(union.c[name]).label(name))
+                else:
+                    selection.append(union.c[name])
+
+            merge = sql.expression.select(selection,
+                                          from_obj=union,
+                                          group_by=[union.c[key]
+                                                    for key in keys])
+        else:
+            # Re-aggregate the affected groups from the facts
+            merge = statement.where(affected(base_columns))
+
+        merged = self.create_table_from_statement(
+            "%s__merge" % table.name,
+            merge,
+            schema=table.schema,
+            replace=True,
+            insert=True
+        )
+
+        with self.connectable.begin() as connection:
+            connection.execute(table.delete().where(affected(table.c)))
+            names = [c.name for c in merged.columns]
+            select = sql.expression.select([merged.c[name] for name in names])
+            connection.execute(table.insert().from_select(names, select))
+            self._record_watermark(connection, table.name, table.schema,
+                                   current)
+
+        for staging in (delta, merged):
+            staging.drop(self.connectable)
+            self.metadata.remove(staging)
+
 
 class SQLSchemaInspector(object):
     """Object that discovers fact and dimension tables in a database according
@@ -2,12 +2,28 @@
 """Cubes SQL backend utilities, mostly to be used by the slicer command."""
 
 from sqlalchemy.sql.expression import Executable, ClauseElement
+from sqlalchemy.sql.expression import BindParameter
+from sqlalchemy.sql import visitors
 from sqlalchemy.ext.compiler import compiles
+from sqlalchemy import event
 import sqlalchemy.sql as sql
 
 from collections import OrderedDict
+from datetime import datetime, date
+from decimal import Decimal
+
+import base64
+import binascii
+import json
+import sqlite3
+import threading
+import time
+
+from dateutil.parser import parse as parse_datetime
 
 from ..query import SPLIT_DIMENSION_NAME
+from ..errors import ArgumentError
+from .. import compat
 
 __all__ = [
     "CreateTableAsSelect",
@@ -15,8 +31,18 @@ __all__ = [
     "CreateOrReplaceView",
     "condition_conjunction",
     "order_column",
+    "order_columns",
     "order_query",
-    "paginate_query"
+    "order_rows",
+    "paginate_query",
+    "seek_query",
+    "supports_row_values",
+    "nulls_are_largest",
+    "encode_cursor",
+    "decode_cursor",
+    "bind_parameters",
+    "limited_connection",
+    "is_timeout_error"
 ]
 
 class CreateTableAsSelect(Executable, ClauseElement):
@@ -100,7 +126,60 @@ def order_column(column, order):
     elif order.lower().startswith("desc"):
         return column.desc()
     else:
-        raise ArgumentError("Unknown order %s for column %s") % (order, column)
+        raise ArgumentError("Unknown order %s for column %s"
+                            % (order, column))
+
+
+def column_ordering(columns, order=None, natural_order=None):
+    """Returns an ordered dictionary where keys are logical attribute labels
+    and values are tuples (`column`, `direction`). `columns` is an ordered
+    dictionary where keys are logical attribute labels and values are
+    columns. Columns are ordered by the explicit `order` first, then by the
+    `natural_order` of the remaining columns. Split column, if present, is
+    always the first one. See :func:`order_query` for more information about
+    the arguments."""
+
+    order = order or []
+    natural_order = natural_order or []
+
+    final_order = OrderedDict()
+
+    # Normalize order
+    # ---------------
+    # Make sure that the `order` is a list of of tuples (`attribute`,
+    # `order`). If element of the `order` list is a string, then it is
+    # converted to (`string`, ``None``).
+
+    if SPLIT_DIMENSION_NAME in columns:
+        final_order[SPLIT_DIMENSION_NAME] = (columns[SPLIT_DIMENSION_NAME],
+                                             None)
+
+    # Collect the corresponding attribute columns
+    for attribute, direction in order:
+        attribute = str(attribute)
+        # Validate the direction
+        order_column(columns[attribute], direction)
+
+        if attribute not in final_order:
+            final_order[attribute] = (columns[attribute], direction)
+
+    # Collect natural order for selected columns that have no explicit
+    # ordering
+    for (name, column) in columns.items():
+        if name in natural_order and name not in final_order.keys():
+            final_order[name] = (column, natural_order[name])
+
+    return final_order
+
+
+def order_columns(columns, order=None, natural_order=None):
+    """Returns a list of ordered column expressions. See
+    :func:`column_ordering` for more information about the arguments."""
+
+    ordering = column_ordering(columns, order, natural_order)
+
+    return [order_column(column, direction)
+            for column, direction in ordering.values()]
 
 
 def order_query(statement, order, natural_order=None, labels=None):
@@ -118,11 +197,7 @@ def order_query(statement, order, natural_order=None, labels=None):
       information.
     """
 
-    order = order or []
     labels = labels or {}
-    natural_order = natural_order or []
-
-    final_order = OrderedDict()
 
     # Each attribute mentioned in the order should be present in the selection
     # or as some column from joined table. Here we get the list of already
@@ -133,31 +208,431 @@ def order_query(statement, order, natural_order=None, labels=None):
 
     columns = OrderedDict(zip(labels, statement.columns))
 
-    # Normalize order
-    # ---------------
-    # Make sure that the `order` is a list of of tuples (`attribute`,
-    # `order`). If element of the `order` list is a string, then it is
-    # converted to (`string`, ``None``).
+    ordering = order_columns(columns, order, natural_order)
 
-    if SPLIT_DIMENSION_NAME in statement.columns:
-        split_column = sql.expression.column(SPLIT_DIMENSION_NAME)
-        final_order[SPLIT_DIMENSION_NAME] = split_column
+    return statement.order_by(*ordering)
 
-    # Collect the corresponding attribute columns
-    for attribute, direction in order:
-        attribute = str(attribute)
-        column = order_column(columns[attribute], direction)
 
-        if attribute not in final_order:
-            final_order[attribute] = column
+def order_rows(rows, labels, order=None, natural_order=None):
+    """Returns a list of value tuples `rows` ordered in Python the same way
+    as :func:`order_query` orders a statement. `labels` are logical labels
+    of the row values. ``NULL`` values are ordered first in the ascending
+    order."""
 
-    # Collect natural order for selected columns that have no explicit
-    # ordering
-    for (name, column) in columns.items():
-        if name in natural_order and name not in final_order.keys():
-            final_order[name] = order_column(column, natural_order[name])
+    columns = OrderedDict((label, sql.expression.column(label))
+                          for label in labels)
+    ordering = column_ordering(columns, order, natural_order)
+    index = dict((label, i) for i, label in enumerate(labels))
 
-    statement = statement.order_by(*final_order.values())
+    rows = list(rows)
 
-    return statement
+    # Stable sort by the least significant column first
+    for label, (_, direction) in reversed(list(ordering.items())):
+        i = index[label]
+        reverse = bool(direction) and direction.lower().startswith("desc")
+        rows.sort(key=lambda row: (row[i] is not None, row[i]),
+                  reverse=reverse)
+
+    return rows
+
+
+# Keyset pagination
+# =================
+#
+# Keyset (seek) pagination continues after the last row of the previous page
+# instead of skipping rows with ``OFFSET``. The position of the last row is
+# passed around as an opaque cursor – a token with values of the ordering
+# columns.
+
+
+def supports_row_values(dialect):
+    """Returns ``True`` if the database of SQLAlchemy `dialect` supports row
+    value comparison such as ``(a, b) > (1, 2)`` or ``(a, b) IN ((1, 2))``.
+    Returns ``False`` if the `dialect` is ``None`` or if the version of the
+    SQLite database is not known yet (there was no connection)."""
+
+    if dialect is None:
+        return False
+    elif dialect.name in ("postgresql", "mysql"):
+        return True
+    elif dialect.name == "sqlite":
+        version = dialect.server_version_info
+        return version is not None and version >= (3, 15)
+    else:
+        return False
 
+
+def nulls_are_largest(dialect):
+    """Returns ``True`` if the database of SQLAlchemy `dialect` orders
+    ``NULL`` values as greater than any other value, such as PostgreSQL.
+    SQLite, MySQL and other databases order them as the smallest values."""
+
+    return dialect is not None and dialect.name in ("postgresql", "oracle")
+
+
+def _is_descending(direction):
+    return bool(direction) and direction.lower().startswith("desc")
+
+
+def _seek_direction(direction):
+    return "desc" if _is_descending(direction) else "asc"
+
+
+def seek_order_column(column, direction, explicit_nulls=False):
+    """Orders a `column` according to `direction` for keyset pagination:
+    ``NULL`` values are the smallest – first in the ascending order and last
+    in the descending order. If `explicit_nulls` is ``True``, then the
+    ``NULLS FIRST`` or ``NULLS LAST`` is specified, otherwise the database
+    is expected to order ``NULL`` values this way (see
+    :func:`nulls_are_largest`)."""
+
+    column = order_column(column, direction)
+
+    if not explicit_nulls:
+        return column
+    elif _is_descending(direction):
+        return column.nullslast()
+    else:
+        return column.nullsfirst()
+
+
+def _seek_follows(column, value, descending):
+    """Returns condition selecting values of `column` that follow the
+    `value` in the order where ``NULL`` is the smallest value."""
+
+    if value is None:
+        if descending:
+            return sql.expression.false()
+        return column.isnot(None)
+    elif descending:
+        return sql.expression.or_(column < value, column.is_(None))
+    else:
+        return column > value
+
+
+def _seek_equals(column, value):
+    if value is None:
+        return column.is_(None)
+    return column == value
+
+
+def seek_condition(ordering, values, row_values=True):
+    """Returns a condition selecting rows that follow the row with `values`
+    in the `ordering` – list of tuples (`column`, `direction`). ``NULL`` is
+    considered to be smaller than any other value, see
+    :func:`seek_order_column`.
+
+    If `row_values` is ``True``, all the columns are in the ascending order
+    and no value is ``NULL``, then the row value comparison ``(c1, c2) >
+    (v1, v2)`` is used. Otherwise the condition is expanded into ``c1 > v1
+    OR (c1 = v1 AND c2 > v2) ...`` with ``IS NULL`` comparisons where
+    needed."""
+
+    columns = [column for column, _ in ordering]
+    descending = [_is_descending(direction) for _, direction in ordering]
+    values = [None if value is None
+              else sql.expression.literal(value, type_=column.type)
+              for column, value in zip(columns, values)]
+
+    if row_values and len(columns) > 1 and not any(descending) \
+            and all(value is not None for value in values):
+        return sql.expression.tuple_(*columns) \
+                > sql.expression.tuple_(*values)
+
+    conditions = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        equal = [_seek_equals(prev, prev_value) for prev, prev_value
+                 in zip(columns[:i], values[:i])]
+        condition = _seek_follows(column, value, descending[i])
+        conditions.append(sql.expression.and_(*(equal + [condition])))
+
+    return sql.expression.or_(*conditions)
+
+
+def seek_query(statement, order, natural_order=None, labels=None, keys=None,
+               cursor=None, page_size=None, row_values=True,
+               explicit_nulls=False):
+    """Returns a tuple (`statement`, `keys`) where `statement` is ordered
+    and paginated using keyset pagination. `keys` is list of tuples
+    (`label`, `direction`) of the ordering columns – values of these labels
+    in the last row of the page are used to create the cursor for the next
+    page.
+
+    * `statement`, `order`, `natural_order` and `labels` – see
+      :func:`order_query`
+    * `keys` – labels of columns that make the order unique, such as the
+      fact key. They are appended to the ordering if not already present
+    * `cursor` – cursor created by :func:`encode_cursor` from the last row
+      of the previous page. First page is returned if the cursor is empty
+    * `page_size` – number of rows of the page. One more row is requested
+      to find out whether there is a next page
+    * `row_values` – whether the database supports row value comparison.
+      See :func:`seek_condition`
+    * `explicit_nulls` – whether the order of ``NULL`` values has to be
+      specified, see :func:`seek_order_column`
+
+    If the statement is grouped, the seek condition is used in the
+    ``HAVING`` clause, so the aggregates can be used in the order.
+    """
+
+    labels = labels or []
+
+    columns = OrderedDict(zip(labels, statement.columns))
+    ordering = column_ordering(columns, order, natural_order)
+
+    for key in keys or []:
+        if key not in ordering:
+            ordering[key] = (columns[key], None)
+
+    order_by = [seek_order_column(column, direction, explicit_nulls)
+                for column, direction in ordering.values()]
+
+    keys = [(key, _seek_direction(direction))
+            for key, (_, direction) in ordering.items()]
+    values = decode_cursor(cursor, keys)
+
+    if values is not None:
+        # The condition requires the selected expressions, not the labels
+        expressions = OrderedDict(zip(labels, statement.inner_columns))
+        seek = [(getattr(expressions[key], "element", expressions[key]),
+                 direction)
+                for key, direction in keys]
+        condition = seek_condition(seek, values, row_values=row_values)
+
+        if statement._group_by_clause.clauses:
+            statement = statement.having(condition)
+        else:
+            statement = statement.where(condition)
+
+    statement = statement.order_by(*order_by)
+
+    if page_size is not None:
+        statement = statement.limit(page_size + 1)
+
+    return (statement, keys)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    elif isinstance(value, date):
+        return {"$date": value.isoformat()}
+    elif isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    else:
+        return value
+
+
+def _decode_value(value):
+    if not isinstance(value, dict):
+        return value
+    elif "$datetime" in value:
+        return parse_datetime(value["$datetime"])
+    elif "$date" in value:
+        return parse_datetime(value["$date"]).date()
+    elif "$decimal" in value:
+        return Decimal(value["$decimal"])
+    else:
+        raise ValueError("Unknown cursor value %s" % (value, ))
+
+
+def encode_cursor(keys, values):
+    """Returns an opaque cursor for keyset pagination – URL safe string
+    containing ordering column `keys` – list of tuples (`label`,
+    `direction`) – and their `values` in the last row of a page."""
+
+    content = {
+        "k": [label for label, _ in keys],
+        "d": [direction for _, direction in keys],
+        "v": [_encode_value(v) for v in values]
+    }
+    content = json.dumps(content, separators=(",", ":")).encode("utf-8")
+
+    return compat.to_str(base64.urlsafe_b64encode(content))
+
+
+def decode_cursor(cursor, keys):
+    """Returns list of values from a `cursor` created by
+    :func:`encode_cursor`. Returns ``None`` if the cursor is empty. Raises
+    `ArgumentError` when the cursor is not valid or when it was created for
+    different ordering `keys` – labels or directions."""
+
+    if not cursor:
+        return None
+
+    try:
+        if isinstance(cursor, compat.text_type):
+            cursor = cursor.encode("ascii")
+        content = json.loads(compat.to_str(base64.urlsafe_b64decode(cursor)))
+        values = [_decode_value(value) for value in content["v"]]
+        cursor_keys = list(zip(content["k"], content["d"]))
+    except (TypeError, ValueError, KeyError, binascii.Error):
+        raise ArgumentError("Invalid pagination cursor")
+
+    keys = [(label, direction) for label, direction in keys]
+
+    if cursor_keys != keys or len(values) != len(keys):
+        raise ArgumentError("Pagination cursor does not match the query "
+                            "order")
+
+    return values
+
+
+# Statement shapes
+# ================
+#
+# Statements of the same shape differ only in the values compared with the
+# columns in the conditions. The values are passed as named parameters, so
+# a statement compiled once can be executed with values of other cells.
+
+
+def bind_parameters(condition, prefix):
+    """Returns a tuple (`condition`, `params`, `signature`) where the
+    `condition` is a copy of the original condition with the bound values
+    replaced by parameters named `prefix` and a sequence number, `params` is
+    a dictionary of the parameter names and values and `signature` is a
+    tuple describing the structure of the condition without the values.
+    Conditions with the same signature have the same parameter names."""
+
+    params = OrderedDict()
+
+    def replace(element):
+        if isinstance(element, BindParameter):
+            name = "{}{}".format(prefix, len(params))
+            params[name] = element.effective_value
+            return sql.expression.bindparam(name, element.effective_value,
+                                            type_=element.type,
+                                            expanding=element.expanding)
+        return None
+
+    condition = visitors.replacement_traverse(condition, {}, replace)
+
+    signature = []
+    for element in visitors.iterate(condition, {}):
+        if isinstance(element, BindParameter):
+            item = (element.key, element.expanding)
+        else:
+            # Column of a table or of its alias, such as a role-playing
+            # dimension
+            table = getattr(element, "table", None)
+            operator = getattr(element, "operator", None)
+            item = (type(element).__name__,
+                    getattr(table, "name", None),
+                    getattr(element, "name", None),
+                    getattr(operator, "__name__", None))
+        signature.append(item)
+
+    return (condition, params, tuple(signature))
+
+
+
+# Number of SQLite virtual machine instructions between checks of the
+# statement timeout and cancellation
+SQLITE_PROGRESS_INTERVAL = 1000
+
+# Error codes of statements stopped because of the statement timeout: query
+# canceled (PostgreSQL), query execution interrupted (MySQL) and statement
+# timeout (MariaDB)
+POSTGRESQL_TIMEOUT_CODES = ("57014", )
+MYSQL_TIMEOUT_CODES = (3024, 1317, 1969)
+
+# Key of the connection record info with function that resets the limits
+LIMITS_RESET_KEY = "cubes_reset_limits"
+
+# Registration of event listeners is not thread-safe
+_listeners_lock = threading.Lock()
+
+
+def _reset_limits(dbapi_connection, connection_record):
+    """Resets statement timeout set by `limited_connection()` when the
+    connection is returned to the pool."""
+
+    reset = connection_record.info.pop(LIMITS_RESET_KEY, None)
+    if reset is not None:
+        reset(dbapi_connection)
+
+
+def _execute_raw(dbapi_connection, statement):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(statement)
+    finally:
+        cursor.close()
+
+
+def limited_connection(engine, limits, deadline=None):
+    """Returns a connection of `engine` with statement timeout set to the
+    time remaining to the `deadline` and with cancellation of the `limits`
+    (a :class:`cubes.query.QueryLimits` object). The connection is closed
+    together with the result of the statement executed with it.
+
+    The timeout is set as ``statement_timeout`` of the transaction in
+    PostgreSQL, ``max_execution_time`` of the session in MySQL and as a
+    progress handler in SQLite, which checks the cancellation as well. Other
+    databases are not limited. Session settings are reset when the
+    connection is returned to the pool."""
+
+    with _listeners_lock:
+        if not event.contains(engine.pool, "checkin", _reset_limits):
+            event.listen(engine.pool, "checkin", _reset_limits)
+
+    connection = engine.connect()
+    fairy = connection.connection
+    dbapi_connection = fairy.connection
+    dialect = engine.dialect.name
+
+    if deadline is not None:
+        milliseconds = max(1, int((deadline - time.time()) * 1000))
+    else:
+        milliseconds = None
+
+    if dialect == "sqlite":
+        if deadline is not None or limits.cancellation is not None:
+            def progress():
+                if limits.is_cancelled:
+                    return 1
+                elif deadline is not None and time.time() > deadline:
+                    return 1
+                else:
+                    return 0
+
+            dbapi_connection.set_progress_handler(progress,
+                                                  SQLITE_PROGRESS_INTERVAL)
+            fairy.info[LIMITS_RESET_KEY] = \
+                    lambda conn: conn.set_progress_handler(None, 0)
+
+    elif milliseconds is None:
+        pass
+
+    elif dialect == "postgresql":
+        # Local to the transaction which is rolled back when the connection
+        # is returned to the pool
+        _execute_raw(dbapi_connection,
+                     "SET LOCAL statement_timeout = %d" % milliseconds)
+
+    elif dialect == "mysql":
+        _execute_raw(dbapi_connection,
+                     "SET SESSION max_execution_time = %d" % milliseconds)
+        fairy.info[LIMITS_RESET_KEY] = \
+                lambda conn: _execute_raw(conn, "SET SESSION "
+                                                "max_execution_time = DEFAULT")
+
+    connection.should_close_with_result = True
+
+    return connection
+
+
+def is_timeout_error(error):
+    """Returns ``True`` if the database `error` (a SQLAlchemy `DBAPIError`)
+    was caused by a statement timeout or interruption set by
+    `limited_connection()`."""
+
+    orig = getattr(error, "orig", error)
+
+    if getattr(orig, "pgcode", None) in POSTGRESQL_TIMEOUT_CODES:
+        return True
+    elif isinstance(orig, sqlite3.OperationalError):
+        return "interrupted" in str(orig)
+
+    args = getattr(orig, "args", None)
+    return bool(args) and args[0] in MYSQL_TIMEOUT_CODES
@@ -1,10 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import os.path
+import threading
+import time
+
+from datetime import datetime
+
 __all__ = (
     "Store"
 )
 
 
+# Interval in seconds of polling the data version, see Store.data_version()
+DEFAULT_DATA_VERSION_INTERVAL = 5
+
+
 # Note: this class does not have much use right now besides being discoverable
 # by custom plugin system in cubes.
 # TODO: remove requirement for store_name and store_type
@@ -22,3 +32,53 @@ class Store(object):
         # TODO: this is just backward compatibility, remove this (make this
         # class variable)
         self.store_type = options.get("store_type")
+
+        # See data_version()
+        self._data_version = None
+        self._data_version_polled = None
+        self._data_version_lock = threading.Lock()
+
+    def flush_cache(self):
+        """Flushes caches of objects derived from the model, such as compiled
+        schemas. Called by the workspace when the model changes. Default
+        implementation does nothing."""
+        pass
+
+    def data_version(self):
+        """Returns a value identifying the version of the store's data, which
+        changes whenever the data change, such as time of the last load.
+        Returns ``None`` if the version is not known.
+
+        The version is provided by :meth:`provide_data_version` and polled
+        at most once per `data_version_interval` seconds (default 5)."""
+
+        interval = self.options.get("data_version_interval")
+        if interval is None:
+            interval = DEFAULT_DATA_VERSION_INTERVAL
+        interval = float(interval)
+        now = time.time()
+
+        with self._data_version_lock:
+            polled = self._data_version_polled
+
+            if polled is None or now - polled >= interval:
+                self._data_version = self.provide_data_version()
+                self._data_version_polled = now
+
+            return self._data_version
+
+    def provide_data_version(self):
+        """Returns the current version of the store's data. Default
+        implementation returns modification time (UTC) of the file
+        `data_version_file`, for example touched by the ETL, or ``None`` if
+        the option is not set. Subclasses may query the data source."""
+
+        path = self.options.get("data_version_file")
+
+        if not path:
+            return None
+
+        try:
+            return datetime.utcfromtimestamp(os.path.getmtime(path))
+        except OSError:
+            return None
@@ -294,8 +294,11 @@ class Workspace(object):
             self.import_model(path)
 
     def flush_lookup_cache(self):
-        """Flushes the cube lookup cache."""
+        """Flushes the cube lookup cache and caches of all open stores."""
         self._cubes.clear()
+
+        for store in self.stores.values():
+            store.flush_cache()
         # TODO: flush also dimensions
 
     def _get_namespace(self, ref):
@@ -481,6 +484,9 @@ class Workspace(object):
 
         ns.add_provider(provider)
 
+        # Newly imported model might redefine already looked-up cubes
+        self.flush_lookup_cache()
+
     def add_slicer(self, name, url, **options):
         """Register a slicer as a model and data provider."""
         self.register_store(name, "slicer", url=url, **options)
@@ -2,11 +2,20 @@
 from __future__ import absolute_import
 
 from unittest import TestCase, skip
+import threading
 import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
 
-from cubes.sql import SQLStore
+from cubes.sql import SQLStore, SQLBrowser
+from cubes.query import Cell, Drilldown, cuts_from_string
+from cubes.query import AggregationBrowser
+from cubes.metadata import ModelProvider
+from cubes.errors import ArgumentError, ConfigurationError, QueryTimeoutError
+from cubes.errors import QueryCancelledError, TooManyRowsError
+from cubes.errors import NoSuchAttributeError
 from cubes.sql.query import StarSchema, FACT_KEY_LABEL, to_join
 from cubes.sql.query import QueryContext
+from cubes.sql.utils import seek_query
 from cubes.sql.mapper import map_base_attributes, StarSchemaMapper
 from cubes.sql.mapper import distill_naming
 
@@ -130,6 +139,38 @@ class SQLStatementsTestCase(SQLQueryContextTestCase):
         self.assertEqual(len(keys), len(raw_keys))
         self.assertCountEqual(keys, raw_keys)
 
+    def assertSameFacts(self, condition, conditions):
+        """Assert that `condition` selects the same facts as disjunction of
+        `conditions`"""
+        select = self.select([FACT_KEY_LABEL], condition)
+        keys = [row[FACT_KEY_LABEL] for row in self.execute(select)]
+
+        select = self.select([FACT_KEY_LABEL], sa.or_(*conditions))
+        expected = [row[FACT_KEY_LABEL] for row in self.execute(select)]
+
+        self.assertCountEqual(keys, expected)
+
+    def test_condition_for_set(self):
+        paths = [[2015, 1], [2015, 2, 3], ["2015", "3"], [2015, 2, 4]]
+        points = [self.context.condition_for_point("date", path)
+                  for path in paths]
+
+        # Portable conditions
+        condition = self.context.condition_for_set("date", paths)
+        self.assertSameFacts(condition, points)
+
+        # Row values
+        self.context.dialect = self.dw.engine.dialect
+        condition = self.context.condition_for_set("date", paths)
+        self.assertIn(" IN ", str(condition))
+        self.assertSameFacts(condition, points)
+
+        paths = [[1], [2], [11]]
+        points = [self.context.condition_for_point("item", path)
+                  for path in paths]
+        condition = self.context.condition_for_set("item", paths)
+        self.assertSameFacts(condition, points)
+
     @skip("Test missing")
     def test_range_condition(self):
         """"Test Browser.range_condition"""
@@ -174,3 +215,1090 @@ class SQLAggregateTestCase(SQLQueryContextTestCase):
         """Test drilldown with explicit hierarchy level"""
 
 
+class SQLBrowserTestCaseBase(SQLTestCase):
+    """Base for tests of the SQL browser on top of the demo data
+    warehouse."""
+    @classmethod
+    def setUpClass(self):
+        self.dw = create_demo_dw(CONNECTION, None, False)
+        self.store = SQLStore(engine=self.dw.engine,
+                              metadata=self.dw.md,
+                              fact_prefix="fact_",
+                              dimension_prefix="dim_")
+        self.provider = TinyDemoModelProvider()
+        self.cube = self.provider.cube("sales")
+
+    def setUp(self):
+        self.store.flush_cache()
+
+    def browser(self, **options):
+        return SQLBrowser(self.cube, self.store, **options)
+
+    def assertSameAggregation(self, first, second, **kwargs):
+        first = first.aggregate(aggregates=["price_sum"], **kwargs)
+        second = second.aggregate(aggregates=["price_sum"], **kwargs)
+
+        self.assertEqual(first.summary, second.summary)
+        self.assertEqual(first.total_cell_count, second.total_cell_count)
+        self.assertEqual(first.labels, second.labels)
+        self.assertEqual(list(first.cells), list(second.cells))
+
+
+class SQLBrowserTestCase(SQLBrowserTestCaseBase):
+    def test_unknown_function(self):
+        # The demo model used to declare 'average', which is not a function.
+        # It is taken for a calculation over a non-existent 'price' aggregate
+        # and any aggregation of all the aggregates failed.
+        provider = TinyDemoModelProvider()
+        aggregates = provider.cubes_metadata["sales"]["aggregates"]
+        aggregates[1] = dict(aggregates[1], function="average")
+        browser = SQLBrowser(provider.cube("sales"), self.store)
+
+        with self.assertRaisesRegex(NoSuchAttributeError, "'price_avg'"):
+            browser.aggregate()
+
+    def test_shared_star_schema(self):
+        """Browsers of the same store share the star schema"""
+        first = self.browser()
+        second = self.browser()
+        self.assertIs(first.star, second.star)
+
+        other = self.browser(locale="sk")
+        self.assertIsNot(first.star, other.star)
+
+        denormalized = self.browser(use_denormalization=True)
+        self.assertIsNot(first.star, denormalized.star)
+
+        # Pre-aggregated tables are cached together with the star schema
+        tables = [{"table": "agg_sales", "dimensions": ["date:year"],
+                   "aggregates": ["price_sum"]}]
+        aggregated = self.browser(aggregate_tables=tables)
+        self.assertEqual([c.table for c in aggregated._cuboids],
+                         ["agg_sales"])
+        self.assertEqual(self.browser()._cuboids, [])
+
+    def test_flush_star_schema(self):
+        first = self.browser()
+        self.store.flush_cache()
+        second = self.browser()
+        self.assertIsNot(first.star, second.star)
+
+    def test_shared_context(self):
+        first = self.browser()
+        second = self.browser()
+
+        attrs = self.cube.get_attributes(["date.year", "price_sum"],
+                                         aggregated=True)
+        self.assertIs(first._create_context(attrs),
+                      second._create_context(attrs))
+
+        result = second.aggregate(aggregates=["price_sum"],
+                                  drilldown=["date"])
+        self.assertEqual(len(list(result.cells)), result.total_cell_count)
+
+    def test_grouping_sets(self):
+        """Grouping sets aggregation gives the same result as separate
+        summary, count and drilldown statements"""
+        plain = self.browser()
+        grouped = self.browser(use_grouping_sets=True)
+
+        self.assertEqual(grouped.grouping_sets_mode(), "union")
+
+        self.assertSameAggregation(plain, grouped, drilldown=["date"])
+        self.assertSameAggregation(plain, grouped,
+                                   drilldown=["date:month", "item"],
+                                   page=1, page_size=3)
+        self.assertSameAggregation(plain, grouped,
+                                   drilldown=["item"],
+                                   order=[("price_sum", "desc")])
+
+        split = Cell(self.cube, cuts_from_string(self.cube, "date:2015"))
+        self.assertSameAggregation(plain, grouped,
+                                   drilldown=["item"], split=split)
+
+        # Page past the last cell
+        self.assertSameAggregation(plain, grouped,
+                                   drilldown=["category"],
+                                   page=10, page_size=4)
+
+    def test_native_grouping_sets(self):
+        """Native GROUPING SETS statement is generated for PostgreSQL"""
+        engine = sa.create_engine("postgresql://", strategy="mock",
+                                  executor=lambda *args, **kwargs: None)
+        store = SQLStore(engine=engine,
+                         metadata=self.dw.md,
+                         fact_prefix="fact_",
+                         dimension_prefix="dim_")
+        browser = SQLBrowser(self.cube, store, use_grouping_sets=True)
+
+        self.assertEqual(browser.grouping_sets_mode(), "native")
+
+        cell = Cell(self.cube)
+        aggregates = browser.prepare_aggregates(["price_sum"])
+        drilldown = Drilldown(["date:month", "item"], cell)
+        (statement, labels) = browser.grouping_sets_statement(
+            cell, aggregates, [None, drilldown]
+        )
+
+        compiled = str(statement.compile(dialect=engine.dialect))
+        self.assertIn("GROUP BY GROUPING SETS((), (", compiled)
+        self.assertIn("grouping(", compiled)
+        self.assertNotIn("UNION ALL", compiled)
+
+    def test_server_version(self):
+        browser = self.browser()
+        self.assertEqual(browser.server_version(),
+                         self.dw.engine.dialect.server_version_info)
+        self.assertTrue(browser.supports_window_functions())
+
+    def test_stream_results(self):
+        """Streamed results are fetched in batches and give the same rows"""
+        plain = self.browser()
+        streamed = self.browser(stream_results=True, yield_per=2)
+
+        self.assertEqual(list(plain.facts()), list(streamed.facts()))
+        self.assertSameAggregation(plain, streamed, drilldown=["item"])
+
+        facts = streamed.facts()
+        next(iter(facts))
+        facts.close()
+        self.assertEqual(list(facts), [])
+
+    def test_members_from_dimension(self):
+        """Members are selected from dimension tables unless cut by other
+        dimensions"""
+        browser = self.browser()
+        with_facts = self.browser(members_with_facts=True)
+
+        members = list(browser.members(None, "item"))
+        self.assertEqual(len(members), 17)
+        self.assertEqual(len(list(with_facts.members(None, "item"))), 5)
+
+        departments = list(with_facts.members(None, "department"))
+        self.assertEqual([member["department.name"] for member in departments],
+                         ["grocery", "fashion"])
+
+        # Cut of other dimension needs the fact table
+        cell = Cell(self.cube, cuts_from_string(self.cube, "date:2015"))
+        self.assertEqual(list(browser.members(cell, "item")),
+                         list(with_facts.members(None, "item")))
+
+        cell = Cell(self.cube, cuts_from_string(self.cube, "item:12"))
+        members = list(browser.members(cell, "item"))
+        self.assertEqual([member["item.name"] for member in members],
+                         ["soap"])
+
+    def test_cell_details(self):
+        """Batched cell details are the same as details of each path"""
+        browser = self.browser(members_with_facts=True)
+
+        cuts = ["date:2015,1|item:1;2;3;12|category:1-4",
+                "date:2015;2015,1;2015,2,3|item:-3",
+                "date@ym:2015,1"]
+
+        for string in cuts:
+            cell = Cell(self.cube, cuts_from_string(self.cube, string))
+            self.assertEqual(browser.cell_details(cell),
+                             AggregationBrowser.cell_details(browser, cell))
+
+        # Details from the dimension table, regardless of facts
+        cell = Cell(self.cube, cuts_from_string(self.cube, "item:12"))
+        details = self.browser().cell_details(cell, "item")
+        self.assertEqual(details[0][0]["_label"], "soap")
+
+    def test_report(self):
+        """Fused and separately executed report queries give the same
+        results"""
+        browser = self.browser(use_grouping_sets=True)
+        cell = Cell(self.cube, cuts_from_string(self.cube, "date:2015"))
+        aggregates = ["price_sum", "price_avg"]
+
+        queries = {
+            "item": {"query": "aggregate", "drilldown": ["item"],
+                     "aggregates": aggregates},
+            "month": {"query": "aggregate", "drilldown": ["date:month"],
+                      "aggregates": aggregates},
+            "category": {"query": "aggregate",
+                         "drilldown": ["category", "date:year"],
+                         "aggregates": aggregates},
+            "paged": {"query": "aggregate", "drilldown": ["item"],
+                      "page": 0, "page_size": 2},
+            "members": {"query": "members", "dimension": "item"},
+        }
+
+        fused = browser._fusable_queries(cell, queries)
+        self.assertEqual([sorted(names) for names, _, _ in fused],
+                         [["category", "item", "month"]])
+
+        # Not fused unless grouping sets are allowed
+        self.assertEqual(self.browser()._fusable_queries(cell, queries), [])
+
+        report = browser.report(cell, queries)
+        expected = AggregationBrowser.report(browser, cell, queries)
+
+        self.assertEqual(sorted(report.keys()), sorted(queries.keys()))
+        for name in ["item", "month", "category", "paged"]:
+            self.assertEqual(report[name].summary, expected[name].summary)
+            self.assertEqual(list(report[name].cells),
+                             list(expected[name].cells))
+            self.assertEqual(report[name].total_cell_count,
+                             expected[name].total_cell_count)
+
+        self.assertEqual(list(report["members"]),
+                         list(expected["members"]))
+
+        with self.assertRaises(ArgumentError):
+            browser.report(cell, {"unknown": {"drilldown": ["item"]}})
+
+    def test_top_remainder(self):
+        browser = self.browser()
+        if not browser.supports_window_functions():
+            self.skipTest("Database does not support window functions")
+
+        order = [("price_sum", "desc")]
+        cells = list(browser.aggregate(drilldown=["item"], order=order))
+
+        result = browser.aggregate(drilldown=["item"], top=2)
+        self.assertEqual(list(result.cells), cells[:2])
+        self.assertEqual(result.total_cell_count, len(cells))
+        self.assertEqual(result.remainder["price_sum"],
+                         sum(cell["price_sum"] for cell in cells[2:]))
+        # Average of the remaining cells can not be rolled up
+        self.assertIsNone(result.remainder["price_avg"])
+
+        result = browser.aggregate(drilldown=["item"], top=2,
+                                   remainder=False)
+        self.assertEqual(len(result.cells), 2)
+        self.assertEqual(result.remainder, {})
+
+        result = browser.aggregate(drilldown=["item"], top=len(cells))
+        self.assertEqual(list(result.cells), cells)
+        self.assertEqual(result.remainder, {})
+
+        with self.assertRaises(ArgumentError):
+            browser.aggregate(drilldown=["item"], top=0)
+        with self.assertRaises(ArgumentError):
+            browser.aggregate(drilldown=["item"], top=2, page=0, page_size=2)
+
+    def test_result_rows(self):
+        browser = self.browser()
+        facts = list(browser.facts())
+        record = facts[0]
+
+        self.assertEqual(record, record.to_dict())
+        self.assertEqual(record.pick(["price", "quantity"]),
+                         (record["price"], record["quantity"]))
+        self.assertIsNone(record.get("unknown"))
+
+        record["price"] = 0
+        record["extra"] = 1
+        self.assertEqual(record.pick(["price", "extra"]), (0, 1))
+        del record["quantity"]
+        self.assertNotIn("quantity", record)
+        self.assertEqual(len(record), len(facts[1]))
+
+        result = browser.facts()
+        self.assertEqual(list(browser.facts().tuples()),
+                         [tuple(fact[label] for label in result.labels)
+                          for fact in result])
+
+        streamed = self.browser(stream_results=True, yield_per=2)
+        batches = list(streamed.facts().batches())
+        self.assertEqual(len(batches[0]["price"]), 2)
+        self.assertEqual(sum(len(batch["price"]) for batch in batches),
+                         len(facts))
+
+
+class SQLJoinEliminationTestCase(SQLBrowserTestCaseBase):
+    """Test elimination of joins of dimension tables."""
+    def setUp(self):
+        # Facts are appended, every test needs a fresh warehouse
+        self.setUpClass()
+
+        # Fact without a matching item
+        facts = self.dw.md.tables["fact_sales"]
+        row = dict(self.dw.engine.execute(facts.select()).first())
+        self.dw.engine.execute(facts.insert(),
+                               dict(row, id=1000, item_key=1000))
+
+    def count(self, browser):
+        cell = Cell(self.cube, cuts_from_string(self.cube, "item:1000"))
+        return browser.aggregate(cell, aggregates=["price_sum"]).summary
+
+    def test_opt_in(self):
+        # Facts without matching items are filtered out by the join
+        self.assertFalse(self.browser().eliminate_joins)
+        self.assertEqual(self.count(self.browser())["price_sum"], 0)
+
+        # Referential integrity is expected, the join is not used
+        browser = self.browser(eliminate_joins=True)
+        self.assertNotEqual(self.count(browser)["price_sum"], 0)
+
+
+class SQLKeysetPaginationTestCase(SQLBrowserTestCaseBase):
+    """Test pagination with cursors."""
+    def all_pages(self, method, page_size, **kwargs):
+        rows = []
+        cursor = ""
+
+        while cursor is not None:
+            result = method(page_size=page_size, cursor=cursor, **kwargs)
+            page = list(getattr(result, "cells", result))
+            self.assertLessEqual(len(page), page_size)
+
+            rows += page
+            cursor = result.next_cursor
+
+        return rows
+
+    def test_facts(self):
+        browser = self.browser()
+        facts = list(browser.facts())
+
+        pages = self.all_pages(browser.facts, 2)
+        self.assertEqual(pages, facts)
+
+        # Mixed directions, not unique
+        pages = self.all_pages(browser.facts, 2, order=[("price", "desc")])
+        self.assertEqual(sorted(fact["price"] for fact in facts),
+                         [fact["price"] for fact in reversed(pages)])
+        self.assertEqual(len(set(fact[FACT_KEY_LABEL] for fact in pages)),
+                         len(facts))
+
+    def test_members(self):
+        browser = self.browser()
+        members = list(browser.members(None, "item"))
+
+        pages = self.all_pages(browser.members, 2, cell=None,
+                               dimension="item")
+        self.assertEqual(pages, members)
+
+    def test_drilldown(self):
+        browser = self.browser()
+        kwargs = {
+            "aggregates": ["price_sum"],
+            "drilldown": ["date:month", "item"],
+            "order": [("price_sum", "desc")]
+        }
+        result = browser.aggregate(**kwargs)
+
+        pages = self.all_pages(browser.aggregate, 3, **kwargs)
+        self.assertEqual(pages, list(result.cells))
+
+    def test_invalid_cursor(self):
+        browser = self.browser()
+
+        with self.assertRaises(ArgumentError):
+            browser.facts(page_size=2, cursor="invalid")
+
+        cursor = browser.facts(page_size=2, cursor="").next_cursor
+        with self.assertRaises(ArgumentError):
+            browser.facts(page_size=2, cursor=cursor,
+                          order=[("price", None)])
+
+        with self.assertRaises(ArgumentError):
+            browser.facts(cursor="")
+
+        # Different direction
+        cursor = browser.facts(page_size=2, cursor="",
+                               order=[("price", "asc")]).next_cursor
+        with self.assertRaises(ArgumentError):
+            browser.facts(page_size=2, cursor=cursor,
+                          order=[("price", "desc")])
+
+
+class SQLKeysetPaginationNullTestCase(SQLKeysetPaginationTestCase):
+    """Test pagination with cursors when the ordering keys contain NULL
+    values."""
+    def setUp(self):
+        # Values are set to NULL, every test needs a fresh warehouse
+        self.setUpClass()
+
+        facts = self.dw.md.tables["fact_sales"]
+        self.dw.engine.execute(facts.update()
+                               .where(facts.c.id.in_([2, 3, 5, 8]))
+                               .values(discount=None))
+
+        items = self.dw.md.tables["dim_item"]
+        keys = [row[0] for row in self.dw.engine.execute(
+                    sa.select([items.c.item_key]).order_by(items.c.item_key))]
+        self.dw.engine.execute(items.update()
+                               .where(items.c.item_key.in_(keys[1:3]))
+                               .values(name=None))
+
+    def test_null_facts(self):
+        browser = self.browser()
+
+        for direction in ["asc", "desc"]:
+            order = [("discount", direction)]
+            facts = list(browser.facts(order=order))
+
+            for page_size in [1, 2, 4]:
+                pages = self.all_pages(browser.facts, page_size, order=order)
+                self.assertEqual([fact["discount"] for fact in pages],
+                                 [fact["discount"] for fact in facts])
+                self.assertEqual(set(fact[FACT_KEY_LABEL] for fact in pages),
+                                 set(fact[FACT_KEY_LABEL] for fact in facts))
+
+    def test_null_drilldown(self):
+        browser = self.browser()
+
+        for direction in ["asc", "desc"]:
+            kwargs = {
+                "aggregates": ["price_sum"],
+                "drilldown": ["item"],
+                "order": [("item.name", direction)]
+            }
+            result = list(browser.aggregate(**kwargs).cells)
+            self.assertIn(None, [cell["item.name"] for cell in result])
+
+            pages = self.all_pages(browser.aggregate, 1, **kwargs)
+            self.assertEqual(len(pages), len(result))
+            self.assertEqual([cell["item.name"] for cell in pages],
+                             [cell["item.name"] for cell in result])
+
+    def test_explicit_nulls(self):
+        table = sa.table("facts", sa.column("id"), sa.column("discount"))
+        statement = sa.select([table.c.id, table.c.discount])
+        (statement, keys) = seek_query(statement,
+                                       [("discount", "desc")],
+                                       labels=["id", "discount"],
+                                       keys=["id"],
+                                       page_size=2,
+                                       explicit_nulls=True)
+
+        self.assertEqual(keys, [("discount", "desc"), ("id", "asc")])
+        compiled = str(statement.compile(dialect=postgresql.dialect()))
+        self.assertIn("discount DESC NULLS LAST", compiled)
+        self.assertIn("id NULLS FIRST", compiled)
+
+
+class SQLAggregateTableTestCase(SQLBrowserTestCaseBase):
+    """Test routing of aggregations to pre-aggregated tables."""
+    @classmethod
+    def setUpClass(self):
+        super(SQLAggregateTableTestCase, self).setUpClass()
+        self.cuboid = self.store.create_cube_aggregate(
+            self.cube, "agg_sales",
+            dimensions=["date:month", "item"],
+            aggregates=["price_sum"])
+
+    def aggregates(self, names):
+        return self.cube.get_aggregates(names)
+
+    def test_registered(self):
+        self.assertEqual(self.cuboid.row_count, 8)
+        self.assertEqual(self.store.navigator.cuboids("sales"),
+                         [self.cuboid])
+
+    def test_find_cuboid(self):
+        browser = self.browser()
+        cell = Cell(self.cube, cuts_from_string(self.cube, "date:2015"))
+        price_sum = self.aggregates(["price_sum"])
+
+        drilldown = Drilldown(["date"], cell)
+        self.assertIs(browser.find_cuboid(cell, price_sum, drilldown),
+                      self.cuboid)
+
+        # Finer than the grain
+        drilldown = Drilldown(["date:day"], cell)
+        self.assertIsNone(browser.find_cuboid(cell, price_sum, drilldown))
+
+        # Dimension not in the grain
+        drilldown = Drilldown(["category"], cell)
+        self.assertIsNone(browser.find_cuboid(cell, price_sum, drilldown))
+
+        # Not an additive aggregate
+        drilldown = Drilldown(["date"], cell)
+        price_avg = self.aggregates(["price_avg"])
+        self.assertIsNone(browser.find_cuboid(cell, price_avg, drilldown))
+
+        browser = self.browser(use_aggregate_tables=False)
+        self.assertIsNone(browser.find_cuboid(cell, price_sum, drilldown))
+
+    def test_aggregate(self):
+        base = self.browser(use_aggregate_tables=False)
+        browser = self.browser()
+
+        self.assertSameAggregation(base, browser, drilldown=["date"])
+        self.assertSameAggregation(base, browser, drilldown=["date:month"],
+                                   cell="date:2015,2")
+        self.assertSameAggregation(base, browser, drilldown=["item"],
+                                   split="date:2015,1")
+        self.assertSameAggregation(base, browser, drilldown=["category"])
+
+
+class SQLWindowAggregateTestCase(SQLBrowserTestCaseBase):
+    """Test moving window aggregates computed by SQL window functions."""
+    @classmethod
+    def setUpClass(self):
+        super(SQLWindowAggregateTestCase, self).setUpClass()
+
+        provider = TinyDemoModelProvider()
+        cube = [cube for cube in provider.metadata["cubes"]
+                if cube["name"] == "sales"][0]
+        cube["aggregates"] += [
+            {"name": "price_sma", "measure": "price_sum", "function": "sma",
+             "window_size": 2},
+            {"name": "price_sms", "measure": "price_sum", "function": "sms",
+             "window_size": 3},
+            {"name": "price_smvar", "measure": "price_sum",
+             "function": "smvar", "window_size": 2},
+        ]
+        self.cube = provider.cube("sales")
+
+    def aggregate(self, browser, **kwargs):
+        result = browser.aggregate(aggregates=["price_sum", "price_sma",
+                                               "price_sms", "price_smvar"],
+                                   drilldown=["date:month"],
+                                   **kwargs)
+        return [dict(cell) for cell in result]
+
+    def test_builtin(self):
+        browser = self.browser()
+        if not browser.supports_window_functions():
+            self.skipTest("Database does not support window functions")
+
+        self.assertTrue(browser.is_builtin_function("sma"))
+        # Weighted average is always calculated on the result
+        self.assertFalse(browser.is_builtin_function("wma"))
+
+    def test_same_as_calculated(self):
+        browser = self.browser()
+        if not browser.supports_window_functions():
+            self.skipTest("Database does not support window functions")
+
+        calculated = self.browser()
+        calculated.window_functions = lambda: []
+
+        cells = self.aggregate(browser)
+        expected = self.aggregate(calculated)
+
+        self.assertEqual(len(cells), len(expected))
+        for cell, other in zip(cells, expected):
+            self.assertEqual(sorted(cell.keys()), sorted(other.keys()))
+            for key in cell.keys():
+                self.assertAlmostEqual(cell[key], other[key], places=2)
+
+    def test_pagination(self):
+        browser = self.browser()
+        if not browser.supports_window_functions():
+            self.skipTest("Database does not support window functions")
+
+        cells = self.aggregate(browser)
+        self.assertEqual(self.aggregate(browser, page=1, page_size=2),
+                         cells[2:4])
+
+        page = browser.aggregate(aggregates=["price_sma"],
+                                 drilldown=["date:month"],
+                                 page_size=2, cursor="")
+        page = browser.aggregate(aggregates=["price_sma"],
+                                 drilldown=["date:month"],
+                                 page_size=2, cursor=page.next_cursor)
+        self.assertEqual([cell["price_sma"] for cell in page],
+                         [cell["price_sma"] for cell in cells[2:4]])
+
+
+class SQLSketchAggregateTestCase(SQLBrowserTestCaseBase):
+    """Test approximate distinct counts and sketches in pre-aggregated
+    tables."""
+    @classmethod
+    def setUpClass(self):
+        super(SQLSketchAggregateTestCase, self).setUpClass()
+
+        provider = TinyDemoModelProvider()
+        cube = [cube for cube in provider.metadata["cubes"]
+                if cube["name"] == "sales"][0]
+        cube["aggregates"] += [
+            {"name": "price_distinct", "measure": "price",
+             "function": "count_distinct"},
+            {"name": "price_approx", "measure": "price",
+             "function": "approx_count_distinct"},
+        ]
+        self.cube = provider.cube("sales")
+
+        self.cuboid = self.store.create_cube_aggregate(
+            self.cube, "agg_sales_sketch",
+            dimensions=["date:month", "item"],
+            aggregates=["price_sum", "price_approx"])
+
+    @classmethod
+    def tearDownClass(self):
+        self.store.navigator.unregister("sales", "agg_sales_sketch",
+                                        self.cuboid.schema)
+
+    def aggregate(self, browser, aggregates, **kwargs):
+        result = browser.aggregate(aggregates=aggregates, **kwargs)
+        cells = [tuple(cell[label] for label in result.labels)
+                 for cell in result.cells]
+        return (result.summary, cells, result.total_cell_count)
+
+    def assertSameCounts(self, **kwargs):
+        base = self.browser(use_aggregate_tables=False)
+        browser = self.browser()
+
+        result = self.aggregate(browser, ["price_sum", "price_approx"],
+                                **kwargs)
+
+        if "order" in kwargs:
+            kwargs["order"] = [(name.replace("approx", "distinct"), direction)
+                               for name, direction in kwargs["order"]]
+        expected = self.aggregate(base, ["price_sum", "price_distinct"],
+                                  **kwargs)
+
+        (summary, cells, count) = expected
+        summary = {"price_sum": summary["price_sum"],
+                   "price_approx": summary["price_distinct"]}
+        self.assertEqual(result, (summary, cells, count))
+
+    def test_without_aggregate_table(self):
+        browser = self.browser(use_aggregate_tables=False)
+        result = browser.aggregate(aggregates=["price_distinct",
+                                               "price_approx"],
+                                   drilldown=["category"])
+
+        self.assertEqual(result.summary["price_approx"],
+                         result.summary["price_distinct"])
+        for cell in result.cells:
+            self.assertEqual(cell["price_approx"], cell["price_distinct"])
+
+    def test_find_cuboid(self):
+        browser = self.browser()
+        cell = Cell(self.cube)
+        drilldown = Drilldown(["date"], cell)
+        aggregates = self.cube.get_aggregates(["price_sum", "price_approx"])
+
+        # Sketches are not rolled-up by the database
+        self.assertIsNone(browser.find_cuboid(cell, aggregates, drilldown))
+        self.assertIs(browser.find_cuboid(cell, aggregates, drilldown,
+                                          sketches=True),
+                      self.cuboid)
+
+    def test_merged_sketches(self):
+        self.assertSameCounts()
+        self.assertSameCounts(drilldown=["date"])
+        self.assertSameCounts(drilldown=["item"], cell="date:2015,2")
+        self.assertSameCounts(drilldown=["date:month"],
+                              order=[("price_approx", "desc")])
+        self.assertSameCounts(drilldown=["item"], split="date:2015,1")
+        self.assertSameCounts(drilldown=["date:month", "item"],
+                              page=1, page_size=3)
+
+
+class SQLCardinalityTestCase(SQLBrowserTestCaseBase):
+    """Test estimates of the number of cells from dimension statistics."""
+    @classmethod
+    def setUpClass(self):
+        super(SQLCardinalityTestCase, self).setUpClass()
+        self.estimator = self.store.collect_statistics(self.cube)
+
+    def cell(self, string=None):
+        if string:
+            return Cell(self.cube, cuts_from_string(self.cube, string))
+        else:
+            return Cell(self.cube)
+
+    def test_statistics(self):
+        self.assertEqual(self.estimator.fact_count, 9)
+        self.assertEqual(self.estimator.level_count("date", "ymd", 1), 4)
+        self.assertEqual(self.estimator.level_count("date", None, 2), 37)
+        self.assertEqual(self.estimator.level_count("item", None, 1), 17)
+        self.assertIs(self.store.cardinality_estimator(self.cube),
+                      self.estimator)
+
+    def test_estimate(self):
+        browser = self.browser(use_statistics=True)
+
+        cell = self.cell()
+        self.assertEqual(browser.estimate_cell_count(cell,
+                                                     Drilldown(["date"],
+                                                               cell)),
+                         4)
+        # There are less facts than items
+        self.assertEqual(browser.estimate_cell_count(cell,
+                                                     Drilldown(["item"],
+                                                               cell)),
+                         9)
+
+        cell = self.cell("date:2015")
+        drilldown = Drilldown(["date:month"], cell)
+        self.assertEqual(browser.estimate_cell_count(cell, drilldown), 3)
+
+        browser = self.browser()
+        self.assertIsNone(browser.estimate_cell_count(cell, drilldown))
+
+    def test_refuse(self):
+        browser = self.browser(use_statistics=True, row_budget=3)
+
+        with self.assertRaises(ArgumentError):
+            browser.aggregate(drilldown=["item"])
+
+        result = browser.aggregate(drilldown=["item"], page=0, page_size=3)
+        self.assertEqual(len(list(result.cells)), 3)
+
+        result = browser.aggregate(cell="date:2015", drilldown=["item"])
+        self.assertEqual(result.estimated_cell_count, 3)
+
+        # Fused report queries are refused as well
+        browser = self.browser(use_statistics=True, row_budget=3,
+                               use_grouping_sets=True)
+        queries = {
+            "item": {"query": "aggregate", "drilldown": ["item"]},
+            "date": {"query": "aggregate", "drilldown": ["date"]},
+        }
+        with self.assertRaises(ArgumentError):
+            browser.report(self.cell(), queries)
+
+    def test_paginate(self):
+        browser = self.browser(use_statistics=True, row_budget=3,
+                               over_budget="paginate")
+        result = browser.aggregate(drilldown=["item"])
+
+        self.assertEqual(len(list(result.cells)), 3)
+        self.assertEqual(result.estimated_cell_count, 9)
+        self.assertEqual(result.total_cell_count,
+                         self.browser().aggregate(drilldown=["item"])
+                         .total_cell_count)
+
+        # Queries over the budget are not fused, they are paginated
+        browser = self.browser(use_statistics=True, row_budget=4,
+                               over_budget="paginate",
+                               use_grouping_sets=True)
+        queries = {
+            "item": {"query": "aggregate", "drilldown": ["item"]},
+            "date": {"query": "aggregate", "drilldown": ["date"]},
+            "year": {"query": "aggregate", "drilldown": ["date:year"]},
+        }
+        fused = browser._fusable_queries(self.cell(), queries)
+        self.assertEqual([sorted(names) for names, _, _ in fused],
+                         [["date", "year"]])
+
+        report = browser.report(self.cell(), queries)
+        self.assertEqual(len(list(report["item"].cells)), 4)
+
+
+class SQLStatementCacheTestCase(SQLBrowserTestCaseBase):
+    """Test caching of compiled statements by query shape."""
+
+    def aggregate(self, browser, cell, **kwargs):
+        cell = Cell(self.cube, cuts_from_string(self.cube, cell))
+        result = browser.aggregate(cell, **kwargs)
+        return (result.summary, list(result.cells))
+
+    def test_same_as_uncached(self):
+        cached = self.browser()
+        uncached = self.browser(cache_statements=False)
+
+        for string in ["date:2015", "date:2016", "date:2015;2016",
+                       "date:2015,1-2015,12"]:
+            self.assertEqual(self.aggregate(cached, string,
+                                            drilldown=["item"]),
+                             self.aggregate(uncached, string,
+                                            drilldown=["item"]))
+
+    def test_reuse(self):
+        browser = self.browser()
+        calls = []
+        original = browser.aggregation_statement
+
+        def aggregation_statement(*args, **kwargs):
+            calls.append(args)
+            return original(*args, **kwargs)
+
+        browser.aggregation_statement = aggregation_statement
+
+        self.aggregate(browser, "date:2015", drilldown=["item"])
+        count = len(calls)
+        self.assertTrue(count > 0)
+
+        # Same shape, different values
+        self.aggregate(browser, "date:2016", drilldown=["item"])
+        self.assertEqual(len(calls), count)
+
+        # Sets of different sizes share the shape
+        self.aggregate(browser, "date:2015;2016", drilldown=["item"])
+        count = len(calls)
+        self.aggregate(browser, "date:2015;2016;2017", drilldown=["item"])
+        self.assertEqual(len(calls), count)
+
+        # Different drilldown is a different shape
+        self.aggregate(browser, "date:2015", drilldown=["date"])
+        self.assertTrue(len(calls) > count)
+
+
+class SQLRolePlayingCacheTestCase(SQLTestCase):
+    """Test statement cache with cuts of role-playing dimensions – aliases
+    of the same table."""
+    def setUp(self):
+        self.dw = create_demo_dw(CONNECTION, None, False)
+        table = sa.Table("fact_shipments", self.dw.md,
+                         sa.Column("id", sa.Integer, primary_key=True),
+                         sa.Column("order_date_key", sa.Integer),
+                         sa.Column("ship_date_key", sa.Integer),
+                         sa.Column("amount", sa.Integer))
+        self.dw.md.create_all()
+        self.dw.engine.execute(table.insert(), [
+            {"id": 1, "order_date_key": 20141230, "ship_date_key": 20150105,
+             "amount": 1},
+            {"id": 2, "order_date_key": 20140601, "ship_date_key": 20140605,
+             "amount": 10},
+            {"id": 3, "order_date_key": 20150601, "ship_date_key": 20150605,
+             "amount": 100},
+        ])
+
+        roles = ["order_date", "ship_date"]
+        metadata = {
+            "cubes": [{
+                "name": "shipments",
+                "dimensions": roles,
+                "measures": ["amount"],
+                "aggregates": [
+                    {"name": "amount_sum", "measure": "amount",
+                     "function": "sum"}
+                ],
+                # Years extracted from the date column of the aliases
+                "mappings": dict((role, {"table": role, "column": "date",
+                                         "extract": "year"})
+                                 for role in roles),
+                "joins": [{"master": "fact_shipments.%s_key" % role,
+                           "detail": "dim_date.date_key",
+                           "alias": role}
+                          for role in roles]
+            }],
+            "dimensions": [{"name": role, "levels": [{"name": "year"}]}
+                           for role in roles]
+        }
+        self.cube = ModelProvider(metadata).cube("shipments")
+        self.store = SQLStore(engine=self.dw.engine, metadata=self.dw.md,
+                              fact_prefix="fact_")
+
+    def test_roles(self):
+        for options in [{}, {"safe_labels": True}]:
+            browser = SQLBrowser(self.cube, self.store, **options)
+            sums = []
+            for string in ["order_date:2014", "ship_date:2014"]:
+                cell = Cell(self.cube, cuts_from_string(self.cube, string))
+                sums.append(browser.aggregate(cell).summary["amount_sum"])
+
+            self.assertEqual(sums, [11, 10])
+
+
+class SQLAggregateFingerprintTestCase(SQLBrowserTestCaseBase):
+    """Test fingerprints of aggregation requests."""
+
+    def test_equivalent(self):
+        browser = self.browser()
+        fingerprint = browser.aggregate_fingerprint
+
+        self.assertEqual(fingerprint("date:2015|item:a", drilldown=["date"]),
+                         fingerprint("item:a|date:2015",
+                                     drilldown=["date:month"]))
+        self.assertEqual(fingerprint(drilldown=["date"]),
+                         fingerprint(Cell(self.cube), drilldown=["date"],
+                                     aggregates=self.cube.aggregates))
+
+    def test_different(self):
+        fingerprint = self.browser().aggregate_fingerprint
+        base = fingerprint("date:2015", drilldown=["date"])
+
+        self.assertNotEqual(base, fingerprint("date:2016",
+                                              drilldown=["date"]))
+        self.assertNotEqual(base, fingerprint("date:2015",
+                                              drilldown=["date:day"]))
+        self.assertNotEqual(base, fingerprint("date:2015",
+                                              drilldown=["date"],
+                                              page=1, page_size=10))
+        self.assertNotEqual(base, fingerprint("date:2015",
+                                              drilldown=["date"],
+                                              order=[("date.year", "desc")]))
+        self.assertNotEqual(base, fingerprint("date:2015",
+                                              drilldown=["date"],
+                                              split="item:a"))
+
+
+class SQLQueryLimitsTestCase(SQLBrowserTestCaseBase):
+    """Test statement timeout, maximal number of rows and cancellation."""
+
+    # Counts to ten million, long enough to exceed the timeout
+    SLOW_STATEMENT = sa.text("WITH RECURSIVE c(x) AS "
+                             "(SELECT 1 UNION ALL SELECT x + 1 FROM c "
+                             "WHERE x < 10000000) SELECT count(*) FROM c")
+
+    def test_restrict(self):
+        browser = self.browser(statement_timeout=10, max_rows=100)
+        browser.restrict_limits(timeout=20, max_rows=5)
+
+        self.assertEqual(browser.limits.timeout, 10)
+        self.assertEqual(browser.limits.max_rows, 5)
+
+    def test_max_rows(self):
+        browser = self.browser(max_rows=3)
+
+        with self.assertRaises(TooManyRowsError):
+            browser.aggregate(drilldown=["item"])
+
+        result = browser.aggregate(drilldown=["item"], page=0, page_size=3)
+        self.assertEqual(len(list(result.cells)), 3)
+
+        # Checked while fetching if the number of cells is not known
+        browser = self.browser(max_rows=3, include_cell_count=False)
+        result = browser.aggregate(drilldown=["item"])
+        with self.assertRaises(TooManyRowsError):
+            list(result.cells)
+
+        # Grouping sets statement
+        browser = self.browser(max_rows=3, use_grouping_sets=True)
+        with self.assertRaises(TooManyRowsError):
+            browser.aggregate(drilldown=["item"])
+
+        result = browser.aggregate(drilldown=["item"], page=0, page_size=3)
+        self.assertEqual(len(list(result.cells)), 3)
+
+        # Each of the fused report drill-downs
+        browser = self.browser(max_rows=3, use_grouping_sets=True)
+        queries = {
+            "year": {"query": "aggregate", "drilldown": ["date:year"]},
+            "item": {"query": "aggregate", "drilldown": ["item"]},
+        }
+        self.assertNotEqual(browser._fusable_queries(Cell(self.cube),
+                                                     queries), [])
+        with self.assertRaises(TooManyRowsError):
+            browser.report(Cell(self.cube), queries)
+
+    def test_timeout(self):
+        browser = self.browser(statement_timeout=0.05)
+
+        with self.assertRaises(QueryTimeoutError):
+            browser.execute(self.SLOW_STATEMENT).scalar()
+
+        # The connection is not limited any more
+        result = self.browser().aggregate()
+        self.assertEqual(result.summary["price_sum"], 99)
+
+    def test_cancellation(self):
+        cancellation = threading.Event()
+        browser = self.browser()
+        browser.restrict_limits(cancellation=cancellation)
+
+        result = browser.aggregate(drilldown=["item"])
+        cancellation.set()
+
+        with self.assertRaises(QueryCancelledError):
+            list(result.cells)
+
+        with self.assertRaises(QueryCancelledError):
+            browser.aggregate()
+
+
+class SQLIncrementalRefreshTestCase(SQLBrowserTestCaseBase):
+    """Test incremental refresh of aggregate tables and materialized
+    views."""
+    def setUp(self):
+        # Facts are appended, every test needs a fresh warehouse
+        self.setUpClass()
+
+    def append_facts(self):
+        facts = self.dw.md.tables["fact_sales"]
+        rows = [dict(row) for row in self.dw.engine.execute(facts.select())]
+        last = max(row["id"] for row in rows)
+        new = [dict(row, id=last + i + 1) for i, row in enumerate(rows[:4])]
+        self.dw.engine.execute(facts.insert(), new)
+
+    def assertAggregated(self, table, aggregates):
+        base = self.browser(use_aggregate_tables=False)
+        result = base.aggregate(aggregates=aggregates,
+                                drilldown=["date:month", "item"])
+        expected = sorted(tuple(cell[label] for label in result.labels)
+                          for cell in result.cells)
+
+        table = self.dw.md.tables[table]
+        rows = sorted(tuple(row) for row in self.dw.engine.execute(table.select()))
+        self.assertEqual(rows, expected)
+
+    def test_aggregate_rollup(self):
+        for i in range(2):
+            self.store.create_cube_aggregate(self.cube, "agg_sales",
+                                             dimensions=["date:month", "item"],
+                                             aggregates=["price_sum"],
+                                             watermark="id")
+            self.assertAggregated("agg_sales", ["price_sum"])
+            self.append_facts()
+
+        self.assertEqual(self.store.watermark("agg_sales"), "13")
+
+    def test_aggregate_nonadditive(self):
+        aggregates = ["price_sum", "price_avg"]
+        for i in range(2):
+            self.store.create_cube_aggregate(self.cube, "agg_sales",
+                                             dimensions=["date:month", "item"],
+                                             aggregates=aggregates,
+                                             watermark="id")
+            self.assertAggregated("agg_sales", aggregates)
+            self.append_facts()
+
+    def test_denormalized_view(self):
+        count = "SELECT COUNT(*) FROM {}"
+
+        for i in range(2):
+            self.store.create_denormalized_view(self.cube, "sales_view",
+                                                materialize=True,
+                                                watermark="id")
+            self.assertEqual(
+                self.dw.engine.execute(count.format("sales_view")).scalar(),
+                self.dw.engine.execute(count.format("fact_sales")).scalar())
+            self.append_facts()
+
+        with self.assertRaises(ArgumentError):
+            self.store.create_denormalized_view(self.cube, "sales_view",
+                                                watermark="id")
+
+
+class SQLDataVersionTestCase(SQLBrowserTestCaseBase):
+    """Test polling of the store's data version."""
+    def setUp(self):
+        # Facts are appended, every test needs a fresh warehouse
+        self.setUpClass()
+
+    def store_with(self, **options):
+        return SQLStore(engine=self.dw.engine,
+                        metadata=self.dw.md,
+                        fact_prefix="fact_",
+                        dimension_prefix="dim_",
+                        **options)
+
+    def append_fact(self):
+        facts = self.dw.md.tables["fact_sales"]
+        row = dict(self.dw.engine.execute(facts.select()).first())
+        last = self.dw.engine.execute("SELECT max(id) FROM fact_sales").scalar()
+        self.dw.engine.execute(facts.insert(), dict(row, id=last + 1))
+
+    def test_no_version(self):
+        self.assertIsNone(self.store.data_version())
+
+    def test_column_version(self):
+        store = self.store_with(data_version_table="fact_sales",
+                                data_version_column="id",
+                                data_version_interval="0")
+        version = store.data_version()
+        self.assertEqual(version, 9)
+
+        self.append_fact()
+        self.assertEqual(store.data_version(), 10)
+
+    def test_query_version(self):
+        store = self.store_with(data_version_query="SELECT count(*) "
+                                                   "FROM fact_sales")
+        self.assertEqual(store.data_version(), 9)
+
+        # Polled at most once per interval
+        self.append_fact()
+        self.assertEqual(store.data_version(), 9)
+
+    def test_invalid_options(self):
+        with self.assertRaises(ConfigurationError):
+            self.store_with(data_version_table="fact_sales")
+
+        with self.assertRaises(ConfigurationError):
+            self.store_with(data_version_table="fact_sales",
+                            data_version_column="id",
+                            data_version_query="SELECT 1")
@@ -361,6 +361,88 @@ class SchemaJoinsTestCase(SQLTestCase):
         tables = schema.required_tables(["category_label", "size_label"])
         self.assertCountEqual(tables, all_tables)
 
+    def test_join_elimination(self):
+        """Test that joins are eliminated for detail keys"""
+        joins = [
+            to_join(("test.category", "dim_category.category")),
+            to_join(("dim_category.size", "dim_size.size")),
+        ]
+
+        mappings = {
+            "amount":         Column(None, "test", "amount", None, None),
+            "category":       Column(None, "dim_category", "category", None, None),
+            "category_label": Column(None, "dim_category", "label", None, None),
+            "size":           Column(None, "dim_size", "size", None, None),
+            "size_label":     Column(None, "dim_size", "label", None, None),
+        }
+
+        schema = StarSchema("star", self.md, mappings, self.fact, joins=joins)
+
+        subs = schema.master_key_mappings(["category", "amount"])
+        self.assertEqual(list(subs.keys()), ["category"])
+        self.assertColumnEqual(schema.column("category", subs["category"]),
+                               self.fact.columns["category"])
+        tables = schema.required_tables(["category", "amount"], subs)
+        self.assertEqual(len(tables), 1)
+
+        # Snowflake: size key is in the category table
+        subs = schema.master_key_mappings(["size"])
+        tables = schema.required_tables(["size"], subs)
+        self.assertCountEqual([table.key for table in tables],
+                              [(None, "test"), (None, "dim_category")])
+
+        # Other attributes of the detail are required
+        subs = schema.master_key_mappings(["category", "category_label"])
+        self.assertEqual(subs, {})
+
+        # The detail is required as a master of other join
+        subs = schema.master_key_mappings(["category", "size_label"])
+        self.assertEqual(subs, {})
+
+        # Results are the same
+        select = sql.expression.select([schema.column("category"),
+                                        schema.column("amount")],
+                                       from_obj=schema.get_star(["category",
+                                                                 "amount"]))
+        expected = list(self.engine.execute(select))
+        subs = schema.master_key_mappings(["category", "amount"])
+        select = sql.expression.select([schema.column("category",
+                                                      subs["category"]),
+                                        schema.column("amount")],
+                                       from_obj=schema.get_star(["category",
+                                                                 "amount"],
+                                                                subs))
+        self.assertCountEqual(list(self.engine.execute(select)), expected)
+
+    def test_dimension_tables(self):
+        """Test tables of dimension attributes without the fact"""
+        joins = [
+            to_join(("test.category", "dim_category.category")),
+            to_join(("dim_category.size", "dim_size.size")),
+        ]
+
+        mappings = {
+            "amount":         Column(None, "test", "amount", None, None),
+            "category_label": Column(None, "dim_category", "label", None, None),
+            "size_label":     Column(None, "dim_size", "label", None, None),
+        }
+
+        schema = StarSchema("star", self.md, mappings, self.fact, joins=joins)
+
+        tables = schema.dimension_tables(["size_label"])
+        self.assertEqual([table.key for table in tables],
+                         [(None, "dim_size")])
+
+        tables = schema.dimension_tables(["size_label", "category_label"])
+        self.assertEqual([table.key for table in tables],
+                         [(None, "dim_category"), (None, "dim_size")])
+
+        self.assertIsNone(schema.dimension_tables(["amount"]))
+        self.assertIsNone(schema.dimension_tables(["amount", "size_label"]))
+
+        with self.assertRaises(SchemaError):
+            schema.get_dimension_star(["amount"])
+
     def test_detail_twice(self):
         """Test exception when detail is specified twice (loop in graph)"""
         joins = [
@@ -686,5 +768,79 @@ class QueryTestCase(SQLTestCase):
         context = QueryContext(self.schema, self.base_attributes,
                                self.base_deps)
 
+
+class CalendarConditionTestCase(SQLTestCase):
+    """Test conversion of conditions on extracted date units to date
+    ranges."""
+    def setUp(self):
+        self.engine = sa.create_engine(CONNECTION)
+        self.md = sa.MetaData(bind=self.engine)
+        self.fact = create_table(self.engine, self.md, BASE_FACT)
+
+        mappings = {
+            "year":     Column(None, "test", "date", "year", None),
+            "month":    Column(None, "test", "date", "month", None),
+            "day":      Column(None, "test", "date", "day", None),
+            "category": Column(None, "test", "category", None, None),
+        }
+        self.schema = StarSchema("star", self.md, mappings, self.fact)
+        attributes = create_list_of(Attribute, mappings.keys())
+        hierarchies = {
+            ("date", None): ["year", "month", "day"],
+            ("other", None): ["year", "category"],
+        }
+        self.context = QueryContext(self.schema, attributes, hierarchies)
+
+    def categories(self, condition):
+        select = sql.expression.select([self.context.column("category")],
+                                       from_obj=self.context.star,
+                                       whereclause=condition)
+        return sorted(row[0] for row in self.engine.execute(select))
+
+    def test_calendar_range(self):
+        (column, start, end) = self.context.calendar_range(["year", "month"],
+                                                           [2014, "12"])
+        self.assertIs(column, self.fact.columns["date"])
+        self.assertEqual(start, datetime(2014, 12, 1).date())
+        self.assertEqual(end, datetime(2015, 1, 1).date())
+
+        # Not a calendar hierarchy
+        self.assertIsNone(self.context.calendar_range(["year", "category"],
+                                                      [2014, "A"]))
+        # Gap in the units
+        self.assertIsNone(self.context.calendar_range(["year", "day"],
+                                                      [2014, 1]))
+        # Not a date
+        self.assertIsNone(self.context.calendar_range(["year", "month"],
+                                                      [2014, 13]))
+
+    def test_point(self):
+        condition = self.context.condition_for_point("date", [2014, 2])
+        self.assertNotIn("strftime", str(condition).lower())
+        self.assertEqual(self.categories(condition), ["B"])
+
+        condition = self.context.condition_for_point("date", [2014, 2],
+                                                     invert=True)
+        self.assertEqual(self.categories(condition), ["A", "C", "D"])
+
+        condition = self.context.condition_for_point("date", ["2014"])
+        self.assertEqual(self.categories(condition), ["A", "B", "C", "D"])
+
+    def test_set(self):
+        condition = self.context.condition_for_set("date", [[2014, 1],
+                                                            [2014, 3, 1],
+                                                            [2014, 4, 2]])
+        self.assertEqual(self.categories(condition), ["A", "C"])
+
+    def test_range(self):
+        condition = self.context.range_condition("date", None, [2014, 2],
+                                                 [2014, 3])
+        self.assertNotIn("strftime", str(condition).lower())
+        self.assertEqual(self.categories(condition), ["B", "C"])
+
+        condition = self.context.range_condition("date", None, [2014, 3],
+                                                 None)
+        self.assertEqual(self.categories(condition), ["C", "D"])
+
 if __name__ == "__main__":
     unittest.main()
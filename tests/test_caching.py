@@ -0,0 +1,182 @@
+# -*- coding=utf -*-
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from flask import Flask, g, jsonify
+
+from cubes.stores import Store
+from cubes.server.caching import MemoryCache, SQLiteCache, cache_key
+from cubes.server.decorators import conditional_response
+
+
+class CacheKeyTestCase(unittest.TestCase):
+    def test_canonical(self):
+        self.assertEqual(cache_key("aggregate", args={"a": 1, "b": [1, 2]}),
+                         cache_key("aggregate", args={"b": [1, 2], "a": 1}))
+        self.assertNotEqual(cache_key("aggregate", args={"b": [1, 2]}),
+                            cache_key("aggregate", args={"b": [2, 1]}))
+        self.assertNotEqual(cache_key("aggregate", 1),
+                            cache_key("members", 1))
+
+
+class CacheTestCaseMixin(object):
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get("a"))
+
+        self.cache.set("a", {"data": b"abc"})
+        self.assertEqual(self.cache.get("a"), {"data": b"abc"})
+
+        self.cache.rem("a")
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_ttl(self):
+        self.cache.set("a", 1, ttl=0.01)
+        self.cache.set("b", 2)
+        time.sleep(0.02)
+
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get("b"), 2)
+
+    def test_size(self):
+        value = b"x" * 400
+        self.cache.set("a", value)
+        self.cache.set("b", value)
+        # Use "a", so "b" is the least recently used
+        self.cache.get("a")
+        self.cache.set("c", value)
+
+        self.assertEqual(self.cache.get("a"), value)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("c"), value)
+
+        # Too large value is not cached
+        self.cache.set("d", b"x" * 2000)
+        self.assertIsNone(self.cache.get("d"))
+
+
+class MemoryCacheTestCase(CacheTestCaseMixin, unittest.TestCase):
+    def setUp(self):
+        self.cache = MemoryCache(max_size=1000)
+
+    def test_size_accounting(self):
+        self.cache.set("a", b"x" * 400)
+        size = self.cache.size
+        self.assertTrue(size > 400)
+
+        self.cache.set("a", b"x" * 400)
+        self.assertEqual(self.cache.size, size)
+
+        self.cache.clear()
+        self.assertEqual(self.cache.size, 0)
+
+
+class SQLiteCacheTestCase(CacheTestCaseMixin, unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "cache.sqlite")
+        self.cache = SQLiteCache(self.path, max_size=1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_shared(self):
+        self.cache.set("a", 1)
+        other = SQLiteCache(self.path, max_size=1000)
+        self.assertEqual(other.get("a"), 1)
+
+    def test_database_errors(self):
+        self.cache.set("a", 1)
+        connection = sqlite3.connect(self.path)
+        connection.execute("DROP TABLE cache")
+        connection.close()
+
+        # Errors are logged, the cache is only missed
+        with self.assertLogs(level="ERROR"):
+            self.assertIsNone(self.cache.get("a"))
+            self.assertFalse(self.cache.set("a", 1))
+            self.assertFalse(self.cache.rem("a"))
+            self.cache.clear()
+
+
+class Browser(object):
+    def __init__(self, store):
+        self.store = store
+
+
+class ConditionalResponseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "loaded")
+        self.touch(1500000000)
+
+        store = Store(data_version_file=self.path, data_version_interval=0)
+        self.calls = 0
+
+        app = Flask(__name__)
+
+        @app.before_request
+        def prepare():
+            g.browser = Browser(store)
+            g.cell = None
+            g.locale = None
+            g.auth_identity = None
+
+        @app.route("/aggregate")
+        @conditional_response("aggregate")
+        def aggregate():
+            self.calls += 1
+            return jsonify({"summary": 1})
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def touch(self, mtime):
+        with open(self.path, "w"):
+            pass
+        os.utime(self.path, (mtime, mtime))
+
+    def test_etag(self):
+        response = self.client.get("/aggregate?drilldown=date")
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+        self.assertEqual(response.headers["Last-Modified"],
+                         "Fri, 14 Jul 2017 02:40:00 GMT")
+
+        response = self.client.get("/aggregate?drilldown=date",
+                                   headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.calls, 1)
+
+        response = self.client.get("/aggregate?drilldown=item",
+                                   headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+        # Data changed
+        self.touch(1600000000)
+        response = self.client.get("/aggregate?drilldown=date",
+                                   headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(self.calls, 3)
+
+    def test_modified_since(self):
+        since = {"If-Modified-Since": "Fri, 14 Jul 2017 02:40:00 GMT"}
+        response = self.client.get("/aggregate", headers=since)
+        self.assertEqual(response.status_code, 304)
+
+        self.touch(1600000000)
+        response = self.client.get("/aggregate", headers=since)
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_version(self):
+        os.remove(self.path)
+        response = self.client.get("/aggregate")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", response.headers)
@@ -2,7 +2,7 @@ import unittest
 
 from cubes.query import Cell, PointCut, SetCut, RangeCut
 from cubes.query import string_from_path, cut_from_string, path_from_string
-from cubes.query import cut_from_dict
+from cubes.query import cut_from_dict, cuts_from_string
 from cubes.errors import CubesError, ArgumentError
 from cubes.errors import HierarchyError, NoSuchDimensionError
 
@@ -248,6 +248,56 @@ class CellInteractiveSlicingTestCase(CubesTestCaseBase):
         self.assertEqual([2010, 1, 2], cell.cut_for_dimension("date").path)
 
 
+class FingerprintTestCase(CubesTestCaseBase):
+    def setUp(self):
+        super(FingerprintTestCase, self).setUp()
+
+        self.provider = create_provider("model.json")
+        self.cube = self.provider.cube("contracts")
+
+    def cell(self, string):
+        return Cell(self.cube, cuts_from_string(self.cube, string))
+
+    def test_cut_fingerprint(self):
+        self.assertEqual(cut_from_string("date:2015,1").fingerprint(),
+                         PointCut("date", [2015, 1]).fingerprint())
+        self.assertEqual(cut_from_string("date:2015;2014").fingerprint(),
+                         cut_from_string("date:2014;2015;2014").fingerprint())
+        self.assertNotEqual(cut_from_string("date:2015").fingerprint(),
+                            cut_from_string("!date:2015").fingerprint())
+        self.assertNotEqual(cut_from_string("date:2015").fingerprint(),
+                            cut_from_string("date:2015-").fingerprint())
+
+    def test_cut_hash(self):
+        cuts = set([PointCut("date", [2015]),
+                    PointCut("date", [2015]),
+                    SetCut("date", [[2014], [2015]])])
+        self.assertEqual(len(cuts), 2)
+
+    def test_cell_fingerprint(self):
+        first = self.cell("date:2015|cpv:50")
+        second = self.cell("cpv:50|date:2015")
+        self.assertEqual(first, second)
+        self.assertEqual(hash(first), hash(second))
+        self.assertEqual(first.fingerprint(), second.fingerprint())
+
+        self.assertEqual(self.cell("date:2015;2014").fingerprint(),
+                         self.cell("date:2014;2015").fingerprint())
+        self.assertNotEqual(first.fingerprint(),
+                            self.cell("date:2015").fingerprint())
+        self.assertEqual(Cell(self.cube).fingerprint(),
+                         Cell(self.cube, []).fingerprint())
+
+        # Explicit default hierarchy
+        implicit = Cell(self.cube, [PointCut("date", [2015, 1])])
+        explicit = Cell(self.cube, [PointCut("date", [2015, 1],
+                                             hierarchy="default")])
+        self.assertEqual(implicit, explicit)
+        self.assertEqual(implicit.fingerprint(), explicit.fingerprint())
+        self.assertNotEqual(implicit.fingerprint(),
+                            self.cell("date@ym:2015,1").fingerprint())
+
+
 def test_suite():
     suite = unittest.TestSuite()
 
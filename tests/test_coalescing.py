@@ -0,0 +1,128 @@
+# -*- coding=utf -*-
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from cubes.server.coalescing import SingleFlight, SQLiteFlightLock
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.calls = 0
+        self.started = threading.Event()
+        self.proceed = threading.Event()
+
+    def slow(self):
+        self.calls += 1
+        self.started.set()
+        self.proceed.wait(5)
+        if isinstance(self.value, Exception):
+            raise self.value
+        return self.value
+
+    def run_concurrently(self, count):
+        results = []
+        errors = []
+
+        def call():
+            try:
+                results.append(self.flight.do("key", self.slow))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for i in range(count)]
+        threads[0].start()
+        self.started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+
+        # Let the followers join the flight
+        time.sleep(0.05)
+        self.proceed.set()
+
+        for thread in threads:
+            thread.join(5)
+
+        return (results, errors)
+
+    def test_shared_result(self):
+        self.value = [1, 2]
+        (results, errors) = self.run_concurrently(4)
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(errors, [])
+        self.assertEqual(results, [[1, 2]] * 4)
+        self.assertFalse(self.flight.in_flight("key"))
+
+    def test_shared_error(self):
+        self.value = ValueError("failed")
+        (results, errors) = self.run_concurrently(3)
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 3)
+        self.assertTrue(all(e is self.value for e in errors))
+
+    def test_sequential_calls(self):
+        self.value = 1
+        self.proceed.set()
+
+        self.flight.do("key", self.slow)
+        self.flight.do("key", self.slow)
+        self.flight.do("other", self.slow)
+
+        self.assertEqual(self.calls, 3)
+
+
+class SQLiteFlightLockTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "flights.sqlite")
+        self.lock = SQLiteFlightLock(self.path, poll_interval=0.01)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_acquire_release(self):
+        self.assertTrue(self.lock.acquire("a"))
+        self.lock.release("a")
+        self.assertTrue(self.lock.acquire("a"))
+        self.assertTrue(self.lock.acquire("b"))
+
+    def test_wait(self):
+        self.assertTrue(self.lock.acquire("a"))
+
+        acquired = []
+
+        def wait():
+            other = SQLiteFlightLock(self.path, poll_interval=0.01)
+            acquired.append(other.acquire("a"))
+
+        thread = threading.Thread(target=wait)
+        thread.start()
+        time.sleep(0.05)
+        self.assertTrue(thread.is_alive())
+
+        self.lock.release("a")
+        thread.join(5)
+        self.assertEqual(acquired, [False])
+
+    def test_abandoned(self):
+        lock = SQLiteFlightLock(self.path, timeout=0.05, poll_interval=0.01)
+        self.assertTrue(lock.acquire("a"))
+
+        # Another thread gives up waiting, then takes the abandoned lock over
+        acquired = []
+
+        def wait():
+            acquired.append(lock.acquire("a"))
+            acquired.append(lock.acquire("a"))
+
+        thread = threading.Thread(target=wait)
+        thread.start()
+        thread.join(5)
+        self.assertEqual(acquired, [False, True])
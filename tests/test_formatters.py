@@ -0,0 +1,105 @@
+# -*- coding=utf -*-
+import datetime
+import json
+import unittest
+
+from decimal import Decimal
+
+from cubes.formatters import JSONStreamEncoder, SlicerJSONEncoder
+from cubes.formatters import JSONLinesGenerator
+from cubes.query.browser import ResultRow, RowLayout
+
+
+class JSONStreamEncoderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.layout = RowLayout(["date.year", "amount_sum", "last_update"])
+
+    def rows(self, count):
+        for i in range(count):
+            yield ResultRow(self.layout,
+                            (2000 + i, Decimal("%d.5" % i),
+                             datetime.date(2000 + i, 1, 1)))
+
+    def decode(self, chunks):
+        return json.loads("".join(chunks))
+
+    def test_records(self):
+        encoder = JSONStreamEncoder(chunk_size=3)
+        chunks = list(encoder.iterencode(self.rows(7)))
+
+        self.assertEqual(len(chunks), 3)
+        records = self.decode(chunks)
+        self.assertEqual(len(records), 7)
+        self.assertEqual(records[1], {"date.year": 2001,
+                                      "amount_sum": 1.5,
+                                      "last_update": "2001-01-01"})
+
+    def test_envelope(self):
+        obj = {
+            "summary": {"amount_sum": Decimal("10")},
+            "cells": self.rows(5),
+            "total_cell_count": 5,
+        }
+        encoder = JSONStreamEncoder(chunk_size=2)
+        chunks = list(encoder.iterencode(obj))
+
+        # Envelope first, followed by the cells in chunks
+        self.assertIn("summary", chunks[0])
+        self.assertTrue(chunks[0].endswith('"cells": '))
+        self.assertEqual(len(chunks), 5)
+
+        result = self.decode(chunks)
+        self.assertEqual(result["summary"], {"amount_sum": 10.0})
+        self.assertEqual(result["total_cell_count"], 5)
+        self.assertEqual(len(result["cells"]), 5)
+
+        expected = json.loads(SlicerJSONEncoder().encode(
+            {"cells": list(self.rows(5))}
+        ))
+        self.assertEqual(result["cells"], expected["cells"])
+
+    def test_empty(self):
+        encoder = JSONStreamEncoder()
+        self.assertEqual(self.decode(encoder.iterencode(iter([]))), [])
+        self.assertEqual(self.decode(encoder.iterencode({"cells": iter([])})),
+                         {"cells": []})
+        self.assertEqual(self.decode(encoder.iterencode({})), {})
+
+    def test_record_limit(self):
+        encoder = JSONStreamEncoder(record_limit=3)
+
+        self.assertEqual(len(self.decode(encoder.iterencode(self.rows(10)))),
+                         3)
+        # Lists are not limited
+        rows = list(self.rows(10))
+        self.assertEqual(len(self.decode(encoder.iterencode(rows))), 10)
+
+    def test_mixed_records(self):
+        records = [
+            {"a": None, "b": 1},
+            {"a": Decimal("1.5"), "b": 2},
+            {"a": "x", "b": 3},
+            ResultRow(self.layout, (None, None, None)),
+        ]
+        encoder = JSONStreamEncoder()
+        result = self.decode(encoder.iterencode(iter(records)))
+
+        self.assertEqual([record.get("a") for record in result[0:3]],
+                         [None, 1.5, "x"])
+        self.assertEqual(result[3]["amount_sum"], None)
+
+    def test_calculated_values(self):
+        row = next(self.rows(1))
+        row["amount_avg"] = Decimal("2.5")
+        del row["last_update"]
+
+        encoder = JSONStreamEncoder()
+        result = self.decode(encoder.iterencode([row]))
+        self.assertEqual(result, [{"date.year": 2000,
+                                   "amount_sum": 0.5,
+                                   "amount_avg": 2.5}])
+
+    def test_json_lines(self):
+        lines = list(JSONLinesGenerator(self.rows(2)))
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[1])["amount_sum"], 1.5)
@@ -13,6 +13,14 @@ from cubes import compat
 from cubes import Workspace
 
 import csv
+import os
+import shutil
+import tempfile
+import threading
+
+from cubes.query import AggregationResult
+from cubes.server.coalescing import SingleFlight
+from .sql.dw.demo import create_demo_dw
 
 
 TEST_DB_URL = "sqlite:///"
@@ -261,3 +269,96 @@ class SlicerAggregateTestCase(SlicerTestCaseBase):
         header = next(reader)
         self.assertSequenceEqual(["2013", "100", "5"],
                                  header)
+
+
+class BarrierFlight(SingleFlight):
+    """Single flight which lets the calls proceed only when `parties` calls
+    are executed at the same time."""
+    def __init__(self, parties):
+        super(BarrierFlight, self).__init__()
+        self.barrier = threading.Barrier(parties, timeout=5)
+        self.keys = []
+
+    def do(self, key, function):
+        self.keys.append(key)
+
+        def wait_and_call():
+            self.barrier.wait()
+            return function()
+
+        return super(BarrierFlight, self).do(key, wait_and_call)
+
+
+class SlicerCoalescingTestCase(SlicerTestCaseBase):
+    def setUp(self):
+        super(SlicerCoalescingTestCase, self).setUp()
+
+        # Requests are executed in threads, the database has to be shared
+        self.directory = tempfile.mkdtemp()
+        url = "sqlite:///" + os.path.join(self.directory, "dw.sqlite")
+        dw = create_demo_dw(url, None, False)
+
+        workspace = Workspace()
+        workspace.register_default_store("sql", engine=dw.engine,
+                                         metadata=dw.md,
+                                         fact_prefix="fact_",
+                                         dimension_prefix="dim_")
+        workspace.import_model(os.path.join(os.path.dirname(__file__),
+                                            "sql", "dw", "model.json"))
+        self.slicer.cubes_workspace = workspace
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_disabled(self):
+        self.assertIsNone(self.slicer.slicer.coalescer)
+
+    def test_different_locales(self):
+        flight = BarrierFlight(2)
+        self.slicer.slicer.coalescer = flight
+
+        statuses = []
+
+        def request(lang):
+            client = Client(self.slicer, BaseResponse)
+            response = client.get("/cube/sales/aggregate?drilldown=item"
+                                  "&page=0&pagesize=10&lang=%s" % lang)
+            statuses.append(response.status_code)
+
+        threads = [threading.Thread(target=request, args=(lang, ))
+                   for lang in ["en", "sk"]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        # Both requests executed the aggregation, none of them waited for
+        # the other one
+        self.assertEqual(statuses, [200, 200])
+        self.assertEqual(len(set(flight.keys)), 2)
+
+    def test_streamed_drilldown(self):
+        flight = BarrierFlight(1)
+        self.slicer.slicer.coalescer = flight
+
+        cached = []
+        original = AggregationResult.cached
+
+        def record_cached(result):
+            cached.append(result)
+            return original(result)
+
+        AggregationResult.cached = record_cached
+        try:
+            (result, status) = self.get("cube/sales/aggregate?drilldown=item")
+            self.assertEqual(status, 200)
+
+            # Cells are streamed, not fetched into memory and shared
+            self.assertEqual(flight.keys, [])
+            self.assertEqual(cached, [])
+
+            self.get("cube/sales/aggregate?drilldown=item&page=0&pagesize=2")
+            self.assertEqual(len(flight.keys), 1)
+            self.assertNotEqual(cached, [])
+        finally:
+            AggregationResult.cached = original
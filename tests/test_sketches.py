@@ -0,0 +1,44 @@
+# -*- coding=utf -*-
+import unittest
+
+from cubes.errors import ArgumentError
+from cubes.query import HyperLogLog
+
+
+class HyperLogLogTestCase(unittest.TestCase):
+    def test_small_count(self):
+        sketch = HyperLogLog()
+        sketch.update([1, 2, 3, 3, "a", 2.5])
+        self.assertEqual(sketch.count(), 5)
+        self.assertEqual(HyperLogLog().count(), 0)
+
+    def test_error(self):
+        sketch = HyperLogLog()
+        sketch.update(range(100000))
+        self.assertAlmostEqual(sketch.count() / 100000.0, 1, delta=0.05)
+
+    def test_merge(self):
+        first = HyperLogLog()
+        first.update(range(0, 6000))
+        second = HyperLogLog()
+        second.update(range(4000, 10000))
+
+        union = HyperLogLog()
+        union.update(range(0, 10000))
+
+        first.merge(second)
+        self.assertEqual(first.count(), union.count())
+
+        with self.assertRaises(ArgumentError):
+            first.merge(HyperLogLog(10))
+
+    def test_serialization(self):
+        sketch = HyperLogLog(10)
+        sketch.update(range(1000))
+
+        restored = HyperLogLog.from_bytes(sketch.to_bytes())
+        self.assertEqual(restored.precision, 10)
+        self.assertEqual(restored.count(), sketch.count())
+
+        with self.assertRaises(ArgumentError):
+            HyperLogLog(20)
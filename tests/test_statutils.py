@@ -0,0 +1,99 @@
+# -*- coding=utf -*-
+import math
+import random
+import unittest
+
+from cubes.errors import ArgumentError
+from cubes.query import statutils
+from cubes.query.statutils import moving_window_values
+
+
+def windows(values, size):
+    """Returns list of windows of `size` ending at each of the `values`."""
+    return [values[max(0, i - size + 1):i + 1] for i in range(len(values))]
+
+
+class MovingWindowTestCase(unittest.TestCase):
+    values = [4, 8, 15, 16, 23, 42, 8, 4]
+
+    def assertColumn(self, function, expected, values=None, size=3):
+        values = values if values is not None else self.values
+        result = moving_window_values(function, values, size)
+
+        self.assertEqual(len(result), len(expected))
+        for value, other in zip(result, expected):
+            self.assertAlmostEqual(value, other, places=2)
+
+    def test_sum_and_average(self):
+        sums = [sum(window) for window in windows(self.values, 3)]
+        self.assertColumn("sms", sums)
+        self.assertColumn("sma", [round(float(sum(window)) / len(window), 2)
+                                  for window in windows(self.values, 3)])
+
+    def test_weighted_average(self):
+        expected = []
+        for window in windows(self.values, 3):
+            weighted = sum((i + 1) * value for i, value in enumerate(window))
+            n = len(window)
+            expected.append(weighted / (n * (n + 1) / 2.0))
+
+        self.assertColumn("wma", expected)
+
+    def test_variance(self):
+        expected = []
+        for window in windows(self.values, 4):
+            n = len(window)
+            mean = float(sum(window)) / n
+            if n < 2:
+                expected.append(0)
+            else:
+                expected.append(sum((value - mean) ** 2 for value in window)
+                                / (n - 1))
+
+        self.assertColumn("smvar", expected, size=4)
+        self.assertColumn("smstd", [value ** 0.5 for value in expected],
+                          size=4)
+
+    def test_running_state(self):
+        """Incremental and array computation give the same results"""
+        numpy = statutils.numpy
+        statutils.numpy = None
+        try:
+            expected = {name: moving_window_values(name, self.values, 3)
+                        for name in ["sma", "sms", "wma", "smvar", "smrsd"]}
+        finally:
+            statutils.numpy = numpy
+
+        for name, values in expected.items():
+            self.assertColumn(name, values)
+
+    def test_long_float_series(self):
+        """Rounding errors do not accumulate over long series"""
+        generator = random.Random(1)
+        values = [generator.uniform(0, 1) * 10 ** generator.randint(-3, 8)
+                  for i in range(20000)]
+        # Rounding errors of large values remain in running sums
+        values += [1e15 if i % 100 == 0 else generator.uniform(0, 0.1)
+                   for i in range(20000)]
+        sums = [math.fsum(window) for window in windows(values, 3)]
+
+        numpy = statutils.numpy
+        for module in [numpy, None]:
+            statutils.numpy = module
+            try:
+                result = moving_window_values("sms", values, 3)
+            finally:
+                statutils.numpy = numpy
+
+            for value, expected in zip(result, sums):
+                self.assertAlmostEqual(value, expected, places=6)
+
+    def test_missing_values(self):
+        values = [None, 2, None, 4, 6]
+        self.assertColumn("sms", [None, 2, 2, 6, 10], values=values, size=2)
+
+    def test_unknown(self):
+        with self.assertRaises(ArgumentError):
+            moving_window_values("unknown", self.values, 3)
+        with self.assertRaises(ArgumentError):
+            moving_window_values("sma", self.values, 0)